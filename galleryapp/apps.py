@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class GalleryappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'galleryapp'
+
+    def ready(self):
+        from . import signals  # noqa: F401  注册信号处理函数
+        from django.db.backends.signals import connection_created
+        from .tools.metrics import install_query_recorder
+        connection_created.connect(install_query_recorder, dispatch_uid='galleryapp_query_recorder')
@@ -0,0 +1,164 @@
+import calendar
+import logging
+from django.contrib.auth import get_user_model
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .models import Image
+from .serializers import ImageSerializer, ImageDetailSerializer
+from .tools.conditional import aget_library_version, make_etag, version_to_datetime
+from .tools.pagination import CustomPagination, KeysetPagination
+from .tools.share_cache import aget_share_payload, check_share_password
+from .views import UserImageListView, get_serializer_context
+
+logger = logging.getLogger(__name__)
+
+# 异步版本的只读接口，部署在 ASGI 服务器（uvicorn、daphne）下时，慢客户端不会占用线程。
+# DRF 不支持异步视图，这里使用 Django 原生异步视图，返回格式与同步接口一致。
+
+
+async def aauthenticate(request):
+    """JWT 认证：令牌校验是纯计算，用户通过异步 ORM 查询。没有令牌时返回 None"""
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    validated_token = authentication.get_validated_token(raw_token)
+    try:
+        user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken('令牌中没有可识别的用户。')
+    user = await get_user_model().objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}).afirst()
+    if user is None or not user.is_active:
+        raise InvalidToken('用户不存在或已被禁用。')
+    return user
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False,
+                        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+
+def conditional_response(request, etag, version):
+    """If-None-Match / If-Modified-Since 命中时返回 304，否则返回 None"""
+    last_modified = calendar.timegm(version_to_datetime(version).utctimetuple())
+    response = get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+    if isinstance(response, HttpResponseNotModified):
+        response['ETag'] = quote_etag(etag)
+    return response
+
+
+def set_conditional_headers(response, etag, version):
+    response['ETag'] = quote_etag(etag)
+    response['Last-Modified'] = http_date(version_to_datetime(version).timestamp())
+    return response
+
+
+class AsyncAPIView(View):
+    """异步视图基类：JWT 认证，DRF 异常转换为 JSON 响应"""
+    authentication_required = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            user = await aauthenticate(request)
+        except AuthenticationFailed as e:
+            return json_response(e.detail if isinstance(e.detail, dict) else {'detail': e.detail}, status=401)
+        if user is None and self.authentication_required:
+            return json_response({'detail': '身份认证信息未提供。'}, status=401)
+        # 包装为 DRF Request，复用同步视图中基于 query_params 的过滤逻辑
+        self.drf_request = Request(request, authenticators=())
+        if user is not None:
+            self.drf_request.user = user
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as e:
+            return json_response({'detail': e.detail}, status=e.status_code)
+
+
+# 获取图片列表（异步）
+class AsyncUserImageListView(AsyncAPIView):
+
+    async def get(self, request):
+        user = self.drf_request.user
+        version = await aget_library_version(user.id)
+        etag = make_etag(user.id, version, request.get_full_path())
+        not_modified = conditional_response(request, etag, version)
+        if not_modified is not None:
+            return not_modified
+
+        # 查询条件与同步接口相同，构造 queryset 不访问数据库
+        images = UserImageListView().get_queryset(self.drf_request)
+        if KeysetPagination.is_requested(self.drf_request):
+            paginator = KeysetPagination()
+            page = await paginator.apaginate_queryset(images, self.drf_request)
+            data = ImageSerializer(page, many=True, context=get_serializer_context(self.drf_request)).data
+            data = paginator.get_paginated_data(data, await paginator.aget_count())
+        else:
+            paginator = CustomPagination()
+            page = await paginator.apaginate_queryset(images, self.drf_request)
+            data = ImageSerializer(page, many=True, context=get_serializer_context(self.drf_request)).data
+            data = paginator.get_paginated_data(data)
+
+        response = set_conditional_headers(json_response(data), etag, version)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+# 获取图片详情（异步）
+class AsyncImageDetailView(AsyncAPIView):
+
+    async def get(self, request, image_id):
+        user = self.drf_request.user
+        version = await aget_library_version(user.id)
+        etag = make_etag(user.id, version, request.get_full_path())
+        not_modified = conditional_response(request, etag, version)
+        if not_modified is not None:
+            return not_modified
+
+        image = await Image.objects.prefetch_related('tags').filter(id=image_id, uploaded_by=user).afirst()
+        if image is None:
+            return json_response({"detail": "图片未找到或者您没有权限"}, status=404)
+        response = set_conditional_headers(json_response(ImageDetailSerializer(image).data), etag, version)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+# 通过分享链接访问图片（异步）
+class AsyncAccessShareLinkView(AsyncAPIView):
+    authentication_required = False
+
+    async def get(self, request, share_code):
+        share_link = await aget_share_payload(share_code)
+        if share_link is None:
+            return json_response({'detail': 'Invalid share code.'}, status=404)
+        if timezone.now() > share_link['expire_time']:
+            return json_response({'detail': 'This share link has expired.'}, status=403)
+        if not check_share_password(share_link, request.GET.get('password', '')):
+            return json_response({'detail': 'Incorrect password.'}, status=403)
+
+        etag = make_etag(share_code, share_link['version'], request.get_full_path())
+        not_modified = conditional_response(request, etag, share_link['version'])
+        if not_modified is not None:
+            return not_modified
+
+        images = share_link['images']
+        if not get_serializer_context(self.drf_request)['embed_tags']:
+            images = [{key: value for key, value in image.items() if key != 'tag_details'} for image in images]
+        response = json_response({
+            'share_code': share_code,
+            'images': images,
+            'expire_time': share_link['expire_time'],
+            'is_protected': share_link['is_protected'],
+        })
+        response = set_conditional_headers(response, etag, share_link['version'])
+        patch_cache_control(response, no_cache=True)
+        return response
@@ -0,0 +1,31 @@
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from .tools.metrics import record_cache_lookup
+
+_MISSING = object()
+
+
+class MetricsCacheMixin:
+    """统计当前请求的缓存命中和未命中次数（get_or_set、aget 等最终都调用 get）"""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            record_cache_lookup(0, 1)
+            return default
+        record_cache_lookup(1, 0)
+        return value
+
+
+class InstrumentedLocMemCache(MetricsCacheMixin, LocMemCache):
+    pass
+
+
+class InstrumentedRedisCache(MetricsCacheMixin, RedisCache):
+
+    def get_many(self, keys, version=None):
+        # RedisCache 的 get_many 是一次 MGET，不经过 get
+        keys = list(keys)
+        values = super().get_many(keys, version)
+        record_cache_lookup(len(values), len(keys) - len(values))
+        return values
@@ -0,0 +1,63 @@
+import multiprocessing
+import os
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from galleryapp.models import Image
+from galleryapp.tools.conditional import bump_library_version
+from galleryapp.tools.exif import METADATA_FIELDS, init_worker, read_file_metadata
+from galleryapp.tools.share_cache import invalidate_shares_for_images
+
+
+class Command(BaseCommand):
+    help = '用多个进程并发提取已有图片的尺寸、格式和 EXIF 元数据（相同文件只读取一次）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='重新提取所有图片（默认只处理缺少元数据的）')
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='进程数')
+        parser.add_argument('--batch-size', type=int, default=500, help='每批写入数据库的文件数')
+
+    def handle(self, *args, **options):
+        images = Image._base_manager.exclude(file='')
+        if not options['all']:
+            images = images.filter(width__isnull=True)
+        names = list(images.order_by('file').values_list('file', flat=True).distinct())
+        self.stdout.write(f'需要处理 {len(names)} 个文件')
+        if not names:
+            return
+
+        # 子进程不能共用父进程的数据库连接，读取文件也不需要数据库
+        connections.close_all()
+        done = failed = 0
+        batch = {}
+        with multiprocessing.Pool(options['processes'], initializer=init_worker) as pool:
+            for name, metadata, error in pool.imap_unordered(read_file_metadata, names, chunksize=16):
+                if error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                    continue
+                batch[name] = metadata
+                if len(batch) >= options['batch_size']:
+                    done += self.save_batch(batch, options['all'])
+                    batch = {}
+                    self.stdout.write(f'已处理 {done + failed}/{len(names)}')
+        done += self.save_batch(batch, options['all'])
+        self.stdout.write(self.style.SUCCESS(f'完成: 成功 {done} 个文件，失败 {failed} 个'))
+
+    def save_batch(self, batch, update_all):
+        """把一批文件的元数据写入引用这些文件的所有图片"""
+        if not batch:
+            return 0
+        images = Image._base_manager.filter(file__in=list(batch)).only('id', 'file', 'uploaded_by')
+        if not update_all:
+            images = images.filter(width__isnull=True)
+        images = list(images)
+        for image in images:
+            for field, value in batch[image.file.name].items():
+                setattr(image, field, value)
+        with transaction.atomic():
+            Image._base_manager.bulk_update(images, METADATA_FIELDS, batch_size=500)
+        # bulk_update 不触发信号，手动清除分享缓存并更新图库版本
+        invalidate_shares_for_images([image.id for image in images])
+        for user_id in {image.uploaded_by_id for image in images}:
+            bump_library_version(user_id)
+        return len(batch)
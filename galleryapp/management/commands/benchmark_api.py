@@ -0,0 +1,193 @@
+import io
+import itertools
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image as PILImage
+from rest_framework_simplejwt.tokens import AccessToken
+from galleryapp.models import Image, ShareLink
+from galleryapp.tools.dedup import release_image_files
+from galleryapp.tools.loadgen import summarize
+from users.models import CustomUser
+from .seed_benchmark_data import BENCHMARK_PASSWORD, TITLE_WORDS
+
+ENDPOINTS = ['images', 'images_cursor', 'images_search', 'share', 'upload', 'captcha', 'captcha_png', 'login']
+
+
+class Command(BaseCommand):
+    help = (
+        '在进程内用多线程并发请求各接口（完整经过中间件、路由和视图），'
+        '输出每个接口的吞吐量、p50/p95/p99 延迟和 SQL 数量（JSON）。需先运行 seed_benchmark_data。'
+        'SQLite 并发写入时会出现 database is locked，压测上传接口建议使用 MySQL 或 --concurrency 1'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', nargs='+', default=ENDPOINTS, choices=ENDPOINTS)
+        parser.add_argument('--concurrency', type=int, default=8, help='并发线程数')
+        parser.add_argument('--requests', type=int, default=200, help='每个接口的请求数')
+        parser.add_argument('--warmup', type=int, default=10, help='每个接口正式计时前的预热请求数')
+        parser.add_argument('--prefix', default='bench', help='压测用户名前缀，与 seed_benchmark_data 一致')
+        parser.add_argument('--password', default=BENCHMARK_PASSWORD)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--output', help='结果写入的文件，默认输出到标准输出')
+
+    def handle(self, *args, **options):
+        users = list(CustomUser.objects.filter(username__startswith=f"{options['prefix']}_"))
+        if not users:
+            raise CommandError('没有压测数据，请先运行 seed_benchmark_data')
+        self.options = options
+        self.users = users
+        self.tokens = {user.id: f'Bearer {AccessToken.for_user(user)}' for user in users}
+        self.share_codes = list(ShareLink.objects.filter(share_code__startswith=f"{options['prefix']}-")
+                                .values_list('share_code', flat=True))
+        self.uploaded_ids = []
+        self.lock = threading.Lock()
+
+        results = {
+            'database': connection.vendor,
+            'concurrency': options['concurrency'],
+            'requests_per_endpoint': options['requests'],
+            'dataset': {
+                'users': len(users),
+                'images': Image.objects.filter(uploaded_by__in=users).count(),
+                'share_links': len(self.share_codes),
+            },
+            'endpoints': {},
+        }
+        media_root = tempfile.mkdtemp()
+        # 上传的文件写到临时目录，压测结束后连同数据库记录一起删除
+        with override_settings(MEDIA_ROOT=media_root):
+            try:
+                for endpoint in options['endpoints']:
+                    self.stderr.write(f'{endpoint} ...')
+                    request = getattr(self, f'request_{endpoint}')
+                    self.run(request, options['warmup'])
+                    results['endpoints'][endpoint] = self.run(request, options['requests'])
+            finally:
+                self.cleanup_uploads()
+                shutil.rmtree(media_root, ignore_errors=True)
+
+        output = json.dumps(results, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def run(self, request, total):
+        """concurrency 个线程共同完成 total 个请求，每个线程使用独立的 Client 和数据库连接"""
+        latencies, query_counts, statuses = [], [], {}
+        errors = 0
+        counter = itertools.count()
+
+        def worker():
+            nonlocal errors
+            client = Client(HTTP_HOST='localhost', raise_request_exception=False)
+            rng = random.Random()
+            try:
+                while next(counter) < total:
+                    prepared = request(client, rng)  # 准备阶段（如获取验证码）不计时
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        try:
+                            response = prepared()
+                        except Exception:
+                            response = None
+                        elapsed = time.perf_counter() - start
+                    with self.lock:
+                        if response is None or response.status_code >= 400:
+                            errors += 1
+                        if response is not None:
+                            latencies.append(elapsed)
+                            query_counts.append(len(queries))
+                            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.options['concurrency'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        result = summarize(latencies, errors, time.perf_counter() - started, statuses)
+        result['queries_per_request'] = {
+            'mean': round(sum(query_counts) / len(query_counts), 2) if query_counts else None,
+            'max': max(query_counts, default=None),
+        }
+        return result
+
+    # 以下方法返回一个执行单次请求的函数
+
+    def auth(self, rng):
+        return {'HTTP_AUTHORIZATION': self.tokens[rng.choice(self.users).id]}
+
+    def request_images(self, client, rng):
+        headers = self.auth(rng)
+        return lambda: client.get(f"/api/images/?page_size={self.options['page_size']}", **headers)
+
+    def request_images_cursor(self, client, rng):
+        headers = self.auth(rng)
+        return lambda: client.get(f"/api/images/?pagination=cursor&page_size={self.options['page_size']}",
+                                  **headers)
+
+    def request_images_search(self, client, rng):
+        headers = self.auth(rng)
+        keyword = rng.choice(TITLE_WORDS)
+        return lambda: client.get(f"/api/images/?keyword={keyword}&page_size={self.options['page_size']}",
+                                  **headers)
+
+    def request_share(self, client, rng):
+        if not self.share_codes:
+            raise CommandError('没有压测用的分享链接')
+        share_code = rng.choice(self.share_codes)
+        return lambda: client.get(f'/api/share/{share_code}/')
+
+    def request_upload(self, client, rng):
+        headers = self.auth(rng)
+        # 每次生成内容不同的图片，避免全部命中去重
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (64, 64), tuple(rng.randrange(256) for _ in range(3))).save(buffer, 'JPEG')
+        buffer.seek(0)
+        buffer.name = 'benchmark.jpg'
+
+        def upload():
+            response = client.post('/api/images/upload/', {'file': buffer, 'title': 'benchmark upload'}, **headers)
+            if response.status_code == 201:
+                with self.lock:
+                    self.uploaded_ids.extend(image['id'] for image in response.json()['uploaded_images'])
+            return response
+        return upload
+
+    def request_captcha(self, client, rng):
+        return lambda: client.get('/api/users/captcha/')
+
+    def request_captcha_png(self, client, rng):
+        return lambda: client.get('/api/users/captcha/', {'format': 'png'})
+
+    def request_login(self, client, rng):
+        captcha_key = client.get('/api/users/captcha/').json()['captcha_key']
+        data = {
+            'username': rng.choice(self.users).username,
+            'password': self.options['password'],
+            'captcha_key': captcha_key,
+            'captcha': cache.get(captcha_key),  # 进程内压测，直接从缓存读取验证码
+        }
+        return lambda: client.post('/api/users/login/', data, content_type='application/json')
+
+    def cleanup_uploads(self):
+        if not self.uploaded_ids:
+            return
+        images = Image.objects.filter(id__in=self.uploaded_ids)
+        files = list(images.values('file', 'content_hash', 'thumbnail', 'preview'))
+        images.delete()
+        release_image_files(files)
+        self.stderr.write(f'已删除压测上传的 {len(self.uploaded_ids)} 张图片')
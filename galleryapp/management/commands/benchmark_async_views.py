@@ -0,0 +1,66 @@
+import asyncio
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from rest_framework_simplejwt.tokens import RefreshToken
+from galleryapp.models import Image, ShareLink
+from galleryapp.tools.loadgen import run_load
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        '对比同步接口（WSGI）和异步接口（ASGI）在高并发下的吞吐量和延迟，输出 JSON。'
+        '需先分别启动两个服务，例如 gunicorn sugallery.wsgi -w 4 --threads 8 -b :8000 '
+        '和 uvicorn sugallery.asgi:application --workers 4 --port 8001'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', default='http://127.0.0.1:8000', help='WSGI 服务地址')
+        parser.add_argument('--asgi-url', default='http://127.0.0.1:8001', help='ASGI 服务地址')
+        parser.add_argument('--user', help='用于生成访问令牌的用户名，默认为图片最多的用户')
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--duration', type=float, default=10.0, help='每个接口压测的秒数')
+        parser.add_argument('--endpoints', nargs='+', default=['images', 'detail', 'share'],
+                            choices=['images', 'detail', 'share'])
+        parser.add_argument('--output', help='结果写入的文件，默认输出到标准输出')
+
+    def get_user(self, username):
+        if username:
+            user = CustomUser.objects.filter(username=username).first()
+        else:
+            user = CustomUser.objects.annotate(image_count=Count('image')).order_by('-image_count').first()
+        if user is None:
+            raise CommandError('没有可用于压测的用户，请先上传图片')
+        return user
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        image = Image.objects.filter(uploaded_by=user).order_by('-created_at').first()
+        share_link = ShareLink.objects.filter(images__uploaded_by=user).first()
+        paths = {
+            'images': '/api/{prefix}images/?page_size=20',
+            'detail': f'/api/{{prefix}}images/{image.id}/' if image else None,
+            'share': f'/api/{{prefix}}share/{share_link.share_code}/' if share_link else None,
+        }
+        # 不带条件请求头，每次都完整执行查询和序列化
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+        results = {'concurrency': options['concurrency'], 'duration_seconds': options['duration'], 'endpoints': {}}
+        for endpoint in options['endpoints']:
+            if paths[endpoint] is None:
+                self.stderr.write(f'跳过 {endpoint}：没有可用的数据')
+                continue
+            results['endpoints'][endpoint] = {}
+            for mode, base_url, prefix in (('wsgi', options['wsgi_url'], ''), ('asgi', options['asgi_url'], 'async/')):
+                url = base_url.rstrip('/') + paths[endpoint].format(prefix=prefix)
+                self.stderr.write(f'{mode} {url} ...')
+                results['endpoints'][endpoint][mode] = asyncio.run(
+                    run_load(url, options['concurrency'], options['duration'], headers))
+
+        output = json.dumps(results, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
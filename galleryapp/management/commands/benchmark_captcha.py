@@ -0,0 +1,104 @@
+import base64
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from galleryapp.tools.captcha import RENDERERS, CaptchaPool, get_renderer
+from galleryapp.tools.loadgen import summarize
+
+
+def render_many(name, count):
+    """在子进程中连续渲染 count 个验证码，返回耗时（秒）"""
+    renderer = get_renderer(name)
+    formats = tuple(settings.CAPTCHA_IMAGE_FORMATS)
+    renderer.render(formats)  # 预热：加载字体
+    start = time.perf_counter()
+    for _ in range(count):
+        renderer.render(formats)
+    return time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = (
+        '测量各验证码渲染器每核每秒生成的验证码数量，以及验证码接口的取出路径：'
+        '从预渲染池取出 + 写缓存 与 现场渲染 + 写缓存 的单次耗时，输出 JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--renderers', nargs='+', default=list(RENDERERS), choices=list(RENDERERS))
+        parser.add_argument('--count', type=int, default=500, help='每项测试生成的验证码数量')
+        parser.add_argument('--processes', type=int, default=1, help='大于 1 时额外测量多进程的总吞吐量')
+        parser.add_argument('--output', help='结果写入的文件，默认输出到标准输出')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        formats = tuple(dict.fromkeys(['png', *settings.CAPTCHA_IMAGE_FORMATS]))
+        results = {'cpu_count': os.cpu_count(), 'count': count, 'difficulty': settings.CAPTCHA_DIFFICULTY,
+                   'formats': list(formats), 'quantize_colors': settings.CAPTCHA_QUANTIZE_COLORS,
+                   'renderers': {}, 'serve': {}}
+        for name in options['renderers']:
+            renderer = get_renderer(name)
+            renderer.render(formats)
+            sizes = {image_format: 0 for image_format in formats}
+            start = time.perf_counter()
+            for _ in range(count):
+                for image_format, image in renderer.render(formats)[1].items():
+                    sizes[image_format] += len(image)
+            elapsed = time.perf_counter() - start
+            result = {
+                # 每个验证码的耗时包含编码所有格式
+                'captchas_per_second_per_core': round(count / elapsed, 1),
+                'ms_per_captcha': round(elapsed / count * 1000, 3),
+                'bytes_mean': {image_format: round(size / count) for image_format, size in sizes.items()},
+            }
+            if options['processes'] > 1:
+                result['multiprocess'] = self.measure_processes(name, count, options['processes'])
+            results['renderers'][name] = result
+
+            # 接口中的取出路径：池在计时前已填满，refill_at=-1 使后台线程不再补充
+            pool = CaptchaPool(count, -1)
+            with override_settings(CAPTCHA_RENDERER=name):
+                pool.fill()
+            results['serve'][name] = {
+                'pool': self.measure_serve(pool.get, count),
+                'direct': self.measure_serve(lambda: renderer.render(formats), count),
+            }
+
+        output = json.dumps(results, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def measure_processes(self, name, count, processes):
+        per_process = max(count // processes, 1)
+        with ProcessPoolExecutor(processes) as executor:
+            executor.submit(render_many, name, 1).result()  # 启动进程
+            start = time.perf_counter()
+            list(executor.map(render_many, [name] * processes, [per_process] * processes))
+            elapsed = time.perf_counter() - start
+        total = per_process * processes
+        return {
+            'processes': processes,
+            'captchas_per_second': round(total / elapsed, 1),
+            'captchas_per_second_per_core': round(total / elapsed / min(processes, os.cpu_count() or 1), 1),
+        }
+
+    def measure_serve(self, get, count):
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(count):
+            start = time.perf_counter()
+            code, images = get()
+            cache.set(f'benchmark-captcha:{uuid.uuid4()}', code, timeout=settings.CAPTCHA_TIMEOUT)
+            base64.b64encode(images['png'])
+            latencies.append(time.perf_counter() - start)
+        result = summarize(latencies, 0, time.perf_counter() - started)
+        del result['status_codes']
+        return result
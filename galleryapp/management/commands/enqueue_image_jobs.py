@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from galleryapp.models import Image
+from galleryapp.tools.jobs import JOB_HANDLERS, enqueue_image_jobs
+
+# 各任务类型对应的“尚未处理”条件
+MISSING_FILTERS = {
+    'renditions': Q(thumbnail='') | Q(thumbnail__isnull=True),
+    'phash': Q(phash__isnull=True),
+    'metadata': Q(width__isnull=True),
+}
+
+
+class Command(BaseCommand):
+    help = '为已有图片批量创建后台任务，由 run_image_worker 执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('job_types', nargs='+', help=f"任务类型: {', '.join(JOB_HANDLERS)}")
+        parser.add_argument('--all', action='store_true', help='为所有图片创建任务（默认只处理缺失结果的图片）')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        for job_type in options['job_types']:
+            if job_type not in JOB_HANDLERS:
+                raise CommandError(f'未知的任务类型: {job_type}')
+
+            images = Image.objects.order_by('id')
+            if not options['all'] and job_type in MISSING_FILTERS:
+                images = images.filter(MISSING_FILTERS[job_type])
+
+            total = 0
+            batch = []
+            for image in images.only('id', 'uploaded_by').iterator(chunk_size=options['batch_size']):
+                batch.append(image)
+                if len(batch) >= options['batch_size']:
+                    enqueue_image_jobs(batch, [job_type])
+                    total += len(batch)
+                    batch = []
+            if batch:
+                enqueue_image_jobs(batch, [job_type])
+                total += len(batch)
+            self.stdout.write(self.style.SUCCESS(f'{job_type}: 已创建 {total} 个任务'))
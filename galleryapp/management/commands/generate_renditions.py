@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from galleryapp.models import Image
+from galleryapp.tools.renditions import generate_renditions
+
+
+class Command(BaseCommand):
+    help = '为已有图片生成缩略图和预览图'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='重新生成所有图片的衍生图（默认只处理缺失的）')
+        parser.add_argument('--batch-size', type=int, default=200, help='每批从数据库读取的图片数量')
+
+    def handle(self, *args, **options):
+        images = Image.objects.order_by('id')
+        if not options['all']:
+            images = images.filter(Q(thumbnail='') | Q(thumbnail__isnull=True) |
+                                   Q(preview='') | Q(preview__isnull=True))
+
+        done = failed = 0
+        for image in images.iterator(chunk_size=options['batch_size']):
+            try:
+                generate_renditions(image)
+                done += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'图片 {image.id} 生成失败: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'完成: 成功 {done} 张，失败 {failed} 张'))
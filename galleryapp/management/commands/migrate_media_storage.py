@@ -0,0 +1,105 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, storages
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, Value, When
+from galleryapp.models import Image, ImageBlob
+from users.models import CustomUser
+
+# 保存了存储文件名的字段
+MEDIA_FIELDS = [
+    (Image, 'file'),
+    (Image, 'thumbnail'),
+    (Image, 'preview'),
+    (ImageBlob, 'file'),
+    (CustomUser, 'avatar'),
+]
+
+
+class Command(BaseCommand):
+    help = '把 MEDIA_ROOT 下的已有文件并发迁移到目标存储（默认为 STORAGES["default"]），并更新数据库中的文件名'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--storage', default='default', help='目标存储，STORAGES 中的名称')
+        parser.add_argument('--source-root', default=None, help='源文件目录，默认为 MEDIA_ROOT')
+        parser.add_argument('--workers', type=int, default=8, help='并发传输的线程数')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--keep-source', action='store_true', help='迁移到其他存储后保留源文件')
+        parser.add_argument('--dry-run', action='store_true', help='只统计需要迁移的文件')
+
+    def handle(self, *args, **options):
+        try:
+            target = storages[options['storage']]
+        except Exception as e:
+            raise CommandError(f"无法加载存储 {options['storage']}: {e}")
+        source = FileSystemStorage(location=options['source_root'] or settings.MEDIA_ROOT)
+        # 源和目标是同一目录时直接移动文件，不复制
+        same_root = (isinstance(target, FileSystemStorage)
+                     and os.path.abspath(target.location) == os.path.abspath(source.location))
+
+        names = self.collect_names()
+        moves = {name: target.generate_filename(name) for name in names}
+        moves = {old: new for old, new in moves.items() if old != new or not same_root}
+        self.stdout.write(f'共 {len(names)} 个文件，需要迁移 {len(moves)} 个')
+        if options['dry_run'] or not moves:
+            return
+
+        items = list(moves.items())
+        migrated = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for start in range(0, len(items), options['batch_size']):
+                batch = items[start:start + options['batch_size']]
+                done = {}
+                for old, new, error in executor.map(lambda item: self.transfer(source, target, same_root, *item),
+                                                    batch):
+                    if error:
+                        failed += 1
+                        self.stderr.write(f'{old}: {error}')
+                    else:
+                        done[old] = new
+                # 每批文件传输完成后立即更新数据库，中断后重新执行会跳过已迁移的文件
+                self.update_names(done)
+                if not same_root and not options['keep_source']:
+                    for name in done:
+                        source.delete(name)
+                migrated += len(done)
+                self.stdout.write(f'已迁移 {migrated}/{len(items)}')
+
+        self.stdout.write(self.style.SUCCESS(f'迁移完成：成功 {migrated} 个，失败 {failed} 个'))
+
+    def collect_names(self):
+        names = set()
+        for model, field in MEDIA_FIELDS:
+            names.update(model._base_manager.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                         .values_list(field, flat=True).distinct().iterator())
+        return sorted(names)
+
+    def transfer(self, source, target, same_root, old, new):
+        try:
+            if same_root:
+                if not source.exists(old) and target.exists(new):
+                    return old, new, None  # 上次迁移时已移动，但数据库未更新
+                os.makedirs(os.path.dirname(target.path(new)), exist_ok=True)
+                file_move_safe(source.path(old), target.path(new), allow_overwrite=False)
+            elif not target.exists(new):
+                with source.open(old, 'rb') as f:
+                    saved = target.save(new, File(f, name=new))
+                if saved != new:
+                    return old, saved, None
+            return old, new, None
+        except FileNotFoundError:
+            return old, new, '源文件不存在'
+        except Exception as e:
+            return old, new, e
+
+    @transaction.atomic
+    def update_names(self, moves):
+        if not moves:
+            return
+        for model, field in MEDIA_FIELDS:
+            rename = Case(*[When(**{field: old}, then=Value(new)) for old, new in moves.items()])
+            model._base_manager.filter(**{f'{field}__in': list(moves)}).update(**{field: rename})
@@ -0,0 +1,18 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from galleryapp.models import RequestProfile
+
+
+class Command(BaseCommand):
+    help = '删除早于保留天数的剖析记录（可配合 cron 定期运行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.PROFILING_RETENTION_DAYS,
+                            help='保留天数，默认 PROFILING_RETENTION_DAYS')
+
+    def handle(self, *args, **options):
+        deadline = timezone.now() - timedelta(days=options['days'])
+        count, _ = RequestProfile.objects.filter(created_at__lt=deadline).delete()
+        self.stdout.write(self.style.SUCCESS(f'已删除 {count} 条剖析记录'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from galleryapp.models import Image, UploadIntent, UploadSession
+from galleryapp.tools.chunked_upload import discard_partial
+
+
+class Command(BaseCommand):
+    help = '清理已过期或已取消的分片上传会话、未确认的直传上传意图及其文件'
+
+    def handle(self, *args, **options):
+        sessions = UploadSession.objects.exclude(status='completed').filter(expires_at__lt=timezone.now())
+        count = 0
+        for session in sessions.iterator():
+            discard_partial(session)
+            session.delete()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'已清理 {count} 个上传会话'))
+
+        storage = Image._meta.get_field('file').storage
+        intents = UploadIntent.objects.filter(status='pending', expires_at__lt=timezone.now())
+        count = 0
+        for intent in intents.iterator():
+            if storage.exists(intent.storage_name):
+                storage.delete(intent.storage_name)  # 已上传但未确认的文件
+            intent.delete()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'已清理 {count} 个上传意图'))
@@ -0,0 +1,38 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from galleryapp.tools.reaper import reap_batch
+
+
+class Command(BaseCommand):
+    help = '分批物理删除已标记删除的图片，并发删除不再被引用的文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每个事务删除的图片数量')
+        parser.add_argument('--workers', type=int, default=8, help='并发删除文件的线程数')
+        parser.add_argument('--grace', type=int, default=None,
+                            help='标记删除超过该秒数才清理，默认为 DELETED_IMAGE_GRACE_SECONDS')
+        parser.add_argument('--sleep', type=float, default=10.0, help='没有待清理图片时的轮询间隔（秒）')
+        parser.add_argument('--once', action='store_true', help='清理完当前待删除的图片后退出')
+
+    def handle(self, *args, **options):
+        grace = options['grace'] if options['grace'] is not None else settings.DELETED_IMAGE_GRACE_SECONDS
+        total = 0
+        try:
+            while True:
+                close_old_connections()
+                count = reap_batch(timezone.now() - timedelta(seconds=grace), options['batch_size'],
+                                   options['workers'])
+                total += count
+                if count:
+                    self.stdout.write(f'已清理 {total} 张图片')
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'共清理 {total} 张图片'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from galleryapp.models import Image
+from galleryapp.tools.search import index_images
+
+
+class Command(BaseCommand):
+    help = '重建所有图片的搜索倒排索引（分词规则变化后需要运行一次）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+        batch = []
+        for image in Image.objects.order_by('id').only('id', 'title', 'description', 'uploaded_by').iterator(
+                chunk_size=batch_size):
+            batch.append(image)
+            if len(batch) >= batch_size:
+                index_images(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            index_images(batch)
+            total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'已重建 {total} 张图片的索引'))
@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from galleryapp.tools.jobs import claim_jobs, run_job, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = '运行图片后台处理 worker，从数据库任务表中领取并执行任务'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10, help='每次领取的任务数量')
+        parser.add_argument('--sleep', type=float, default=2.0, help='队列为空时的轮询间隔（秒）')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='running 状态超过该秒数的任务视为 worker 异常退出，重新入队')
+        parser.add_argument('--once', action='store_true', help='处理完当前队列后退出')
+
+    def handle(self, *args, **options):
+        self.stdout.write('图片 worker 已启动')
+        try:
+            while True:
+                close_old_connections()  # 长时间运行时避免使用已断开的数据库连接
+                requeue_stale_jobs(options['stale_after'])
+                jobs = claim_jobs(options['batch_size'])
+                for job in jobs:
+                    run_job(job)
+                    self.stdout.write(f'{job} 尝试次数={job.attempts}')
+
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write('图片 worker 已停止')
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management.base import BaseCommand, CommandError
+from urllib.parse import urlsplit
+from galleryapp.tools.presign import make_upload_receiver
+
+
+class Command(BaseCommand):
+    help = '运行直传上传接收服务：校验签名后把客户端 PUT 的文件写入本地存储，不占用 Django worker'
+
+    def add_arguments(self, parser):
+        url = urlsplit(settings.PRESIGNED_UPLOAD_URL)
+        parser.add_argument('--host', default=url.hostname or '127.0.0.1')
+        parser.add_argument('--port', type=int, default=url.port or 8001)
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, FileSystemStorage):
+            raise CommandError('当前存储不是本地存储，客户端会直接上传到对象存储，无需运行接收服务')
+
+        server = make_upload_receiver(options['host'], options['port'])
+        self.stdout.write(self.style.SUCCESS(f"上传接收服务已启动: http://{options['host']}:{options['port']}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write('上传接收服务已停止')
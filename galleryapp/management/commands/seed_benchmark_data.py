@@ -0,0 +1,107 @@
+import random
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from galleryapp.models import Image, ShareLink, Tag
+from galleryapp.tools.search import index_images
+from users.models import CustomUser
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+TITLE_WORDS = ['风景', '猫咪', '小狗', '海边', '日落', '城市', '夜景', '花朵', '美食', '旅行',
+               'sunset', 'beach', 'portrait', 'street', 'mountain', 'product', 'sample', 'holiday']
+
+
+class Command(BaseCommand):
+    help = '生成压测用的用户、标签、图片和分享链接（只写数据库，不生成图片文件），配合 benchmark_api 使用'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--images', type=int, default=1000, help='图片总数，平均分配给各用户（1k ~ 1M）')
+        parser.add_argument('--tags', type=int, default=20, help='每个用户的标签数')
+        parser.add_argument('--tags-per-image', type=int, default=3)
+        parser.add_argument('--share-links', type=int, default=10, help='每个用户的分享链接数')
+        parser.add_argument('--images-per-share', type=int, default=20)
+        parser.add_argument('--prefix', default='bench', help='压测用户名前缀')
+        parser.add_argument('--password', default=BENCHMARK_PASSWORD)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0, help='随机种子，保证数据可复现')
+        parser.add_argument('--skip-search-index', action='store_true', help='不建立关键词检索索引')
+        parser.add_argument('--reset', action='store_true', help='先删除已有的同前缀压测数据')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix = options['prefix']
+        if options['reset']:
+            deleted, _ = CustomUser.objects.filter(username__startswith=f'{prefix}_').delete()
+            ShareLink.objects.filter(share_code__startswith=f'{prefix}-').delete()
+            self.stdout.write(f'已删除 {deleted} 条旧的压测数据')
+
+        password = make_password(options['password'])  # 只计算一次哈希
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'{prefix}_{i}', email=f'{prefix}_{i}@example.com', password=password)
+            for i in range(options['users'])
+        ], ignore_conflicts=True)
+        users = list(CustomUser.objects.filter(username__in=[user.username for user in users]).order_by('id'))
+
+        per_user, remainder = divmod(options['images'], len(users))
+        for index, user in enumerate(users):
+            tags = self.create_tags(user, options['tags'], prefix)
+            count = per_user + (1 if index < remainder else 0)
+            image_ids = self.create_images(user, tags, count, rng, options)
+            self.create_share_links(user, image_ids, rng, options)
+            self.stdout.write(f'{user.username}: {count} 张图片')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"已生成 {len(users)} 个用户、{options['images']} 张图片，登录密码: {options['password']}"))
+
+    def create_tags(self, user, count, prefix):
+        Tag.objects.bulk_create([Tag(name=f'{prefix}-{user.id}-tag-{i}', uploaded_by=user) for i in range(count)],
+                                ignore_conflicts=True)
+        return list(Tag.objects.filter(uploaded_by=user).values_list('id', flat=True))
+
+    def create_images(self, user, tags, count, rng, options):
+        """按批写入图片、标签关联和检索索引，返回图片ID"""
+        batch_size = options['batch_size']
+        through = Image.tags.through
+        all_ids = []
+        for start in range(0, count, batch_size):
+            size = min(batch_size, count - start)
+            with transaction.atomic():
+                last_id = Image.objects.order_by('-id').values_list('id', flat=True).first() or 0
+                Image.objects.bulk_create([
+                    Image(title=' '.join(rng.sample(TITLE_WORDS, 2)) + f' {start + i}',
+                          file=f'images/{options["prefix"]}/{user.id}/{start + i}.jpg',
+                          uploaded_by=user, status='ready')
+                    for i in range(size)
+                ], batch_size=1000)
+                # MySQL 的 bulk_create 不返回主键，按插入顺序取回
+                images = list(Image.objects.filter(uploaded_by=user, id__gt=last_id)
+                              .only('id', 'title', 'description', 'uploaded_by').order_by('id'))
+                if tags:
+                    through.objects.bulk_create([
+                        through(image_id=image.id, tag_id=tag_id)
+                        for image in images
+                        for tag_id in rng.sample(tags, min(options['tags_per_image'], len(tags)))
+                    ], batch_size=1000)
+                if not options['skip_search_index']:
+                    index_images(images)
+            all_ids.extend(image.id for image in images)
+        return all_ids
+
+    def create_share_links(self, user, image_ids, rng, options):
+        if not image_ids:
+            return
+        through = ShareLink.images.through
+        expire_time = timezone.now() + timedelta(days=365)
+        links = ShareLink.objects.bulk_create([
+            ShareLink(share_code=f"{options['prefix']}-{user.id}-{i}", expire_time=expire_time)
+            for i in range(options['share_links'])
+        ], ignore_conflicts=True)
+        links = ShareLink.objects.filter(share_code__in=[link.share_code for link in links])
+        through.objects.bulk_create([
+            through(sharelink_id=link.id, image_id=image_id)
+            for link in links
+            for image_id in rng.sample(image_ids, min(options['images_per_share'], len(image_ids)))
+        ], ignore_conflicts=True, batch_size=1000)
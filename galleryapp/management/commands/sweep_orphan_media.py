@@ -0,0 +1,52 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from galleryapp.models import Image
+from galleryapp.tools.dedup import delete_files
+from galleryapp.tools.reaper import find_orphans, iter_referenced_names, iter_storage_names
+
+
+class Command(BaseCommand):
+    help = (
+        '对比存储目录和数据库（图片、去重文件、直传意图、头像），找出没有被引用的孤立文件。'
+        '存储和数据库两侧都按文件名有序流式读取后归并，不会把文件列表读入内存。默认只列出，--delete 时删除'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', nargs='+', default=['images', 'avatars'], help='要检查的存储目录')
+        parser.add_argument('--grace', type=int, default=None,
+                            help='只处理修改时间早于该秒数的文件，默认为 ORPHAN_MEDIA_GRACE_SECONDS')
+        parser.add_argument('--delete', action='store_true', help='删除孤立文件（默认只列出）')
+        parser.add_argument('--workers', type=int, default=8, help='并发删除文件的线程数')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        storage = Image._meta.get_field('file').storage
+        grace = options['grace'] if options['grace'] is not None else settings.ORPHAN_MEDIA_GRACE_SECONDS
+        cutoff = timezone.now() - timedelta(seconds=grace)
+
+        def storage_names():
+            # 各目录按 "目录名/" 排序后依次遍历，整体仍是有序的
+            for prefix in sorted(prefix.strip('/') + '/' for prefix in options['prefix']):
+                yield from iter_storage_names(storage, prefix.rstrip('/'))
+
+        found = skipped = 0
+        batch = []
+        for name in find_orphans(storage_names(), iter_referenced_names()):
+            # 刚写入的文件可能属于尚未提交的上传事务
+            if storage.get_modified_time(name) > cutoff:
+                skipped += 1
+                continue
+            found += 1
+            self.stdout.write(name)
+            if options['delete']:
+                batch.append(name)
+                if len(batch) >= options['batch_size']:
+                    delete_files(storage, batch, options['workers'])
+                    batch = []
+        if batch:
+            delete_files(storage, batch, options['workers'])
+
+        action = '已删除' if options['delete'] else '发现'
+        self.stdout.write(self.style.SUCCESS(f'{action} {found} 个孤立文件，跳过 {skipped} 个较新的文件'))
@@ -0,0 +1,139 @@
+import json
+import logging
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from .tools.metrics import start_request, end_request, observe_request, get_current_metrics
+from .tools.profiling import PROFILE_MODES, read_profiling_token, profile_call, profile_limit_reached, \
+    strip_profiling_params
+from .models import RequestProfile
+from users.models import CustomUser
+
+logger = logging.getLogger('galleryapp.requests')
+
+
+class PerformanceMiddleware:
+    """
+    记录每个请求的总耗时、SQL 数量和耗时、缓存命中、序列化耗时和响应字节数，
+    写入 Server-Timing 响应头、结构化日志（一行 JSON）和进程内直方图（/metrics）。
+    同时支持同步和异步，ASGI 下不会让异步视图退回线程执行。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        self.finish(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics, token = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        self.finish(request, response, metrics)
+        return response
+
+    def finish(self, request, response, metrics):
+        metrics.finish(response)
+        # 使用路由模板而不是实际路径作为标签，避免图片ID、分享码等导致标签无限增长
+        match = getattr(request, 'resolver_match', None)
+        view = match.route if match is not None else 'unmatched'
+        observe_request(metrics, request.method, view, response.status_code)
+
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = metrics.server_timing()
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            **metrics.as_dict(),
+        }
+        # 普通请求记为 DEBUG，默认不输出，避免每个请求一行日志刷屏；慢请求总是输出
+        level = logging.WARNING if record['total_ms'] >= settings.METRICS_SLOW_REQUEST_MS else logging.DEBUG
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps(record, ensure_ascii=False), extra={'request_metrics': record})
+
+
+class ProfilingMiddleware:
+    """
+    按需剖析单个请求：请求带有管理员签发的剖析令牌（X-Profile-Token 头或 ?_profile= 参数）时，
+    在采样剖析器或 cProfile 下执行并保存为 RequestProfile，响应头 X-Profile-Id 返回记录ID。
+    没有令牌的请求只多一次请求头和查询参数的检查。PROFILING_ENABLED 为 False 时不加载。
+    ASGI 下事件循环同时处理多个请求，无法单独剖析，请求原样通过。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.get_response(request)
+        token = request.META.get('HTTP_X_PROFILE_TOKEN') or request.GET.get('_profile')
+        if not token:
+            return self.get_response(request)
+        requested_by = read_profiling_token(token)
+        if requested_by is None:
+            logger.warning(f'无效或过期的剖析令牌: {request.path}')
+            return self.get_response(request)
+        if not CustomUser.objects.filter(pk=requested_by, is_staff=True, is_active=True).exists():
+            return self.get_response(request)
+        if profile_limit_reached(requested_by):
+            logger.warning(f'剖析次数已达上限，不再剖析: {request.path}')
+            return self.get_response(request)
+
+        mode = request.META.get('HTTP_X_PROFILE_MODE') or request.GET.get('_profile_mode') \
+            or settings.PROFILING_DEFAULT_MODE
+        if mode not in PROFILE_MODES:
+            mode = settings.PROFILING_DEFAULT_MODE
+        metrics = get_current_metrics()
+        queries_before = metrics.db_queries if metrics is not None else 0
+        started = time.perf_counter()
+        response, collapsed, pstats, samples = profile_call(lambda: self.get_response(request), mode)
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        profile = RequestProfile.objects.create(
+            requested_by_id=requested_by,
+            user=self.get_request_user(request, response),
+            mode=mode,
+            method=request.method,
+            path=request.path[:2048],
+            query_string=strip_profiling_params(request.META.get('QUERY_STRING', '')),
+            view=match.route if match is not None else '',
+            status_code=response.status_code,
+            duration_ms=duration_ms,
+            db_queries=metrics.db_queries - queries_before if metrics is not None else None,
+            samples=samples,
+            collapsed_stacks=collapsed,
+            pstats=pstats,
+        )
+        response['X-Profile-Id'] = str(profile.id)
+        return response
+
+    def get_request_user(self, request, response):
+        # JWT 认证在 DRF 中完成，从 Response 携带的 DRF Request 上取用户
+        drf_request = (getattr(response, 'renderer_context', None) or {}).get('request')
+        user = getattr(drf_request or request, 'user', None)
+        return user if user is not None and user.is_authenticated else None
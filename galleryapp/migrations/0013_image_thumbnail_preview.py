@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galleryapp', '0012_alter_sharelink_share_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='preview',
+            field=models.ImageField(blank=True, null=True, upload_to='images/previews/'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='images/thumbnails/'),
+        ),
+        migrations.AlterField(
+            model_name='sharelink',
+            name='share_code',
+            field=models.CharField(default='88c06f87f67b46edb2fb2e202f9286d6', max_length=64, unique=True),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.3 on 2026-10-18 14:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galleryapp', '0016_image_content_hash_imageblob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='phash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='phash_band0',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='phash_band1',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='phash_band2',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='phash_band3',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='sharelink',
+            name='share_code',
+            field=models.CharField(default='b13054b43826430f9f2d3d939bd182ca', max_length=64, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['uploaded_by', 'phash_band0'], name='image_phash_band0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['uploaded_by', 'phash_band1'], name='image_phash_band1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['uploaded_by', 'phash_band2'], name='image_phash_band2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['uploaded_by', 'phash_band3'], name='image_phash_band3_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.3 on 2026-10-18 14:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galleryapp', '0017_image_phash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sharelink',
+            name='share_code',
+            field=models.CharField(default='190e18b4352b4f42b6ae570dfbb06487', max_length=64, unique=True),
+        ),
+        migrations.CreateModel(
+            name='ImageSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='galleryapp.image')),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['uploaded_by', 'token'], name='searchtoken_user_token_idx')],
+                'constraints': [models.UniqueConstraint(fields=('image', 'token'), name='searchtoken_image_token_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-18 14:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galleryapp', '0018_imagesearchtoken'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sharelink',
+            name='share_code',
+            field=models.CharField(default='0e0a4b3df70244ea9de326ea427cb636', max_length=64, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['uploaded_by', '-created_at', '-id'], name='image_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharelink',
+            index=models.Index(fields=['-expire_time', 'created_time'], name='sharelink_expire_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['uploaded_by', 'name'], name='tag_user_name_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galleryapp', '0019_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='image',
+            name='file',
+            field=models.ImageField(max_length=255, upload_to='images/'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='preview',
+            field=models.ImageField(blank=True, max_length=255, null=True, upload_to='images/previews/'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='thumbnail',
+            field=models.ImageField(blank=True, max_length=255, null=True, upload_to='images/thumbnails/'),
+        ),
+        migrations.AlterField(
+            model_name='sharelink',
+            name='share_code',
+            field=models.CharField(default='8fa92eb26614494e949bca8839fd9c8d', max_length=64, unique=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-18 14:25
+
+import django.db.models.deletion
+import galleryapp.models
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galleryapp', '0020_image_file_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sharelink',
+            name='share_code',
+            field=models.CharField(default='2cc9a4de2fd2468a8de1f2e717bd3b8a', max_length=64, unique=True),
+        ),
+        migrations.CreateModel(
+            name='UploadIntent',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('title', models.CharField(blank=True, default='', max_length=255)),
+                ('tag_ids', models.JSONField(blank=True, default=list)),
+                ('storage_name', models.CharField(max_length=255, unique=True)),
+                ('max_size', models.PositiveBigIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed')], default='pending', max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(default=galleryapp.models.default_intent_expire_time)),
+                ('image', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='galleryapp.image')),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.3 on 2026-10-18 14:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('galleryapp', '0023_image_metadata'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='sharelink',
+            name='share_code',
+            field=models.CharField(default='8966872b291f41bfa04c2d51ebff5b5b', max_length=64, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['deleted_at'], name='image_deleted_idx'),
+        ),
+    ]
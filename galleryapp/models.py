@@ -20,20 +20,216 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['uploaded_by', 'name'], name='tag_user_name_idx'),
+        ]
+
+
+class ImageManager(models.Manager):
+    """默认管理器不返回已标记删除（等待 reap_deleted_images 清理）的图片"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 
 class Image(models.Model):
     title = models.CharField(max_length=255, blank=True, default="")
     description = models.TextField(blank=True, null=True)  # 留空，可以后续编辑
-    file = models.ImageField(upload_to='images/')
+    file = models.ImageField(upload_to='images/', max_length=255)
+    thumbnail = models.ImageField(upload_to='images/thumbnails/', max_length=255, blank=True, null=True)  # 固定尺寸缩略图
+    preview = models.ImageField(upload_to='images/previews/', max_length=255, blank=True, null=True)  # 中等尺寸预览图
+    content_hash = models.CharField(max_length=64, blank=True, default="", db_index=True)  # 文件内容 SHA-256
+    # 64 位感知哈希及其 4 段 16 位拆分，用于相似图片检索
+    phash = models.BigIntegerField(blank=True, null=True)
+    phash_band0 = models.PositiveIntegerField(blank=True, null=True)
+    phash_band1 = models.PositiveIntegerField(blank=True, null=True)
+    phash_band2 = models.PositiveIntegerField(blank=True, null=True)
+    phash_band3 = models.PositiveIntegerField(blank=True, null=True)
     uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    # 后台处理状态：上传后为 pending，由 run_image_worker 处理完成后变为 ready
+    status = models.CharField(max_length=16, choices=[('pending', 'Pending'), ('processing', 'Processing'),
+                                                      ('ready', 'Ready'), ('failed', 'Failed')],
+                              default='ready')
+    # 元数据，由 metadata 任务或 backfill_image_metadata 从文件头和 EXIF 中提取
+    width = models.PositiveIntegerField(blank=True, null=True)  # 按 EXIF 方向旋转后的显示尺寸
+    height = models.PositiveIntegerField(blank=True, null=True)
+    orientation = models.CharField(max_length=16, blank=True, default="",
+                                   choices=[('landscape', 'Landscape'), ('portrait', 'Portrait'),
+                                            ('square', 'Square')])
+    format = models.CharField(max_length=16, blank=True, default="")  # JPEG、PNG、WEBP 等
+    file_size = models.PositiveBigIntegerField(blank=True, null=True)  # 字节数
+    taken_at = models.DateTimeField(blank=True, null=True)  # 拍摄时间（EXIF DateTimeOriginal）
+    camera_make = models.CharField(max_length=64, blank=True, default="")
+    camera_model = models.CharField(max_length=64, blank=True, default="")
+    # 批量删除时只标记删除时间，数据库记录和文件由 reap_deleted_images 分批清理
+    deleted_at = models.DateTimeField(blank=True, null=True)
 
     tags = models.ManyToManyField(Tag, blank=True)
 
+    objects = ImageManager()
+    all_objects = models.Manager()  # 包含已标记删除的图片
+
+    class Meta:
+        indexes = [
+            # 用户图片列表：WHERE uploaded_by = ? ORDER BY created_at DESC, id DESC
+            models.Index(fields=['uploaded_by', '-created_at', '-id'], name='image_user_created_idx'),
+            models.Index(fields=['uploaded_by', 'phash_band0'], name='image_phash_band0_idx'),
+            models.Index(fields=['uploaded_by', 'phash_band1'], name='image_phash_band1_idx'),
+            models.Index(fields=['uploaded_by', 'phash_band2'], name='image_phash_band2_idx'),
+            models.Index(fields=['uploaded_by', 'phash_band3'], name='image_phash_band3_idx'),
+            # 元数据过滤：用户条件在前，范围条件在后，可在索引上做范围扫描
+            models.Index(fields=['uploaded_by', 'taken_at'], name='image_user_taken_idx'),
+            models.Index(fields=['uploaded_by', 'width'], name='image_user_width_idx'),
+            models.Index(fields=['uploaded_by', 'height'], name='image_user_height_idx'),
+            models.Index(fields=['uploaded_by', 'orientation', 'taken_at'], name='image_user_orient_idx'),
+            models.Index(fields=['uploaded_by', 'camera_make', 'camera_model', 'taken_at'],
+                         name='image_user_camera_idx'),
+            models.Index(fields=['deleted_at'], name='image_deleted_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
 
+class ImageSearchToken(models.Model):
+    """图片搜索倒排索引，每张图片的每个词元一行，由 tools/search.py 维护"""
+    image = models.ForeignKey(Image, on_delete=models.CASCADE, related_name='search_tokens')
+    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)  # 冗余存储，便于按用户走索引
+    token = models.CharField(max_length=64)
+    weight = models.PositiveSmallIntegerField(default=1)  # 标题、标签、描述中出现的加权分
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['uploaded_by', 'token'], name='searchtoken_user_token_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['image', 'token'], name='searchtoken_image_token_uniq'),
+        ]
+
+    def __str__(self):
+        return self.token
+
+
+class ImageBlob(models.Model):
+    """按内容哈希去重后的物理文件，相同内容的多张图片共享同一个文件"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.CharField(max_length=255)  # 存储中的文件名，与 Image.file 一致
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)  # 引用该文件的图片数量
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256} ({self.ref_count})"
+
+
+class LibraryVersion(models.Model):
+    """用户图库版本号，用于图片列表和详情的 ETag / Last-Modified，由 tools/conditional.py 维护"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='library_version')
+    version = models.BigIntegerField(default=0)  # 纳秒时间戳，每次变更至少加 1，保证单调递增
+
+    def __str__(self):
+        return f"{self.user_id}: {self.version}"
+
+
+class ImageJob(models.Model):
+    """图片后台处理任务，存放在数据库中，由 run_image_worker 消费"""
+    image = models.ForeignKey(Image, on_delete=models.CASCADE, related_name='jobs')
+    job_type = models.CharField(max_length=32)  # 对应 tools/jobs.py 中注册的处理函数
+    status = models.CharField(max_length=16, choices=[('pending', 'Pending'), ('running', 'Running'),
+                                                      ('done', 'Done'), ('failed', 'Failed')],
+                              default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)  # 已尝试次数
+    last_error = models.TextField(blank=True, default='')
+    run_after = models.DateTimeField(default=timezone.now)  # 重试时延后执行
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='imagejob_status_run_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.job_type} #{self.image_id} ({self.status})"
+
+
+# 默认的分片上传会话有效期
+def default_upload_expire_time():
+    return timezone.now() + timedelta(days=1)
+
+
+class UploadSession(models.Model):
+    """可断点续传的分片上传会话，分片按偏移量写入临时文件，完成后生成 Image"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    title = models.CharField(max_length=255, blank=True, default="")
+    tag_ids = models.JSONField(default=list, blank=True)  # 初始化时校验过的标签ID
+    total_size = models.PositiveBigIntegerField()
+    received_bytes = models.PositiveBigIntegerField(default=0)  # 已接收字节数，即下一个分片的偏移量
+    status = models.CharField(max_length=16, choices=[('uploading', 'Uploading'), ('completed', 'Completed'),
+                                                      ('aborted', 'Aborted')],
+                              default='uploading')
+    image = models.ForeignKey(Image, on_delete=models.SET_NULL, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(default=default_upload_expire_time)
+
+    def is_expired(self):
+        return timezone.now() > self.expires_at
+
+
+def default_intent_expire_time():
+    return timezone.now() + timedelta(seconds=settings.PRESIGNED_UPLOAD_EXPIRE_SECONDS)
+
+
+class UploadIntent(models.Model):
+    """直传上传意图：客户端拿到签名 URL 后直接把文件传到存储，再调用确认接口生成 Image"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    title = models.CharField(max_length=255, blank=True, default="")
+    tag_ids = models.JSONField(default=list, blank=True)
+    storage_name = models.CharField(max_length=255, unique=True)  # 预先分配的存储文件名
+    max_size = models.PositiveBigIntegerField()  # 签名中允许的最大字节数
+    status = models.CharField(max_length=16, choices=[('pending', 'Pending'), ('confirmed', 'Confirmed')],
+                              default='pending')
+    image = models.ForeignKey(Image, on_delete=models.SET_NULL, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(default=default_intent_expire_time)
+
+    def is_expired(self):
+        return timezone.now() > self.expires_at
+
+
+class RequestProfile(models.Model):
+    """管理员按需剖析的单个请求：请求信息和剖析结果（折叠栈，cProfile 模式另存 pstats）"""
+    MODE_CHOICES = [('sample', 'Sampling'), ('cprofile', 'cProfile')]
+
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True,
+                                     related_name='requested_profiles')  # 签发剖析令牌的管理员
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                             related_name='request_profiles')  # 发起请求的用户
+    mode = models.CharField(max_length=16, choices=MODE_CHOICES)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2048)
+    query_string = models.TextField(blank=True, default="")
+    view = models.CharField(max_length=255, blank=True, default="")  # 路由模板
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    db_queries = models.PositiveIntegerField(null=True, blank=True)
+    samples = models.PositiveIntegerField(default=0)  # 采样模式下的采样次数
+    collapsed_stacks = models.TextField()  # 折叠栈格式，可直接用 flamegraph.pl / speedscope 打开
+    pstats = models.BinaryField(null=True, blank=True)  # cProfile 模式的 marshal 数据，可用 pstats.Stats 读取
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+
 class ShareLink(models.Model):
     images = models.ManyToManyField('Image', related_name="share_links")
     share_code = models.CharField(max_length=64, unique=True, default=uuid.uuid4().hex)
@@ -44,6 +240,10 @@ class ShareLink(models.Model):
 
     class Meta:
         ordering = ['-expire_time', 'created_time']
+        indexes = [
+            # 分享链接管理列表的排序
+            models.Index(fields=['-expire_time', 'created_time'], name='sharelink_expire_created_idx'),
+        ]
 
     def is_expired(self):
         return timezone.now() > self.expire_time
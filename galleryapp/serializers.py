@@ -1,5 +1,6 @@
 from .models import Image, ShareLink, Tag
 from rest_framework import serializers
+from .tools.metrics import measure_serialization
 from django.db import IntegrityError
 from django.utils.timezone import now, localtime
 from datetime import timedelta
@@ -17,10 +18,29 @@ def generate_unique_share_code():
             return share_code
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TimedListSerializer(serializers.ListSerializer):
+    """many=True 时的列表序列化器，序列化耗时计入请求指标"""
+
+    @property
+    def data(self):
+        with measure_serialization():
+            return super().data
+
+
+class TimedSerializerMixin:
+    """序列化耗时计入请求指标（Server-Timing: serialize），Meta 中需设置 list_serializer_class"""
+
+    @property
+    def data(self):
+        with measure_serialization():
+            return super().data
+
+
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ['id', 'name']
+        list_serializer_class = TimedListSerializer
 
     def create(self, validated_data):
         user = self.context['request'].user  # 获取当前请求的用户
@@ -28,11 +48,23 @@ class TagSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class ImageSerializer(serializers.ModelSerializer):
+class ImageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # 可选内嵌标签名称，需要在 context 中传入 embed_tags=True；
+    # 列表查询应配合 prefetch_related('tags')，避免每张图片单独查询标签
+    tag_details = TagSerializer(source='tags', many=True, read_only=True)
+
     class Meta:
         model = Image
-        fields = ['id', 'title', 'file', 'created_at', 'tags']  # 只展示必要的字段
-        read_only_fields = ['id', 'uploaded_by', 'created_at']  # id 和 created_at 不允许修改
+        fields = ['id', 'title', 'file', 'thumbnail', 'preview', 'status', 'created_at', 'width', 'height',
+                  'taken_at', 'tags', 'tag_details']  # 只展示必要的字段
+        list_serializer_class = TimedListSerializer
+        read_only_fields = ['id', 'uploaded_by', 'thumbnail', 'preview', 'status', 'created_at', 'width', 'height',
+                            'taken_at']  # id 和 created_at 不允许修改
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.context.get('embed_tags'):
+            self.fields.pop('tag_details')
 
     def validate_description(self, value):
         if not value:
@@ -40,14 +72,17 @@ class ImageSerializer(serializers.ModelSerializer):
         return value
 
 
-class ImageDetailSerializer(serializers.ModelSerializer):
+class ImageDetailSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Image
-        fields = ['id', 'title', 'description', 'file', 'created_at', 'tags']
-        read_only_fields = ['id', 'created_at']  # 其他字段可以编辑
+        fields = ['id', 'title', 'description', 'file', 'thumbnail', 'preview', 'status', 'created_at', 'tags',
+                  'width', 'height', 'orientation', 'format', 'file_size', 'taken_at', 'camera_make', 'camera_model']
+        list_serializer_class = TimedListSerializer
+        read_only_fields = ['id', 'thumbnail', 'preview', 'status', 'created_at', 'width', 'height', 'orientation',
+                            'format', 'file_size', 'taken_at', 'camera_make', 'camera_model']  # 其他字段可以编辑
 
 
-class ShareLinkSerializer(serializers.ModelSerializer):
+class ShareLinkSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     images = serializers.PrimaryKeyRelatedField(queryset=Image.objects.all(), many=True)  # 支持多个图片选择
     password = serializers.CharField(required=False, allow_blank=True)  # 密码可选
 
@@ -57,6 +92,7 @@ class ShareLinkSerializer(serializers.ModelSerializer):
         model = ShareLink
         fields = ['id', 'images', 'share_code', 'is_protected', 'password', 'expire_time', 'expire_duration']
         read_only_fields = ['id', 'share_code']
+        list_serializer_class = TimedListSerializer
 
         def validate_expire_duration(self, value):
             if value is not None and value <= 0:
@@ -77,10 +113,6 @@ class ShareLinkSerializer(serializers.ModelSerializer):
         # 动态计算过期时间，确保计算时间准确
         expire_time = current_time + timedelta(minutes=expire_duration)
 
-        # 调试输出
-        print(f"Current time: {current_time}")
-        print(f"Expire time: {expire_time}")
-
         # 将过期时间添加到 validated_data 中
         validated_data['expire_time'] = expire_time
 
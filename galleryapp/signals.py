@@ -0,0 +1,72 @@
+from django.db.models.signals import post_save, m2m_changed, pre_delete, post_delete
+from django.dispatch import receiver
+from .models import Image, Tag
+from .tools.search import index_image, index_images
+from .tools.share_cache import invalidate_shares_for_images
+from .tools.conditional import bump_library_version
+
+# 这些字段变化时需要重建搜索索引
+SEARCH_FIELDS = {'title', 'description'}
+# 这些字段出现在分享链接返回的数据中，变化时需要清除分享缓存
+SHARE_PAYLOAD_FIELDS = {'title', 'file', 'thumbnail', 'preview', 'status'}
+
+
+@receiver(post_save, sender=Image)
+def reindex_image_on_save(sender, instance, created, update_fields=None, **kwargs):
+    # 后台任务只更新衍生图、哈希等字段，不影响搜索索引
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    index_image(instance)
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def bump_library_version_on_change(sender, instance, **kwargs):
+    # 图库版本变化后，客户端的 ETag / Last-Modified 校验失效
+    bump_library_version(instance.uploaded_by_id)
+
+
+@receiver(post_save, sender=Image)
+def invalidate_share_cache_on_save(sender, instance, created, update_fields=None, **kwargs):
+    # 新建的图片还没有被分享
+    if created or (update_fields is not None and not SHARE_PAYLOAD_FIELDS & set(update_fields)):
+        return
+    invalidate_shares_for_images([instance.id])
+
+
+@receiver(m2m_changed, sender=Image.tags.through)
+def reindex_image_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        index_image(instance)
+        invalidate_shares_for_images([instance.id])
+        bump_library_version(instance.uploaded_by_id)
+    elif pk_set:
+        index_images(Image.objects.filter(id__in=pk_set))
+        invalidate_shares_for_images(pk_set)
+        bump_library_version(instance.uploaded_by_id)
+
+
+@receiver(post_save, sender=Tag)
+def reindex_images_on_tag_rename(sender, instance, created, **kwargs):
+    if not created:
+        images = list(Image.objects.filter(tags=instance))
+        index_images(images)
+        invalidate_shares_for_images(image.id for image in images)
+        bump_library_version(instance.uploaded_by_id)
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_images(sender, instance, **kwargs):
+    # 删除标签时关联关系会被级联删除且不触发 m2m_changed，先记下受影响的图片
+    instance._tagged_image_ids = list(Image.objects.filter(tags=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def reindex_images_on_tag_delete(sender, instance, **kwargs):
+    image_ids = getattr(instance, '_tagged_image_ids', None)
+    if image_ids:
+        index_images(Image.objects.filter(id__in=image_ids))
+        invalidate_shares_for_images(image_ids)
+        bump_library_version(instance.uploaded_by_id)
@@ -0,0 +1,145 @@
+import hashlib
+import mimetypes
+import posixpath
+import re
+import tempfile
+import threading
+from urllib.parse import quote, urljoin
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage, Storage
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:  # 只有使用 S3Storage 时才需要 boto3
+    boto3 = None
+
+SHARDED_NAME_RE = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[^/]+$')
+
+
+class ShardedNameMixin:
+    """
+    把文件分散到两级哈希子目录：images/photo.jpg -> images/3f/a2/photo.jpg，
+    每个目录最多 256 个子目录，避免单个目录下文件过多。
+    哈希取自文件名，内容寻址的文件（以 SHA-256 命名）即按内容分布。
+    """
+
+    def shard_name(self, name):
+        if SHARDED_NAME_RE.search(name):
+            return name  # 已经分片的文件名保持不变，迁移命令可以重复执行
+        dirname, basename = posixpath.split(name)
+        digest = hashlib.md5(basename.encode()).hexdigest()
+        return posixpath.join(dirname, digest[:2], digest[2:4], basename)
+
+    def generate_filename(self, filename):
+        return self.shard_name(super().generate_filename(filename).replace('\\', '/'))
+
+
+class ShardedFileSystemStorage(ShardedNameMixin, FileSystemStorage):
+    """按哈希子目录存放文件的本地存储"""
+
+
+class S3Storage(ShardedNameMixin, Storage):
+    """
+    S3 兼容对象存储（AWS S3、MinIO、阿里云 OSS 等），配置示例见 settings.STORAGES。
+    - 大文件按 multipart_threshold 自动分片并发上传
+    - 同一个存储实例在所有线程间共享一个 boto3 client，连接池大小为 max_pool_connections
+    - 设置 base_url（CDN 或公开读的桶）时直接拼接 URL，否则生成带签名的临时 URL
+    """
+
+    def __init__(self, bucket_name=None, endpoint_url=None, access_key=None, secret_key=None, region_name=None,
+                 base_url=None, url_expire=3600, max_pool_connections=50, multipart_threshold=8 * 1024 * 1024,
+                 multipart_chunksize=8 * 1024 * 1024, max_concurrency=4, file_overwrite=False):
+        if boto3 is None:
+            raise ImproperlyConfigured('使用 S3Storage 需要安装 boto3：pip install boto3')
+        if not bucket_name:
+            raise ImproperlyConfigured('S3Storage 需要配置 bucket_name')
+        self.bucket_name = bucket_name
+        self.endpoint_url = endpoint_url
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region_name = region_name
+        self.base_url = base_url
+        self.url_expire = url_expire
+        self.max_pool_connections = max_pool_connections
+        self.file_overwrite = file_overwrite
+        self.transfer_config = TransferConfig(multipart_threshold=multipart_threshold,
+                                              multipart_chunksize=multipart_chunksize,
+                                              max_concurrency=max_concurrency)
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        # boto3 client 是线程安全的，懒加载后复用其连接池
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = boto3.session.Session().client(
+                        's3',
+                        endpoint_url=self.endpoint_url,
+                        aws_access_key_id=self.access_key,
+                        aws_secret_access_key=self.secret_key,
+                        region_name=self.region_name,
+                        config=Config(max_pool_connections=self.max_pool_connections,
+                                      retries={'max_attempts': 5, 'mode': 'standard'}),
+                    )
+        return self._client
+
+    def _head(self, name):
+        try:
+            return self.client.head_object(Bucket=self.bucket_name, Key=name)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def _open(self, name, mode='rb'):
+        # 小文件留在内存，大文件落到临时文件
+        f = tempfile.SpooledTemporaryFile(max_size=self.transfer_config.multipart_threshold)
+        self.client.download_fileobj(self.bucket_name, name, f, Config=self.transfer_config)
+        f.seek(0)
+        return File(f, name=name)
+
+    def _save(self, name, content):
+        content.seek(0)
+        content_type = getattr(content, 'content_type', None) or mimetypes.guess_type(name)[0]
+        extra_args = {'ContentType': content_type} if content_type else {}
+        self.client.upload_fileobj(content, self.bucket_name, name, ExtraArgs=extra_args,
+                                   Config=self.transfer_config)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        if self.file_overwrite:
+            return name
+        return super().get_available_name(name, max_length)
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket_name, Key=name)
+
+    def exists(self, name):
+        return self._head(name) is not None
+
+    def size(self, name):
+        return self._head(name)['ContentLength']
+
+    def get_modified_time(self, name):
+        return self._head(name)['LastModified']
+
+    def listdir(self, path):
+        prefix = path.rstrip('/') + '/' if path else ''
+        directories, files = [], []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix, Delimiter='/'):
+            directories.extend(item['Prefix'][len(prefix):].rstrip('/') for item in page.get('CommonPrefixes', []))
+            files.extend(item['Key'][len(prefix):] for item in page.get('Contents', []))
+        return directories, files
+
+    def url(self, name):
+        if self.base_url:
+            return urljoin(self.base_url.rstrip('/') + '/', quote(name))
+        return self.client.generate_presigned_url('get_object', Params={'Bucket': self.bucket_name, 'Key': name},
+                                                  ExpiresIn=self.url_expire)
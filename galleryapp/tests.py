@@ -1,3 +1,1664 @@
-from django.test import TestCase
+import base64
+import io
+import os
+import re
+import shutil
+import json
+import marshal
+import random
+import tempfile
+import threading
+import unittest
+import uuid
+from datetime import timedelta
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import Request as UrlRequest, urlopen
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image as PILImage, ImageDraw
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+from users.models import CustomUser
+from .models import Image, ImageBlob, ImageJob, RequestProfile, ShareLink, Tag, UploadIntent, UploadSession
+from .storage import S3Storage, ShardedFileSystemStorage
+from .tools.captcha import DIFFICULTY_LEVELS, CaptchaPool, CaptchaUtil, NumpyCaptchaRenderer
+from .tools.chunked_upload import get_partial_path, write_chunk
+from .tools.conditional import get_library_version
+from .tools.dedup import release_image_files, store_image_file
+from .tools.exif import extract_metadata
+from .tools.jobs import DEFAULT_IMAGE_JOBS, JOB_HANDLERS, MAX_ATTEMPTS, RETRY_DELAY_SECONDS, claim_jobs, \
+    enqueue_image_jobs, requeue_stale_jobs, run_job
+from .tools.reaper import find_orphans, iter_referenced_names, iter_storage_names
+from .tools.renditions import generate_renditions
+from .tools.metrics import Histogram, render_metrics
+from .tools.pagination import KeysetPagination
+from .tools.phash import BAND_FIELDS, MAX_DISTANCE, compute_phash, find_similar_images, hamming_distance, \
+    split_bands, to_signed, to_unsigned
+from .tools.presign import make_upload_receiver
+from .tools.search import tokenize
+from .tools.share_cache import get_cache_key
+from .views import UserImageListView, UserTagListView, ManageShareLinksView
 
-# Create your tests here.
+
+class TemporaryMediaRootMixin:
+    """测试期间使用临时 MEDIA_ROOT"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root)
+        super().tearDownClass()
+
+
+def make_image_file(name='photo.jpg', size=(64, 48), color='white', image_format='JPEG'):
+    buffer = io.BytesIO()
+    PILImage.new('RGB', size, color).save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{image_format.lower()}')
+
+
+class RenditionTests(TemporaryMediaRootMixin, TestCase):
+    """上传后生成缩略图和预览图"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+
+    def create_image(self, content):
+        return Image.objects.create(title='rendition', uploaded_by=self.user,
+                                    file=ContentFile(content, name='rendition.jpg'))
+
+    def test_rendition_sizes(self):
+        image = self.create_image(make_image_file(size=(1600, 800)).read())
+        generate_renditions(image)
+        image.refresh_from_db()
+        with PILImage.open(image.thumbnail) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (200, 200)))
+        with PILImage.open(image.preview) as preview:
+            self.assertEqual(preview.size, (1024, 512))  # 等比缩放，不裁剪
+        self.assertTrue(image.thumbnail.name.endswith('_thumbnail.webp'))
+
+    @override_settings(IMAGE_RENDITION_FORMAT='JPEG')
+    def test_exif_orientation_and_jpeg_format(self):
+        # 方向 6 表示需要顺时针旋转 90 度，横图应变为竖图
+        image = self.create_image(make_exif_jpeg(size=(60, 40), orientation=6))
+        generate_renditions(image)
+        with PILImage.open(image.preview) as preview:
+            self.assertEqual((preview.format, preview.size), ('JPEG', (40, 60)))
+
+    def test_regenerate_replaces_old_files(self):
+        image = self.create_image(make_image_file().read())
+        generate_renditions(image)
+        generate_renditions(image)
+        # 旧的衍生图先删除，不会留下 xxx_thumbnail_abc123.webp 之类的副本
+        thumbnails = [name for _, _, names in os.walk(self.media_root) for name in names
+                      if name.endswith('_thumbnail.webp')]
+        self.assertEqual(thumbnails, [os.path.basename(image.thumbnail.name)])
+
+    @override_settings(IMAGE_JOBS_EAGER=True)
+    def test_upload_generates_renditions(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/images/upload/', {'file': make_image_file(), 'title': 'upload'})
+        self.assertEqual(response.status_code, 201, response.content)
+        image = Image.objects.get()
+        self.assertEqual(image.status, 'ready')
+        self.assertTrue(image.thumbnail and image.preview)
+
+
+class ImageJobQueueTests(TestCase):
+    """数据库任务队列：领取、重试退避和异常退出后重新入队"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+        cls.image = Image.objects.create(title='job', file='images/job.jpg', uploaded_by=cls.user)
+
+    def setUp(self):
+        self.calls = []
+
+    def flaky(self, image):
+        self.calls.append(image.id)
+        if len(self.calls) < 2:
+            raise OSError('storage unavailable')
+
+    def test_claim_jobs(self):
+        jobs = enqueue_image_jobs([self.image], ['renditions', 'phash'])
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.status, 'pending')
+        ImageJob.objects.filter(id=jobs[1].id).update(run_after=timezone.now() + timedelta(minutes=1))
+
+        claimed = claim_jobs(10)
+        self.assertEqual([job.id for job in claimed], [jobs[0].id])
+        self.assertEqual(ImageJob.objects.get(id=jobs[0].id).status, 'running')
+        # 已领取和未到执行时间的任务不会被再次领取
+        self.assertEqual(claim_jobs(10), [])
+
+    def test_retry_with_backoff(self):
+        with mock.patch.dict(JOB_HANDLERS, {'flaky': self.flaky}):
+            enqueue_image_jobs([self.image], ['flaky'])
+            with self.assertLogs('galleryapp.tools.jobs', 'ERROR'):
+                job = run_job(claim_jobs(1)[0])
+            self.assertEqual((job.status, job.attempts, job.last_error), ('pending', 1, 'storage unavailable'))
+            self.assertAlmostEqual((job.run_after - timezone.now()).total_seconds(), RETRY_DELAY_SECONDS, delta=5)
+            self.assertEqual(claim_jobs(1), [])  # 退避时间未到
+
+            ImageJob.objects.filter(id=job.id).update(run_after=timezone.now())
+            job = run_job(claim_jobs(1)[0])
+        self.assertEqual((job.status, job.attempts), ('done', 2))
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.status, 'ready')
+
+    def test_fails_after_max_attempts(self):
+        with mock.patch.dict(JOB_HANDLERS, {'broken': mock.Mock(side_effect=ValueError('bad file'))}):
+            enqueue_image_jobs([self.image], ['broken'])
+            for attempt in range(MAX_ATTEMPTS):
+                ImageJob.objects.update(run_after=timezone.now())
+                with self.assertLogs('galleryapp.tools.jobs', 'ERROR'):
+                    job = run_job(claim_jobs(1)[0])
+        self.assertEqual((job.status, job.attempts), ('failed', MAX_ATTEMPTS))
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.status, 'failed')
+
+    def test_unknown_job_type_fails_immediately(self):
+        enqueue_image_jobs([self.image], ['missing'])
+        with self.assertLogs('galleryapp.tools.jobs', 'ERROR'):
+            job = run_job(claim_jobs(1)[0])
+        self.assertEqual((job.status, job.attempts), ('failed', 1))
+
+    def test_requeue_stale_jobs(self):
+        enqueue_image_jobs([self.image], ['renditions'])
+        job = claim_jobs(1)[0]
+        self.assertEqual(requeue_stale_jobs(600), 0)
+        ImageJob.objects.filter(id=job.id).update(updated_at=timezone.now() - timedelta(minutes=20))
+        self.assertEqual(requeue_stale_jobs(600), 1)
+        self.assertEqual([claimed.id for claimed in claim_jobs(1)], [job.id])
+
+
+class BulkUploadTests(TemporaryMediaRootMixin, TestCase):
+    """批量上传：整批校验后在一个事务内写入"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+        cls.tags = [Tag.objects.create(name=f'bulk-{i}', uploaded_by=cls.user) for i in range(2)]
+        cls.other_tag = Tag.objects.create(name='other', uploaded_by=CustomUser.objects.create(username='other'))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_upload(self):
+        files = [make_image_file(f'{i}.jpg', color=(i * 40, 0, 0)) for i in range(3)]
+        tag_ids = [tag.id for tag in self.tags] + [self.other_tag.id]
+        response = self.client.post('/api/images/upload/bulk/', {'file': files, 'title': 'bulk',
+                                                                 'tags': json.dumps(tag_ids)})
+        self.assertEqual(response.status_code, 201, response.content)
+        data = response.json()
+        self.assertEqual([result['status'] for result in data['results']], ['created'] * 3)
+        self.assertEqual([image['id'] for image in data['uploaded_images']],
+                         list(Image.objects.order_by('id').values_list('id', flat=True)))
+
+        # 其他用户的标签被忽略；标签关系、后台任务和搜索索引都已批量写入
+        for image in Image.objects.all():
+            self.assertEqual(set(image.tags.all()), set(self.tags))
+            self.assertEqual(image.status, 'pending')
+        self.assertEqual(ImageJob.objects.count(), 3 * len(DEFAULT_IMAGE_JOBS))
+        self.assertEqual(self.client.get('/api/images/', {'keyword': 'bulk'}).json()['count'], 3)
+
+    def stored_files(self):
+        return {name for _, _, names in os.walk(self.media_root) for name in names}
+
+    def test_bulk_upload_without_returned_primary_keys(self):
+        # MySQL 的 bulk_create 不回填主键，逐行插入后标签关系仍然对应正确的图片
+        files = [make_image_file(f'{i}.jpg', color=(i * 40, 0, 0)) for i in range(3)]
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            response = self.client.post('/api/images/upload/bulk/', {'file': files, 'title': 'bulk',
+                                                                     'tags': json.dumps([self.tags[0].id])})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual([image['id'] for image in response.json()['uploaded_images']],
+                         list(Image.objects.order_by('id').values_list('id', flat=True)))
+        for image in Image.objects.all():
+            self.assertEqual(list(image.tags.all()), [self.tags[0]])
+
+    def test_rollback_deletes_stored_files(self):
+        existing = make_image_file('existing.jpg', color=(0, 0, 200))
+        self.client.post('/api/images/upload/bulk/', {'file': [existing], 'title': 'existing'})
+        before = self.stored_files()
+        files = [make_image_file('new.jpg', color=(0, 200, 0)), make_image_file('dup.jpg', color=(0, 0, 200))]
+        with mock.patch('galleryapp.views.enqueue_image_jobs', side_effect=RuntimeError('queue down')), \
+                self.assertRaises(RuntimeError):
+            self.client.post('/api/images/upload/bulk/', {'file': files, 'title': 'bulk'})
+        # 新写入的文件随事务回滚删除，已有的去重文件保留
+        self.assertEqual(self.stored_files(), before)
+        self.assertIn(os.path.basename(ImageBlob.objects.get().file), before)
+        self.assertEqual(Image.objects.count(), 1)
+
+    def test_invalid_file_rejects_whole_batch(self):
+        files = [make_image_file('ok.jpg'), SimpleUploadedFile('bad.jpg', b'not an image', content_type='image/jpeg')]
+        response = self.client.post('/api/images/upload/bulk/', {'file': files})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['valid', 'invalid'])
+        self.assertFalse(Image.objects.exists())
+        self.assertFalse(ImageBlob.objects.exists())
+
+
+class ChunkedUploadTests(TemporaryMediaRootMixin, TestCase):
+    """分片断点续传：偏移量校验、断线续传和完成上传"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+        cls.tag = Tag.objects.create(name='chunked', uploaded_by=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.content = make_exif_jpeg(size=(300, 200))
+
+    def create_session(self):
+        response = self.client.post('/api/images/upload/sessions/',
+                                    {'filename': 'big.jpg', 'total_size': len(self.content), 'title': 'chunked',
+                                     'tags': [self.tag.id]}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return f"/api/images/upload/sessions/{response.json()['upload_id']}/"
+
+    def put_chunk(self, url, offset, data):
+        return self.client.put(f'{url}?offset={offset}', data, content_type='application/octet-stream')
+
+    def test_upload_in_chunks(self):
+        url = self.create_session()
+        middle = len(self.content) // 2
+        self.assertEqual(self.put_chunk(url, 0, self.content[:middle]).json()['offset'], middle)
+        self.assertEqual(self.client.get(url).json()['offset'], middle)
+
+        # 偏移量不一致时返回服务端的偏移量，不写入数据
+        response = self.put_chunk(url, 0, self.content[:middle])
+        self.assertEqual((response.status_code, response.json()['offset']), (409, middle))
+        self.assertEqual(self.put_chunk(url, middle, self.content[middle:] + b'extra').status_code, 400)
+        response = self.client.post(f'{url}complete/')
+        self.assertEqual((response.status_code, response.json()['offset']), (409, middle))
+
+        self.assertEqual(self.put_chunk(url, middle, self.content[middle:]).json()['offset'], len(self.content))
+        response = self.client.post(f'{url}complete/')
+        self.assertEqual(response.status_code, 201, response.content)
+        image = Image.objects.get(id=response.json()['id'])
+        self.assertEqual(image.file.read(), self.content)
+        self.assertEqual(list(image.tags.all()), [self.tag])
+        # 完成请求重试时返回同一张图片
+        self.assertEqual(self.client.post(f'{url}complete/').json()['id'], image.id)
+
+    def test_resume_after_interrupted_chunk(self):
+        url = self.create_session()
+        session = UploadSession.objects.get()
+        # 连接中断：声明的长度是整个文件，但只收到前 100 字节
+        self.assertEqual(write_chunk(session, io.BytesIO(self.content[:100]), 0, len(self.content)), 100)
+        self.assertEqual(self.client.get(url).json()['offset'], 100)
+        self.assertEqual(self.put_chunk(url, 100, self.content[100:]).json()['offset'], len(self.content))
+        response = self.client.post(f'{url}complete/')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Image.objects.get().file.read(), self.content)
+
+    def test_abort(self):
+        url = self.create_session()
+        self.put_chunk(url, 0, self.content[:100])
+        path = get_partial_path(UploadSession.objects.get())
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.put_chunk(url, 100, self.content[100:]).status_code, 410)
+
+    def test_invalid_image_aborts_session(self):
+        self.content = b'not an image' * 10
+        url = self.create_session()
+        self.put_chunk(url, 0, self.content)
+        self.assertEqual(self.client.post(f'{url}complete/').status_code, 400)
+        self.assertEqual(UploadSession.objects.get().status, 'aborted')
+        self.assertFalse(Image.objects.exists())
+
+
+class DeduplicationTests(TemporaryMediaRootMixin, TestCase):
+    """按内容哈希去重：引用计数和最后一个引用释放时删除文件"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+
+    def store(self, upload):
+        with transaction.atomic():
+            name, digest = store_image_file(upload)
+            return Image.objects.create(title='dedup', file=name, content_hash=digest, uploaded_by=self.user)
+
+    def release(self, images):
+        values = Image.objects.filter(id__in=[image.id for image in images]).values(
+            'file', 'content_hash', 'thumbnail', 'preview')
+        with self.captureOnCommitCallbacks(execute=True):
+            return release_image_files(list(values))
+
+    def test_same_content_stored_once(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for name in ('a.jpg', 'b.jpg'):
+            response = client.post('/api/images/upload/', {'file': make_image_file(name), 'title': name})
+            self.assertEqual(response.status_code, 201, response.content)
+        first, second = Image.objects.order_by('id')
+        self.assertEqual(first.file.name, second.file.name)
+        blob = ImageBlob.objects.get()
+        self.assertEqual((blob.ref_count, blob.file, blob.sha256), (2, first.file.name, first.content_hash))
+
+        self.store(make_image_file('c.jpg', color='black'))
+        self.assertEqual(ImageBlob.objects.count(), 2)
+
+    def test_release_deletes_file_with_last_reference(self):
+        first = self.store(make_image_file('a.jpg'))
+        second = self.store(make_image_file('b.jpg'))
+        self.assertEqual(self.release([first]), [])
+        self.assertEqual(ImageBlob.objects.get().ref_count, 1)
+        self.assertTrue(default_storage.exists(second.file.name))
+
+        self.assertEqual(self.release([second]), [second.file.name])
+        self.assertFalse(ImageBlob.objects.exists())
+        self.assertFalse(default_storage.exists(second.file.name))
+
+    def test_release_many_references_at_once(self):
+        images = [self.store(make_image_file(f'{i}.jpg')) for i in range(3)]
+        self.release(images[:2])
+        self.assertEqual(ImageBlob.objects.get().ref_count, 1)
+
+    def test_rollback_keeps_ref_count(self):
+        image = self.store(make_image_file('a.jpg'))
+        with transaction.atomic():
+            store_image_file(make_image_file('b.jpg'))
+            transaction.set_rollback(True)
+        self.assertEqual(ImageBlob.objects.get().ref_count, 1)
+        self.assertTrue(default_storage.exists(image.file.name))
+
+    def test_legacy_files_without_hash(self):
+        name = default_storage.save('images/legacy.jpg', make_image_file())
+        image = Image.objects.create(title='legacy', file=name, uploaded_by=self.user)
+        self.assertEqual(self.release([image]), [name])
+        self.assertFalse(default_storage.exists(name))
+
+
+class PerceptualHashTests(TestCase):
+    """感知哈希：分段索引查找与完整哈希距离的一致性"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+        cls.base_hash = 0xF0E1D2C3B4A59687  # 最高位为 1，存储时为负数
+
+    def create_hashed_image(self, value, user=None):
+        bands = dict(zip(BAND_FIELDS, split_bands(value)))
+        return Image.objects.create(title=f'{value:016x}', file='images/phash.jpg', uploaded_by=user or self.user,
+                                    phash=to_signed(value), **bands)
+
+    def flip(self, *bits):
+        value = self.base_hash
+        for bit in bits:
+            value ^= 1 << bit
+        return value
+
+    def test_signed_storage_round_trip(self):
+        image = self.create_hashed_image(self.base_hash)
+        image.refresh_from_db()
+        self.assertLess(image.phash, 0)
+        self.assertEqual(to_unsigned(image.phash), self.base_hash)
+        self.assertEqual(split_bands(self.base_hash), [0x9687, 0xB4A5, 0xD2C3, 0xF0E1])
+
+    def test_band_lookup(self):
+        base = self.create_hashed_image(self.base_hash)
+        same_band = self.create_hashed_image(self.flip(0, 1, 2))  # 距离 3，集中在一段
+        spread = self.create_hashed_image(self.flip(0, 16, 32, 48, 1, 17, 33))  # 距离 7，第四段只差 1 位
+        self.create_hashed_image(self.flip(0, 1, 16, 17, 32, 33, 48, 49))  # 距离 8，超出范围
+        self.create_hashed_image(self.base_hash, user=CustomUser.objects.create(username='other'))
+
+        matches = find_similar_images(base, MAX_DISTANCE)
+        self.assertEqual([(image.id, distance) for image, distance in matches], [(same_band.id, 3), (spread.id, 7)])
+        self.assertEqual([image.id for image, _ in find_similar_images(base, 3)], [same_band.id])
+        self.assertEqual(len(find_similar_images(base, MAX_DISTANCE, limit=1)), 1)
+
+    def test_band_lookup_matches_brute_force(self):
+        rng = random.Random(42)
+        base = self.create_hashed_image(self.base_hash)
+        for _ in range(200):
+            self.create_hashed_image(self.flip(*rng.sample(range(64), rng.randint(0, 12))))
+        others = Image.objects.exclude(id=base.id)
+        for max_distance in (0, 3, 5, MAX_DISTANCE):
+            expected = sorted((hamming_distance(base.phash, image.phash), image.id) for image in others
+                              if hamming_distance(base.phash, image.phash) <= max_distance)
+            found = [(distance, image.id) for image, distance in find_similar_images(base, max_distance, limit=1000)]
+            self.assertEqual(found, expected, max_distance)
+
+    def test_compute_phash(self):
+        def phash_of(image):
+            buffer = io.BytesIO()
+            image.save(buffer, 'PNG')
+            buffer.seek(0)
+            return compute_phash(buffer)
+
+        pattern = PILImage.new('L', (320, 240), 30)
+        draw = ImageDraw.Draw(pattern)
+        draw.rectangle((20, 30, 150, 200), fill=220)
+        draw.ellipse((180, 40, 300, 140), fill=120)
+        original = phash_of(pattern)
+        # 缩放后视觉上相同，镜像后完全不同
+        self.assertLessEqual(hamming_distance(original, phash_of(pattern.resize((160, 120)))), 2)
+        self.assertLessEqual(hamming_distance(original, phash_of(pattern.convert('RGB').resize((640, 480)))), 2)
+        self.assertGreater(hamming_distance(original, phash_of(pattern.transpose(PILImage.Transpose.FLIP_LEFT_RIGHT))),
+                           MAX_DISTANCE)
+
+    def test_similar_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        pending = Image.objects.create(title='pending', file='images/pending.jpg', uploaded_by=self.user)
+        self.assertEqual(client.get(f'/api/images/{pending.id}/similar/').status_code, 409)
+        base = self.create_hashed_image(self.base_hash)
+        near = self.create_hashed_image(self.flip(5))
+        self.assertEqual(client.get(f'/api/images/{base.id}/similar/?distance=8').status_code, 400)
+        results = client.get(f'/api/images/{base.id}/similar/').json()['results']
+        self.assertEqual([(item['id'], item['distance']) for item in results], [(near.id, 1)])
+
+
+class SearchTests(TestCase):
+    """搜索分词、前缀匹配和相关度排序"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+        for title in ('Sunset at the beach', 'photo2024', 'IMG_1234', '海边日落'):
+            Image.objects.create(title=title, file='images/search.jpg', uploaded_by=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, keyword):
+        response = self.client.get('/api/images/', {'keyword': keyword})
+        self.assertEqual(response.status_code, 200)
+        return [image['title'] for image in response.json()['results']]
+
+    def test_tokenize(self):
+        tokens = tokenize('Sunset ＩＭＧ_1234 海边日落')
+        for token in ('s', 'sun', 'sunset', 'img', '12', '1234', '海', '日落', '海边'):
+            self.assertIn(token, tokens)
+        self.assertEqual(tokenize('Sunset photo2024 海边日落', for_query=True),
+                         ['sunset', 'photo', '2024', '海边', '边日', '日落'])
+        self.assertEqual(tokenize('日', for_query=True), ['日'])
+
+    def test_prefix_search(self):
+        self.assertEqual(self.search('sun'), ['Sunset at the beach'])
+        self.assertEqual(self.search('photo'), ['photo2024'])
+        self.assertEqual(self.search('img'), ['IMG_1234'])
+        self.assertEqual(self.search('2024'), ['photo2024'])
+        self.assertEqual(self.search('photo2024'), ['photo2024'])
+        self.assertEqual(self.search('日落'), ['海边日落'])
+        # 所有查询词都必须命中
+        self.assertEqual(self.search('sun img'), [])
+
+    def test_ranking_by_field_weight(self):
+        tag = Tag.objects.create(name='mountain', uploaded_by=self.user)
+        in_description = Image.objects.create(title='a', description='mountain', file='images/a.jpg',
+                                              uploaded_by=self.user)
+        in_tag = Image.objects.create(title='b', file='images/b.jpg', uploaded_by=self.user)
+        in_tag.tags.set([tag])
+        Image.objects.create(title='mountain lake', file='images/c.jpg', uploaded_by=self.user)
+        self.assertEqual(self.search('mount'), ['mountain lake', 'b', 'a'])
+
+        # 标签改名后重建索引
+        tag.name = 'river'
+        tag.save()
+        self.assertEqual(self.search('riv'), ['b'])
+        self.assertNotIn('b', self.search('mount'))
+        self.assertNotIn(in_description.title, self.search('riv'))
+
+
+class KeysetPaginationTests(TestCase):
+    """游标分页：游标编码、前后翻页和并发插入时不重复"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+        created_at = timezone.now()
+        for i in range(7):
+            Image.objects.create(title=f'page {i}', file=f'images/{i}.jpg', uploaded_by=cls.user)
+        # 前四张创建时间相同，依靠 id 区分先后
+        Image.objects.filter(title__in=[f'page {i}' for i in range(4)]).update(created_at=created_at)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, link='next'):
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([image['id'] for image in data['results']])
+            url = data[link]
+        return pages
+
+    def test_cursor_round_trip(self):
+        paginator = KeysetPagination()
+        request = Request(APIRequestFactory().get('/'))
+        paginator.get_page_queryset(Image.objects.all(), request)
+        image = Image.objects.first()
+        cursor = paginator.encode_cursor(image, reverse=True)
+        self.assertRegex(cursor, r'^[A-Za-z0-9_-]+=*$')  # URL 安全的 base64
+        decoded = paginator.decode_cursor(Request(APIRequestFactory().get('/', {'cursor': cursor})))
+        self.assertEqual(decoded, ([image.created_at, image.id], True))
+
+        for invalid in ('not-base64!', base64.urlsafe_b64encode(b'{"v": [1]}').decode(),
+                        base64.urlsafe_b64encode(b'{"v": ["yesterday", 1]}').decode()):
+            self.assertEqual(self.client.get('/api/images/', {'cursor': invalid}).status_code, 404, invalid)
+
+    def test_walk_forward_and_back(self):
+        expected = list(Image.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        pages = self.walk('/api/images/?pagination=cursor&page_size=3')
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+        # 从最后一页沿 previous 链接翻回第一页
+        last = self.client.get('/api/images/?pagination=cursor&page_size=3').json()
+        last = self.client.get(self.client.get(last['next']).json()['next']).json()
+        self.assertIsNone(last['next'])
+        back = self.walk(last['previous'], link='previous')
+        self.assertEqual(back, pages[1::-1])
+
+    def test_no_duplicates_after_insert(self):
+        first = self.client.get('/api/images/?pagination=cursor&page_size=3').json()
+        Image.objects.create(title='newer', file='images/newer.jpg', uploaded_by=self.user)
+        rest = self.walk(first['next'])
+        ids = [image['id'] for image in first['results']] + sum(rest, [])
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(len(ids), 7)
+
+    def test_count_only_when_requested(self):
+        self.assertIsNone(self.client.get('/api/images/?pagination=cursor').json()['count'])
+        self.assertEqual(self.client.get('/api/images/?pagination=cursor&with_count=1').json()['count'], 7)
+
+
+class QueryPlanAssertionsMixin:
+    """
+    根据数据库的 EXPLAIN 输出检查查询计划：不允许全表扫描和额外的排序（filesort）。
+    支持 SQLite（开发/测试）和 MySQL（生产）。
+    """
+
+    def get_plan(self, queryset):
+        return queryset.explain()
+
+    def assertIndexedPlan(self, queryset, allow_filesort=False):
+        plan = self.get_plan(queryset)
+        problems = []
+        if connection.vendor == 'sqlite':
+            for line in plan.splitlines():
+                # SEARCH 表示走索引定位，SCAN 表示扫描整张表
+                if re.search(r'\bSCAN \w+$', line) or re.search(r'\bSCAN \w+ USING (COVERING )?INDEX', line):
+                    problems.append(f'全表扫描: {line}')
+                if 'USE TEMP B-TREE FOR ORDER BY' in line and not allow_filesort:
+                    problems.append(f'filesort: {line}')
+        elif connection.vendor == 'mysql':
+            for line in plan.splitlines()[1:]:
+                columns = line.split()
+                # 列顺序: id select_type table partitions type possible_keys key ...
+                if len(columns) > 4 and columns[4] == 'ALL':
+                    problems.append(f'全表扫描: {line}')
+                if 'Using filesort' in line and not allow_filesort:
+                    problems.append(f'filesort: {line}')
+        if problems:
+            self.fail('查询计划退化:\n' + '\n'.join(problems) + '\n\n完整计划:\n' + plan)
+
+
+class ListingQueryPlanTests(QueryPlanAssertionsMixin, TestCase):
+    """热点列表查询的执行计划回归测试"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+        other = CustomUser.objects.create(username='other')
+        cls.tags = [Tag.objects.create(name=f'tag-{i}', uploaded_by=cls.user) for i in range(3)]
+        for owner in (cls.user, other):
+            for i in range(20):
+                image = Image.objects.create(title=f'{owner.username} 图片 {i}', uploaded_by=owner,
+                                             file=f'images/{owner.username}-{i}.jpg')
+                if owner == cls.user:
+                    image.tags.set(cls.tags[:i % 3 + 1])
+        cls.share_link = ShareLink.objects.create(share_code='plan-test',
+                                                  expire_time=timezone.now() + timedelta(days=1))
+        cls.share_link.images.set(Image.objects.filter(uploaded_by=cls.user)[:5])
+
+    def make_request(self, query=''):
+        request = Request(APIRequestFactory().get(f'/api/images/{query}'))
+        request.user = self.user
+        return request
+
+    def test_image_list_uses_user_created_index(self):
+        self.assertIndexedPlan(UserImageListView().get_queryset(self.make_request()))
+
+    def test_image_list_tag_filter(self):
+        tag_ids = '&'.join(f'tags={tag.id}' for tag in self.tags[:2])
+        self.assertIndexedPlan(UserImageListView().get_queryset(self.make_request(f'?{tag_ids}')))
+
+    def test_image_list_keyword_search(self):
+        # 检索结果按相关度排序，只对已命中的少量行排序，因此允许排序
+        queryset = UserImageListView().get_queryset(self.make_request('?keyword=图片'))
+        self.assertIndexedPlan(queryset, allow_filesort=True)
+
+    def test_image_list_keyset_page(self):
+        queryset = UserImageListView().get_queryset(self.make_request())
+        paginator = KeysetPagination()
+        first_page = paginator.paginate_queryset(queryset, self.make_request('?pagination=cursor'))
+        cursor = paginator.encode_cursor(first_page[-1])
+        paginator.paginate_queryset(queryset, self.make_request(f'?cursor={cursor}'))
+        self.assertIndexedPlan(paginator.page_queryset)
+
+    def test_image_list_metadata_filters(self):
+        # 拍摄时间范围 + 宽度下限（如“三月拍摄、宽于 3000px”）走 uploaded_by 开头的元数据索引
+        for query in ('?taken_after=2024-03-01&taken_before=2024-04-01&min_width=3000',
+                      '?orientation=landscape&taken_after=2024-03-01',
+                      '?camera_make=Canon&camera_model=EOS R5',
+                      '?min_height=2000&max_height=4000'):
+            queryset = UserImageListView().get_queryset(self.make_request(query))
+            self.assertIndexedPlan(queryset, allow_filesort=True)
+
+    def test_tag_list(self):
+        self.assertIndexedPlan(UserTagListView().get_queryset(self.make_request()))
+
+    def test_share_link_list(self):
+        # 先通过索引找到用户的分享链接，再对这部分链接排序
+        queryset = ManageShareLinksView().get_queryset(self.make_request())
+        self.assertIndexedPlan(queryset, allow_filesort=True)
+
+    def test_share_code_lookup(self):
+        self.assertIndexedPlan(ShareLink.objects.filter(share_code='plan-test'))
+
+    def test_image_detail_lookup(self):
+        self.assertIndexedPlan(Image.objects.filter(id=1, uploaded_by=self.user))
+
+
+class QueryCountAssertionsMixin:
+    """检查接口的 SQL 数量不随返回条数增长（没有 N+1 查询）"""
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, small_url, large_url):
+        small, large = self.count_queries(small_url), self.count_queries(large_url)
+        self.assertEqual(small, large, f'{large_url} 执行了 {large} 条 SQL，{small_url} 只执行了 {small} 条')
+
+
+class ListingQueryCountTests(QueryCountAssertionsMixin, TestCase):
+    """各列表接口的 SQL 数量回归测试"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+        cls.tags = [Tag.objects.create(name=f'tag-{i}', uploaded_by=cls.user) for i in range(2)]
+        for i in range(12):
+            image = Image.objects.create(title=f'image {i}', file=f'images/{i}.jpg', uploaded_by=cls.user)
+            image.tags.set(cls.tags)
+        cls.share_link = ShareLink.objects.create(share_code='count-test',
+                                                  expire_time=timezone.now() + timedelta(days=1))
+        cls.share_link.images.set(Image.objects.all()[:5])
+        cls.large_share_link = ShareLink.objects.create(share_code='count-test-large',
+                                                        expire_time=timezone.now() + timedelta(days=1))
+        cls.large_share_link.images.set(Image.objects.all())
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_tag_list(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/tags/').status_code, 200)
+
+    def test_image_detail(self):
+        image = Image.objects.first()
+        with self.assertNumQueries(3):  # 图库版本 + 图片 + 标签
+            self.assertEqual(self.client.get(f'/api/images/{image.id}/').status_code, 200)
+
+    def test_image_list(self):
+        with self.assertNumQueries(4):  # 图库版本 + COUNT + 图片 + 批量取标签
+            self.assertEqual(self.client.get('/api/images/').status_code, 200)
+
+    def test_image_list_independent_of_page_size(self):
+        self.assertConstantQueries('/api/images/?page_size=2', '/api/images/?page_size=12')
+        self.assertConstantQueries('/api/images/?page_size=2&embed=tags', '/api/images/?page_size=12&embed=tags')
+        self.assertConstantQueries('/api/images/?pagination=cursor&page_size=2',
+                                   '/api/images/?pagination=cursor&page_size=12')
+
+    def test_image_list_embeds_tag_names(self):
+        response = self.client.get('/api/images/?embed=tags&page_size=1')
+        self.assertEqual(response.json()['results'][0]['tag_details'],
+                         [{'id': tag.id, 'name': tag.name} for tag in self.tags])
+        self.assertNotIn('tag_details', self.client.get('/api/images/?page_size=1').json()['results'][0])
+
+    def test_access_share_link(self):
+        with self.assertNumQueries(4):  # 分享链接 + 图片 + 批量取标签 + 图库版本
+            self.assertEqual(self.client.get('/api/share/count-test/').status_code, 200)
+        cache.clear()
+        self.assertConstantQueries('/api/share/count-test/', '/api/share/count-test-large/')
+
+    def test_share_link_list(self):
+        with self.assertNumQueries(3):  # COUNT + 分享链接 + 批量取图片
+            self.assertEqual(self.client.get('/api/images/share/manage/').status_code, 200)
+
+
+@override_settings(SHARE_CACHE_ALLOW_LOCAL=True)
+class ShareLinkCacheTests(TestCase):
+    """分享链接缓存的命中与失效"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+        cls.image = Image.objects.create(title='shared', file='images/shared.jpg', uploaded_by=cls.user)
+        cls.share_link = ShareLink.objects.create(share_code='cache-test',
+                                                  expire_time=timezone.now() + timedelta(days=1))
+        cls.share_link.images.set([cls.image])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cached_share_link_skips_database(self):
+        self.client.get('/api/share/cache-test/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/share/cache-test/')
+        self.assertEqual(response.json()['images'][0]['title'], 'shared')
+
+    def test_unknown_share_code_is_cached(self):
+        self.assertEqual(self.client.get('/api/share/unknown/').status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/share/unknown/').status_code, 404)
+
+    def test_image_edit_invalidates(self):
+        self.client.get('/api/share/cache-test/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/images/{self.image.id}/edit/', {'title': 'renamed'}, format='json')
+        self.assertEqual(self.client.get('/api/share/cache-test/').json()['images'][0]['title'], 'renamed')
+
+    def test_revoke_and_delete_invalidate(self):
+        self.client.get('/api/share/cache-test/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/images/share/manage/', {'share_codes': ['cache-test']}, format='json')
+        self.assertEqual(self.client.get('/api/share/cache-test/').status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete('/api/images/share/manage/delete/', {'share_codes': ['cache-test']}, format='json')
+        self.assertEqual(self.client.get('/api/share/cache-test/').status_code, 404)
+
+    def test_image_delete_invalidates(self):
+        self.client.get('/api/share/cache-test/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/images/bulk_delete/', {'image_ids': [self.image.id]}, format='json')
+        self.assertEqual(self.client.get('/api/share/cache-test/').json()['images'], [])
+
+    def test_invalidated_after_commit(self):
+        self.client.get('/api/share/cache-test/')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post('/api/images/share/manage/', {'share_codes': ['cache-test']}, format='json')
+            self.assertIsNotNone(cache.get(get_cache_key('cache-test')))
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(get_cache_key('cache-test')))
+
+    def test_password_not_cached(self):
+        ShareLink.objects.create(share_code='protected', is_protected=True, password='secret',
+                                 expire_time=timezone.now() + timedelta(days=1)).images.set([self.image])
+        self.assertEqual(self.client.get('/api/share/protected/?password=secret').status_code, 200)
+        self.assertEqual(self.client.get('/api/share/protected/?password=wrong').status_code, 403)
+        payload = cache.get(get_cache_key('protected'))
+        self.assertNotIn('password', payload)
+        self.assertNotIn('secret', repr(payload))
+
+    @override_settings(SHARE_CACHE_ALLOW_LOCAL=False)
+    def test_local_cache_not_used_by_default(self):
+        # 进程内缓存无法在其他 worker 中失效，分享内容直接查库
+        self.client.get('/api/share/cache-test/')
+        self.assertIsNone(cache.get(get_cache_key('cache-test')))
+        with self.assertNumQueries(4):
+            self.assertEqual(self.client.get('/api/share/cache-test/').status_code, 200)
+
+
+class ConditionalRequestTests(TestCase):
+    """ETag / Last-Modified 条件请求"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.image = Image.objects.create(title='photo', file='images/photo.jpg', uploaded_by=cls.user)
+        cls.share_link = ShareLink.objects.create(share_code='etag-test', is_protected=True, password='secret',
+                                                  expire_time=timezone.now() + timedelta(days=1))
+        cls.share_link.images.set([cls.image])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_image_list_not_modified(self):
+        response = self.client.get('/api/images/')
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):  # 只查询图库版本
+            response = self.client.get('/api/images/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_edit_changes_etag(self):
+        etag = self.client.get(f'/api/images/{self.image.id}/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/images/{self.image.id}/edit/', {'title': 'renamed'}, format='json')
+        response = self.client.get(f'/api/images/{self.image.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'renamed')
+
+    def test_version_bumped_after_commit(self):
+        # 版本号存放在数据库中，事务提交前其他进程看到的仍是旧版本
+        version = get_library_version(self.user.id)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.image.title = 'renamed'
+            self.image.save()
+        self.assertEqual(get_library_version(self.user.id), version)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_library_version(self.user.id), version)
+
+    def test_etag_depends_on_query(self):
+        self.assertNotEqual(self.client.get('/api/images/?page_size=1')['ETag'],
+                            self.client.get('/api/images/?page_size=2')['ETag'])
+
+    def test_share_link_not_modified_requires_password(self):
+        etag = self.client.get('/api/share/etag-test/?password=secret')['ETag']
+        response = self.client.get('/api/share/etag-test/?password=secret', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/api/share/etag-test/?password=wrong', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 403)
+
+
+class MediaFileTests(TemporaryMediaRootMixin, TestCase):
+    """媒体文件访问：Range、缓存头、代理发送和权限校验"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(cls.media_root, 'images'))
+        with open(os.path.join(cls.media_root, 'images', 'photo.jpg'), 'wb') as f:
+            f.write(bytes(range(256)) * 4)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+        cls.image = Image.objects.create(title='photo', file='images/photo.jpg', uploaded_by=cls.user)
+        cls.share_link = ShareLink.objects.create(share_code='media-test',
+                                                  expire_time=timezone.now() + timedelta(days=1))
+        cls.share_link.images.set([cls.image])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_full_file(self):
+        response = self.client.get('/media/images/photo.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(256)) * 4)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('max-age', response['Cache-Control'])
+        response = self.client.get('/media/images/photo.jpg', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        response = self.client.get('/media/images/photo.jpg', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+        response = self.client.get('/media/images/photo.jpg', HTTP_RANGE='bytes=-6')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(250, 256)))
+        response = self.client.get('/media/images/photo.jpg', HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        # If-Range 不匹配时返回完整文件
+        response = self.client.get('/media/images/photo.jpg', HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_path_traversal(self):
+        self.assertEqual(self.client.get('/media/../sugallery/settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/images/missing.jpg').status_code, 404)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_accel_redirect(self):
+        response = self.client.get('/media/images/photo.jpg')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/images/photo.jpg')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_REQUIRE_AUTH=True)
+    def test_private_media(self):
+        self.assertEqual(self.client.get('/media/images/photo.jpg').status_code, 403)
+        self.assertEqual(self.client.get('/media/images/photo.jpg?share=media-test').status_code, 200)
+        self.assertEqual(self.client.get('/media/images/photo.jpg?share=unknown').status_code, 403)
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/media/images/photo.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        response.close()
+        self.client.force_authenticate(CustomUser.objects.create(username='other'))
+        self.assertEqual(self.client.get('/media/images/photo.jpg').status_code, 403)
+
+    def test_invalid_authorization_header(self):
+        # 公开文件忽略无效的令牌
+        response = self.client.get('/media/images/photo.jpg', HTTP_AUTHORIZATION='Bearer stale-token')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        with override_settings(MEDIA_REQUIRE_AUTH=True):
+            response = self.client.get('/media/images/photo.jpg',
+                                       HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+            self.assertEqual(response.status_code, 200)
+            response.close()
+            response = self.client.get('/media/images/photo.jpg', HTTP_AUTHORIZATION='Bearer stale-token')
+            self.assertEqual(response.status_code, 403)
+
+
+class ShardedStorageTests(TemporaryMediaRootMixin, TestCase):
+    """分片存储与存储迁移"""
+
+    def test_sharded_names(self):
+        storage = ShardedFileSystemStorage()
+        name = storage.generate_filename('images/photo.jpg')
+        self.assertRegex(name, r'^images/[0-9a-f]{2}/[0-9a-f]{2}/photo\.jpg$')
+        self.assertEqual(storage.generate_filename(name), name)
+
+    def test_dedup_files_are_content_addressed(self):
+        user = CustomUser.objects.create(username='owner')
+        with transaction.atomic():
+            name, digest = store_image_file(SimpleUploadedFile('Photo.JPG', b'content'))
+        Image.objects.create(title='photo', file=name, content_hash=digest, uploaded_by=user)
+        self.assertRegex(name, rf'^images/[0-9a-f]{{2}}/[0-9a-f]{{2}}/{digest}\.jpg$')
+        self.assertTrue(default_storage.exists(name))
+
+    def test_migrate_flat_files(self):
+        user = CustomUser.objects.create(username='owner')
+        os.makedirs(os.path.join(self.media_root, 'images'), exist_ok=True)
+        with open(os.path.join(self.media_root, 'images', 'legacy.jpg'), 'wb') as f:
+            f.write(b'legacy')
+        image = Image.objects.create(title='legacy', file='images/legacy.jpg', content_hash='a' * 64,
+                                     uploaded_by=user)
+        ImageBlob.objects.create(sha256='a' * 64, file='images/legacy.jpg', size=6, ref_count=1)
+
+        call_command('migrate_media_storage', stdout=io.StringIO())
+        image.refresh_from_db()
+        self.assertRegex(image.file.name, r'^images/[0-9a-f]{2}/[0-9a-f]{2}/legacy\.jpg$')
+        self.assertEqual(ImageBlob.objects.get().file, image.file.name)
+        self.assertEqual(default_storage.open(image.file.name).read(), b'legacy')
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'images', 'legacy.jpg')))
+
+
+class PresignedUploadTests(TemporaryMediaRootMixin, TestCase):
+    """直传上传：签名 URL、上传接收服务和确认接口"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = make_upload_receiver('127.0.0.1', 0)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url_override = override_settings(
+            PRESIGNED_UPLOAD_URL=f'http://127.0.0.1:{cls.server.server_port}/upload/')
+        cls.url_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.url_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+        cls.tag = Tag.objects.create(name='direct', uploaded_by=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def put(self, url, data):
+        try:
+            with urlopen(UrlRequest(url, data=data, method='PUT')) as response:
+                return response.status
+        except HTTPError as e:
+            return e.code
+
+    def create_intent(self, size=4):
+        response = self.client.post('/api/images/upload/intents/',
+                                    {'filename': 'photo.jpg', 'size': size, 'title': 'direct', 'tags': [self.tag.id]},
+                                    format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def test_upload_and_confirm(self):
+        content = make_exif_jpeg()
+        intent = self.create_intent(size=len(content))
+        confirm_url = f"/api/images/upload/intents/{intent['intent_id']}/confirm/"
+        self.assertEqual(self.client.post(confirm_url).status_code, 409)
+
+        self.assertEqual(intent['upload']['method'], 'PUT')
+        self.assertEqual(self.put(intent['upload']['url'], content), 201)
+        self.assertEqual(self.put(intent['upload']['url'], content), 409)
+
+        response = self.client.post(confirm_url)
+        self.assertEqual(response.status_code, 201, response.content)
+        image = Image.objects.get(id=response.json()['id'])
+        self.assertEqual(image.file.name, UploadIntent.objects.get().storage_name)
+        self.assertEqual(list(image.tags.all()), [self.tag])
+        # 重试确认返回同一张图片
+        self.assertEqual(self.client.post(confirm_url).json()['id'], image.id)
+
+    def test_duplicate_uploads_share_one_blob(self):
+        content = make_exif_jpeg()
+        images, storage_names = [], []
+        for _ in range(2):
+            intent = self.create_intent(size=len(content))
+            self.assertEqual(self.put(intent['upload']['url'], content), 201)
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(f"/api/images/upload/intents/{intent['intent_id']}/confirm/")
+            self.assertEqual(response.status_code, 201, response.content)
+            images.append(Image.objects.get(id=response.json()['id']))
+            storage_names.append(UploadIntent.objects.get(id=intent['intent_id']).storage_name)
+
+        blob = ImageBlob.objects.get()
+        self.assertEqual((blob.ref_count, blob.file), (2, storage_names[0]))
+        self.assertEqual({image.file.name for image in images}, {storage_names[0]})
+        self.assertEqual({image.content_hash for image in images}, {blob.sha256})
+        # 重复内容的直传对象已删除
+        self.assertFalse(default_storage.exists(storage_names[1]))
+
+    def test_rejects_tampered_or_oversized_uploads(self):
+        url = self.create_intent(size=4)['upload']['url']
+        self.assertEqual(self.put(url.replace('max_size=4', 'max_size=400'), b'data' * 100), 403)
+        self.assertEqual(self.put(url, b'data' * 100), 413)
+        self.assertEqual(self.put(url.replace('images/', 'avatars/'), b'data'), 403)
+
+    def test_rejects_invalid_image_content(self):
+        intent = self.create_intent()
+        self.assertEqual(self.put(intent['upload']['url'], b'data'), 201)
+        response = self.client.post(f"/api/images/upload/intents/{intent['intent_id']}/confirm/")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(default_storage.exists(UploadIntent.objects.get().storage_name))
+        self.assertFalse(Image.objects.exists())
+        # 文件已删除，可以重新上传
+        self.assertEqual(self.put(intent['upload']['url'], b'data'), 201)
+
+    @override_settings(CORS_ALLOWED_ORIGINS=['http://app.example.com'])
+    def test_cors_restricted_to_allowed_origins(self):
+        url = self.create_intent()['upload']['url']
+        for origin, allowed in (('http://app.example.com', 'http://app.example.com'), ('http://evil.example', None)):
+            with urlopen(UrlRequest(url, method='OPTIONS', headers={'Origin': origin})) as response:
+                self.assertEqual(response.headers.get('Access-Control-Allow-Origin'), allowed)
+
+    def test_rejects_non_image_names(self):
+        response = self.client.post('/api/images/upload/intents/', {'filename': 'run.sh', 'size': 4}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncViewTests(TestCase):
+    """异步只读接口与同步接口返回一致"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+        tag = Tag.objects.create(name='async', uploaded_by=cls.user)
+        for i in range(3):
+            Image.objects.create(title=f'图片 {i}', file=f'images/{i}.jpg', uploaded_by=cls.user).tags.set([tag])
+        cls.image = Image.objects.last()
+        cls.share_link = ShareLink.objects.create(share_code='async-test', is_protected=True, password='secret',
+                                                  expire_time=timezone.now() + timedelta(days=1))
+        cls.share_link.images.set(Image.objects.all())
+
+    def setUp(self):
+        cache.clear()
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+
+    def assertSameResponse(self, path):
+        sync_response = self.client.get(f'/api/{path}')
+        async_response = self.client.get(f'/api/async/{path}')
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.content.replace(b'/api/async/', b'/api/'), sync_response.content)
+        return async_response
+
+    def test_same_results_as_sync_views(self):
+        self.assertSameResponse('images/?page_size=2&embed=tags')
+        self.assertSameResponse('images/?page=2&page_size=2')
+        self.assertSameResponse('images/?pagination=cursor&page_size=2&with_count=1')
+        self.assertSameResponse('images/?keyword=图片')
+        self.assertSameResponse(f'images/{self.image.id}/')
+        self.assertSameResponse('share/async-test/?password=secret&embed=tags')
+        self.assertSameResponse('share/async-test/?password=wrong')
+
+    def test_not_modified(self):
+        etag = self.client.get('/api/async/images/')['ETag']
+        self.assertEqual(self.client.get('/api/async/images/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Image.objects.create(title='new', file='images/new.jpg', uploaded_by=self.user)
+        self.assertEqual(self.client.get('/api/async/images/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_authentication(self):
+        del self.client.defaults['HTTP_AUTHORIZATION']
+        self.assertEqual(self.client.get('/api/async/images/').status_code, 401)
+        self.assertEqual(self.client.get('/api/async/images/', HTTP_AUTHORIZATION='Bearer invalid').status_code, 401)
+        self.assertEqual(self.client.get('/api/async/share/async-test/?password=secret').status_code, 200)
+
+
+@override_settings(SHARE_CACHE_ALLOW_LOCAL=True)
+class PerformanceMetricsTests(TestCase):
+    """Server-Timing 响应头、请求日志和 Prometheus 指标"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+        cls.image = Image.objects.create(title='metrics', file='images/metrics.jpg', uploaded_by=cls.user)
+        cls.share_link = ShareLink.objects.create(share_code='metrics-test',
+                                                  expire_time=timezone.now() + timedelta(days=1))
+        cls.share_link.images.set([cls.image])
+
+    def setUp(self):
+        cache.clear()
+
+    def parse_server_timing(self, response):
+        return dict(re.findall(r'(\w+);(?:dur=[\d.]+;?)?(?:desc="([^"]*)")?', response['Server-Timing']))
+
+    def test_server_timing_and_log(self):
+        with self.assertLogs('galleryapp.requests', 'DEBUG') as logs:
+            first = self.client.get('/api/share/metrics-test/')
+            second = self.client.get('/api/share/metrics-test/')
+        self.assertNotEqual(self.parse_server_timing(first)['db'], '0 queries')
+        self.assertIn('1 misses', self.parse_server_timing(first)['cache'])
+        # 第二次命中分享缓存，不访问数据库
+        self.assertEqual(self.parse_server_timing(second)['db'], '0 queries')
+        self.assertIn(' 0 misses', self.parse_server_timing(second)['cache'])
+
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['view'], 'api/share/<str:share_code>/')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['db_queries'], 0)
+        self.assertEqual(record['response_bytes'], len(second.content))
+
+    def test_async_view_queries_counted(self):
+        response = self.client.get('/api/async/images/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(self.parse_server_timing(response)['db'], '0 queries')
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_endpoint(self):
+        self.client.get('/api/share/metrics-test/')
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE sugallery_request_duration_seconds histogram', body)
+        self.assertIn('sugallery_request_duration_seconds_count{method="GET",view="api/share/<str:share_code>/",'
+                      'status="200"}', body)
+        self.assertIn('sugallery_cache_lookups_total{view="api/share/<str:share_code>/",result="miss"}', body)
+        # 反向代理之后 REMOTE_ADDR 总是 127.0.0.1，只能靠令牌鉴权
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        with override_settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer None').status_code, 403)
+
+    def test_histogram_buckets(self):
+        histogram = Histogram('test_seconds', '测试', (0.1, 1), ('view',))
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value, view='a"b')
+        lines = render_metrics([histogram]).splitlines()
+        self.assertEqual(lines[2:], [
+            'test_seconds_bucket{view="a\\"b",le="0.1"} 2',
+            'test_seconds_bucket{view="a\\"b",le="1.0"} 3',
+            'test_seconds_bucket{view="a\\"b",le="+Inf"} 4',
+            'test_seconds_sum{view="a\\"b"} 2.65',
+            'test_seconds_count{view="a\\"b"} 4',
+        ])
+
+
+class ProfilingTests(TestCase):
+    """管理员签发令牌后按需剖析单个请求"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create(username='staff', is_staff=True)
+        cls.user = CustomUser.objects.create(username='owner')
+        Image.objects.create(title='profiled', file='images/profiled.jpg', uploaded_by=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        self.token = self.client.post('/api/profiling/token/').json()['token']
+        self.client.force_authenticate(self.user)
+
+    def test_only_staff_can_issue_tokens(self):
+        self.assertEqual(self.client.post('/api/profiling/token/').status_code, 403)
+        self.assertEqual(self.client.get('/api/profiling/').status_code, 403)
+
+    def test_requests_without_valid_token_are_not_profiled(self):
+        self.assertNotIn('X-Profile-Id', self.client.get('/api/images/'))
+        self.assertNotIn('X-Profile-Id', self.client.get('/api/images/', HTTP_X_PROFILE_TOKEN='1:forged:token'))
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_sampling_profile(self):
+        response = self.client.get('/api/images/', HTTP_X_PROFILE_TOKEN=self.token)
+        self.assertEqual(response.status_code, 200)
+        profile = RequestProfile.objects.get(id=response['X-Profile-Id'])
+        self.assertEqual((profile.mode, profile.user, profile.requested_by), ('sample', self.user, self.staff))
+        self.assertEqual(profile.view, 'api/images/')
+        self.assertGreater(profile.db_queries, 0)
+
+        self.client.force_authenticate(self.staff)
+        listing = self.client.get('/api/profiling/').json()
+        self.assertEqual(listing['results'][0]['id'], profile.id)
+        download = self.client.get(f'/api/profiling/{profile.id}/collapsed/')
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('.folded', download['Content-Disposition'])
+        self.assertEqual(self.client.get(f'/api/profiling/{profile.id}/pstats/').status_code, 404)
+
+    def test_cprofile_profile(self):
+        response = self.client.get(f'/api/images/?page_size=5&_profile={self.token}&_profile_mode=cprofile')
+        profile = RequestProfile.objects.get(id=response['X-Profile-Id'])
+        self.assertEqual(profile.mode, 'cprofile')
+        # 令牌不随查询字符串保存
+        self.assertEqual(profile.query_string, 'page_size=5')
+        # 折叠栈每行为 "帧;帧;帧 数值"，应包含视图函数
+        for line in profile.collapsed_stacks.splitlines():
+            self.assertRegex(line, r'^[^;]+(;[^;]+)* \d+$')
+        self.assertIn(';get (galleryapp/views.py', profile.collapsed_stacks)
+
+        self.client.force_authenticate(self.staff)
+        download = self.client.get(f'/api/profiling/{profile.id}/pstats/')
+        self.assertEqual(download.status_code, 200)
+        self.assertTrue(any(name == 'get' for _, _, name in marshal.loads(download.content)))
+
+    @override_settings(PROFILING_MAX_PROFILES=2)
+    def test_profiles_per_token_capped(self):
+        for _ in range(3):
+            response = self.client.get('/api/images/', HTTP_X_PROFILE_TOKEN=self.token)
+            self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(RequestProfile.objects.count(), 2)
+
+    def test_purge_old_profiles(self):
+        for _ in range(2):
+            self.client.get('/api/images/', HTTP_X_PROFILE_TOKEN=self.token)
+        old = RequestProfile.objects.first()
+        RequestProfile.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(days=30))
+        call_command('purge_request_profiles', days=7, stdout=io.StringIO())
+        self.assertEqual(RequestProfile.objects.count(), 1)
+        self.assertFalse(RequestProfile.objects.filter(id=old.id).exists())
+
+
+def make_exif_jpeg(size=(60, 40), orientation=1, taken='2024:03:15 10:30:00', offset=None):
+    exif = PILImage.Exif()
+    exif[0x010F] = 'Canon'
+    exif[0x0110] = 'EOS R5\x00'
+    exif[0x0112] = orientation
+    exif[0x8769] = {0x9003: taken, **({0x9011: offset} if offset else {})}  # Exif 子 IFD
+    buffer = io.BytesIO()
+    PILImage.new('RGB', size, 'white').save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+class ImageMetadataTests(TemporaryMediaRootMixin, TestCase):
+    """EXIF 元数据提取和列表过滤"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_extract_metadata(self):
+        metadata = extract_metadata(io.BytesIO(make_exif_jpeg(orientation=6, offset='+09:00')))
+        # 方向 6 需要旋转 90 度，显示尺寸宽高互换
+        self.assertEqual((metadata['width'], metadata['height'], metadata['orientation']), (40, 60, 'portrait'))
+        self.assertEqual((metadata['format'], metadata['camera_make'], metadata['camera_model']),
+                         ('JPEG', 'Canon', 'EOS R5'))
+        self.assertEqual(metadata['taken_at'].isoformat(), '2024-03-15T10:30:00+09:00')
+
+        plain = io.BytesIO()
+        PILImage.new('RGB', (8, 8)).save(plain, 'PNG')
+        metadata = extract_metadata(plain)
+        self.assertEqual((metadata['format'], metadata['orientation'], metadata['taken_at']), ('PNG', 'square', None))
+
+    @override_settings(IMAGE_JOBS_EAGER=True)
+    def test_metadata_job(self):
+        image = Image.objects.create(title='exif', uploaded_by=self.user,
+                                     file=ContentFile(make_exif_jpeg(), name='exif.jpg'))
+        enqueue_image_jobs([image], ['metadata'])
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height, image.orientation), (60, 40, 'landscape'))
+        self.assertEqual(image.file_size, image.file.size)
+        self.assertEqual(timezone.localtime(image.taken_at).strftime('%Y-%m-%d %H:%M'), '2024-03-15 10:30')
+
+    def test_list_filters(self):
+        march = timezone.make_aware(timezone.datetime(2024, 3, 10))
+        for title, width, height, taken_at, camera in [
+            ('wide-march', 4000, 3000, march, 'Canon'),
+            ('narrow-march', 2000, 3000, march, 'Canon'),
+            ('wide-april', 4000, 3000, march + timedelta(days=30), 'Nikon'),
+            ('unknown', None, None, None, ''),
+        ]:
+            Image.objects.create(title=title, file=f'images/{title}.jpg', uploaded_by=self.user, width=width,
+                                 height=height, taken_at=taken_at, camera_make=camera,
+                                 orientation='' if width is None else ('landscape' if width > height else 'portrait'))
+
+        def titles(query):
+            response = self.client.get(f'/api/images/{query}')
+            self.assertEqual(response.status_code, 200)
+            return sorted(image['title'] for image in response.json()['results'])
+
+        self.assertEqual(titles('?taken_after=2024-03-01&taken_before=2024-04-01&min_width=3000'), ['wide-march'])
+        self.assertEqual(titles('?orientation=portrait'), ['narrow-march'])
+        self.assertEqual(titles('?camera_make=Nikon'), ['wide-april'])
+        self.assertEqual(titles('?max_width=3000&taken_after=2024-03-10T00:00:00%2B08:00'), ['narrow-march'])
+        self.assertEqual(self.client.get('/api/images/?min_width=wide').status_code, 400)
+        self.assertEqual(self.client.get('/api/images/?taken_after=March').status_code, 400)
+
+    def test_invalid_taken_time(self):
+        # 格式正确但日期不存在时返回 400 而不是 500
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        for value in ('2024-13-01', '2024-02-30T00:00'):
+            for path in ('/api/images/', '/api/async/images/'):
+                response = self.client.get(f'{path}?taken_before={value}')
+                self.assertEqual(response.status_code, 400, path)
+                self.assertIn('taken_before', response.content.decode())
+
+
+class BackfillMetadataCommandTests(TemporaryMediaRootMixin, TransactionTestCase):
+    """多进程补全元数据（子进程前会关闭数据库连接，因此不能包在测试事务里）"""
+
+    def test_backfill(self):
+        user = CustomUser.objects.create(username='owner')
+        name = default_storage.save('images/backfill.jpg', ContentFile(make_exif_jpeg(size=(30, 20))))
+        for i in range(3):  # 相同文件被多张图片引用
+            Image.objects.create(title=f'copy {i}', file=name, uploaded_by=user)
+        Image.objects.create(title='broken', file='images/missing.jpg', uploaded_by=user)
+
+        call_command('backfill_image_metadata', processes=2, stdout=io.StringIO(),
+                     stderr=io.StringIO())
+        self.assertEqual(Image.objects.filter(width=30, height=20, camera_make='Canon').count(), 3)
+        self.assertIsNone(Image.objects.get(title='broken').width)
+
+
+class SoftDeleteTests(TemporaryMediaRootMixin, TestCase):
+    """批量删除只做标记，记录和文件由 reap_deleted_images 清理，孤立文件由 sweep_orphan_media 清理"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='owner')
+        cls.other = CustomUser.objects.create(username='other')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_image(self, title, content=b'data', owner=None):
+        name = default_storage.save(f'images/{title}.jpg', ContentFile(content))
+        return Image.objects.create(title=title, file=name, thumbnail=f'{name}.thumb.webp',
+                                    uploaded_by=owner or self.user)
+
+    def test_bulk_delete_marks_images(self):
+        image = self.create_image('deleted')
+        kept = self.create_image('kept')
+        share_link = ShareLink.objects.create(share_code='soft-delete', expire_time=timezone.now() + timedelta(days=1))
+        share_link.images.set([image, kept])
+
+        response = self.client.post('/api/images/bulk_delete/', {'image_ids': [image.id]}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertIsNotNone(Image.all_objects.get(id=image.id).deleted_at)
+        self.assertTrue(default_storage.exists(image.file.name))  # 文件由后台清理
+        self.assertEqual([item['id'] for item in self.client.get('/api/images/').json()['results']], [kept.id])
+        self.assertEqual(self.client.get(f'/api/images/{image.id}/').status_code, 404)
+        self.assertEqual([item['id'] for item in self.client.get('/api/share/soft-delete/').json()['images']],
+                         [kept.id])
+
+    def test_bulk_delete_rejects_foreign_images(self):
+        mine = self.create_image('mine')
+        theirs = self.create_image('theirs', owner=self.other)
+        response = self.client.post('/api/images/bulk_delete/', {'image_ids': [mine.id, theirs.id]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Image.all_objects.filter(deleted_at__isnull=False).exists())
+
+    def test_reaper_removes_rows_and_files(self):
+        images = [self.create_image(f'reap-{i}') for i in range(3)]
+        tag = Tag.objects.create(name='reap', uploaded_by=self.user)
+        images[0].tags.set([tag])
+        Image.objects.filter(id__in=[image.id for image in images[:2]]).update(deleted_at=timezone.now())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reap_deleted_images', once=True, batch_size=1, workers=2, stdout=io.StringIO())
+        self.assertEqual(list(Image.all_objects.values_list('id', flat=True)), [images[2].id])
+        self.assertFalse(Image.tags.through.objects.exists())
+        self.assertFalse(default_storage.exists(images[0].file.name))
+        self.assertTrue(default_storage.exists(images[2].file.name))
+
+    def test_sweep_orphan_media(self):
+        referenced = self.create_image('referenced')
+        deleted = self.create_image('soft-deleted')
+        deleted.deleted_at = timezone.now()
+        deleted.save()
+        old_orphan = default_storage.save('images/ab/orphan.jpg', ContentFile(b'old'))
+        new_orphan = default_storage.save('images/new-orphan.jpg', ContentFile(b'new'))
+        two_days_ago = (timezone.now() - timedelta(days=2)).timestamp()
+        for name in (referenced.file.name, deleted.file.name, old_orphan):
+            os.utime(default_storage.path(name), (two_days_ago, two_days_ago))
+
+        output = io.StringIO()
+        call_command('sweep_orphan_media', stdout=output)
+        self.assertEqual(output.getvalue().splitlines()[0], old_orphan)
+        self.assertTrue(default_storage.exists(old_orphan))
+
+        call_command('sweep_orphan_media', delete=True, stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(old_orphan))
+        # 被引用的文件（包括等待清理的已删除图片）和较新的文件保留
+        for name in (referenced.file.name, deleted.file.name, new_orphan):
+            self.assertTrue(default_storage.exists(name), name)
+
+    def test_referenced_names_are_paged_in_order(self):
+        images = [self.create_image(f'page-{i}') for i in range(5)]
+        names = list(iter_referenced_names(chunk_size=2))
+        self.assertEqual(names, sorted(names))
+        self.assertTrue({image.file.name for image in images} <= set(names))
+        self.assertEqual(set(names), set(iter_referenced_names()))
+
+    def test_storage_walk_matches_sorted_order(self):
+        for name in ('walk/ab/x.jpg', 'walk/ab.jpg', 'walk/ab-c.jpg', 'walk/a/b/c.jpg', 'walk/b.jpg'):
+            default_storage.save(name, ContentFile(b'x'))
+        names = list(iter_storage_names(default_storage, 'walk'))
+        self.assertEqual(names, sorted(names))
+        self.assertEqual(len(names), 5)
+        self.assertEqual(list(find_orphans(names, ['walk/a/b/c.jpg', 'walk/ab.jpg', 'walk/zz.jpg'])),
+                         ['walk/ab-c.jpg', 'walk/ab/x.jpg', 'walk/b.jpg'])
+
+
+class CaptchaTests(TestCase):
+    """预渲染验证码池和验证码接口"""
+
+    @override_settings(CAPTCHA_IMAGE_FORMATS=['png', 'webp'])
+    def test_pool_serves_unique_captchas_and_refills(self):
+        pool = CaptchaPool(size=5, refill_at=2)
+        pool.fill()
+        self.assertEqual(len(pool.items), 5)
+        served = [pool.get() for _ in range(3)]
+        self.assertEqual(len({images['png'] for _, images in served}), 3)
+        self.assertEqual(pool.hits, 3)
+        # 剩余数量降到 refill_at 后后台线程补充到 size 个
+        for _ in range(100):
+            if len(pool.items) == 5:
+                break
+            threading.Event().wait(0.02)
+        self.assertEqual(len(pool.items), 5)
+
+        pool.items.clear()
+        pool.refill_at = -1
+        code, images = pool.get()
+        self.assertEqual(pool.misses, 1)
+        self.assertEqual(len(code), 4)
+        self.assertEqual(PILImage.open(io.BytesIO(images['png'])).size, (120, 40))
+        self.assertEqual(PILImage.open(io.BytesIO(images['webp'])).format, 'WEBP')
+
+    def test_pool_discards_items_after_fork(self):
+        pool = CaptchaPool(size=3, refill_at=-1)
+        pool.fill()
+        rendered = {images['png'] for _, images in pool.items}
+        pool.pid = -1  # 模拟 fork 后的子进程
+        self.assertNotIn(pool.get()[1]['png'], rendered)
+
+    def test_numpy_renderer(self):
+        for difficulty in DIFFICULTY_LEVELS:
+            with self.subTest(difficulty=difficulty):
+                renderer = NumpyCaptchaRenderer(difficulty)
+                code, images = renderer.render()
+                self.assertEqual(len(code), 4)
+                self.assertFalse(set(code) & set('0O1I'))
+                image = PILImage.open(io.BytesIO(images['png']))
+                self.assertEqual((image.format, image.mode, image.size), ('PNG', 'P', (120, 40)))
+                # 文字颜色（调色板中背景之后的部分）确实画在了图上
+                self.assertGreater(sum(image.histogram()[32:56]), 100)
+                self.assertNotEqual(renderer.render()[1], images)
+        with self.assertRaises(ValueError):
+            NumpyCaptchaRenderer('impossible')
+
+    def test_captcha_login_flow(self):
+        user = CustomUser.objects.create_user(username='captcha', password='secret-password', email='c@example.com')
+        client = APIClient()
+        for renderer, pool_size in (('pillow', 0), ('pillow', 3), ('numpy', 0)):
+            with self.subTest(renderer=renderer, pool_size=pool_size), \
+                    override_settings(CAPTCHA_RENDERER=renderer, CAPTCHA_POOL_SIZE=pool_size):
+                data = client.get('/api/users/captcha/').json()
+                self.assertTrue(data['captcha_image'].startswith('data:image/png;base64,'))
+                code = cache.get(data['captcha_key'])
+                response = client.post('/api/users/login/', {
+                    'username': user.username, 'password': 'secret-password',
+                    'captcha_key': data['captcha_key'], 'captcha': code.lower(),
+                }, format='json')
+                self.assertEqual(response.status_code, 200)
+                self.assertIsNone(cache.get(data['captcha_key']))
+
+    @override_settings(CAPTCHA_IMAGE_FORMATS=['png', 'webp'], CAPTCHA_POOL_SIZE=0)  # 池中已有的验证码只编码了 PNG
+    def test_captcha_image_response(self):
+        user = CustomUser.objects.create_user(username='captcha', password='secret-password', email='c@example.com')
+        for image_format, params, headers in (('png', {'format': 'png'}, {}),
+                                              ('webp', {}, {'HTTP_ACCEPT': 'image/avif,image/webp,*/*;q=0.8'})):
+            with self.subTest(image_format=image_format):
+                client = APIClient()
+                response = client.get('/api/users/captcha/', params, **headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], f'image/{image_format}')
+                self.assertEqual(PILImage.open(io.BytesIO(response.content)).format, image_format.upper())
+                captcha_key = response['X-Captcha-Key']
+                self.assertEqual(response.cookies['captcha_key'].value, captcha_key)
+
+                # <img> 引用的验证码：登录请求不带 captcha_key，从 Cookie 读取
+                response = client.post('/api/users/login/', {
+                    'username': user.username, 'password': 'secret-password', 'captcha': cache.get(captcha_key),
+                }, format='json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.cookies['captcha_key'].value, '')
+
+        # 默认仍返回 JSON，不支持的格式返回 404
+        self.assertEqual(APIClient().get('/api/users/captcha/')['Content-Type'], 'application/json')
+        self.assertEqual(APIClient().get('/api/users/captcha/', {'format': 'gif'}).status_code, 404)
+
+    def test_captcha_cookie_samesite(self):
+        cookie = APIClient().get('/api/users/captcha/', {'format': 'png'}).cookies['captcha_key']
+        self.assertEqual((cookie['samesite'], cookie['secure']), ('Lax', ''))
+        # 跨域携带凭据时 Lax 的 Cookie 不会随登录请求发送
+        with override_settings(CORS_ALLOW_CREDENTIALS=True):
+            cookie = APIClient().get('/api/users/captcha/', {'format': 'png'}).cookies['captcha_key']
+        self.assertEqual((cookie['samesite'], cookie['secure']), ('None', True))
+        # 默认只预渲染 PNG
+        self.assertEqual(APIClient().get('/api/users/captcha/', {'format': 'webp'}).status_code, 404)
+
+    @override_settings(CAPTCHA_QUANTIZE_COLORS=16)
+    def test_quantized_captcha(self):
+        code, images = CaptchaUtil().render(('png', 'webp'))
+        image = PILImage.open(io.BytesIO(images['png']))
+        self.assertEqual(image.mode, 'P')
+        self.assertLessEqual(len(image.getcolors()), 16)
+
+    def test_benchmark_command(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            call_command('benchmark_captcha', count=5, output=output.name)
+            results = json.load(output)
+        for renderer in ('pillow', 'numpy'):
+            self.assertGreater(results['renderers'][renderer]['captchas_per_second_per_core'], 0)
+            self.assertEqual(results['serve'][renderer]['pool']['requests'], 5)
+            self.assertEqual(results['serve'][renderer]['direct']['requests'], 5)
+
+
+class BenchmarkCommandTests(TransactionTestCase):
+    """压测数据生成和进程内压测命令（压测线程使用独立连接，因此不能包在测试事务里）"""
+
+    def test_seed_and_benchmark(self):
+        call_command('seed_benchmark_data', users=2, images=30, tags=3, share_links=2, images_per_share=5,
+                     stdout=io.StringIO())
+        self.assertEqual(Image.objects.count(), 30)
+        self.assertEqual(ShareLink.objects.count(), 4)
+
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            call_command('benchmark_api', endpoints=['images', 'images_search', 'share', 'login'], requests=3,
+                         warmup=0, concurrency=2, output=output.name, stderr=io.StringIO())
+            results = json.load(output)
+        self.assertEqual(results['dataset']['images'], 30)
+        for endpoint, result in results['endpoints'].items():
+            self.assertEqual(result['requests'], 3, endpoint)
+            self.assertEqual(result['errors'], 0, endpoint)
+            self.assertIsNotNone(result['latency_ms']['p99'])
+        self.assertEqual(results['endpoints']['images']['queries_per_request']['max'], 5)
+
+
+@unittest.skipUnless(os.environ.get('S3_TEST_ENDPOINT'), '设置 S3_TEST_ENDPOINT（如本地 MinIO）后运行')
+class S3StorageTests(unittest.TestCase):
+    """在 S3 兼容服务上测试 S3Storage，桶名由 S3_TEST_BUCKET 指定"""
+
+    def setUp(self):
+        self.storage = S3Storage(bucket_name=os.environ.get('S3_TEST_BUCKET', 'sugallery-test'),
+                                 endpoint_url=os.environ['S3_TEST_ENDPOINT'],
+                                 access_key=os.environ.get('S3_TEST_ACCESS_KEY', 'minioadmin'),
+                                 secret_key=os.environ.get('S3_TEST_SECRET_KEY', 'minioadmin'),
+                                 region_name='us-east-1', multipart_threshold=5 * 1024 * 1024,
+                                 multipart_chunksize=5 * 1024 * 1024)
+        try:
+            self.storage.client.create_bucket(Bucket=self.storage.bucket_name)
+        except self.storage.client.exceptions.BucketAlreadyOwnedByYou:
+            pass
+
+    def test_round_trip(self):
+        name = self.storage.save(self.storage.generate_filename(f'images/{uuid.uuid4().hex}.jpg'), ContentFile(b'data'))
+        self.assertRegex(name, r'^images/[0-9a-f]{2}/[0-9a-f]{2}/')
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.storage.size(name), 4)
+        self.assertEqual(self.storage.open(name).read(), b'data')
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+
+    def test_multipart_upload(self):
+        content = os.urandom(12 * 1024 * 1024)
+        name = self.storage.save(f'images/{uuid.uuid4().hex}.bin', ContentFile(content))
+        self.assertEqual(self.storage.open(name).read(), content)
+        self.storage.delete(name)
@@ -1,11 +1,44 @@
+import math
 import random
 import string
+import threading
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import numpy as np
+from django.conf import settings
 from PIL import Image, ImageDraw, ImageFont
 import io
 import base64
+import logging
+
+logger = logging.getLogger(__name__)
+
+# CaptchaView 可以直接返回的图片格式：格式名 -> (Pillow 格式, Content-Type)
+IMAGE_FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+
+@lru_cache(maxsize=None)
+def load_font(size):
+    """按 CAPTCHA_FONTS 的顺序加载第一个可用的字体，每个进程只加载一次"""
+    for path in settings.CAPTCHA_FONTS:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    logger.warning('CAPTCHA_FONTS 中的字体都不可用，使用 Pillow 内置字体')
+    return ImageFont.load_default(size)
 
 
 class CaptchaUtil:
+    chars = string.ascii_uppercase + string.digits  # 包含数字和大写字母的字符集
+    png_options = {}  # 传给 Image.save 的 PNG 编码参数
+    webp_options = {'lossless': True, 'method': 0}  # 验证码颜色少，无损 + 最快压缩比有损更小更快
+
     def __init__(self):
         self.width = 120  # 验证码图片宽度
         self.height = 40  # 验证码图片高度
@@ -14,26 +47,15 @@ class CaptchaUtil:
 
     def generate_code(self):
         """生成随机验证码"""
-        # 包含数字和大写字母的字符集
-        chars = string.ascii_uppercase + string.digits
-        code = ''.join(random.choices(chars, k=self.code_len))
+        code = ''.join(random.choices(self.chars, k=self.code_len))
         return code
 
-    def generate_captcha(self):
-        """生成验证码图片"""
+    def draw(self, code):
+        """绘制验证码图片"""
         # 创建画布
         image = Image.new('RGB', (self.width, self.height), 'white')
         draw = ImageDraw.Draw(image)
-
-        # 生成验证码文本
-        code = self.generate_code()
-
-        try:
-            # 使用系统字体，也可以指定特定字体文件路径
-            font = ImageFont.truetype('arial.ttf', self.font_size)
-        except:
-            # 如果找不到指定字体，使用默认字体
-            font = ImageFont.load_default()
+        font = load_font(self.font_size)
 
         # 绘制文字
         for i in range(self.code_len):
@@ -60,13 +82,28 @@ class CaptchaUtil:
             x = random.randint(0, self.width)
             y = random.randint(0, self.height)
             draw.point([x, y], fill='black')
+        return image
 
-        # 将图片转换为base64字符串
-        buffer = io.BytesIO()
-        image.save(buffer, format='PNG')
-        img_str = base64.b64encode(buffer.getvalue()).decode()
+    def render(self, formats=('png',)):
+        """生成验证码并编码为 formats 中的每种格式，返回 (验证码, {格式: 图片字节})"""
+        code = self.generate_code()
+        image = self.draw(code)
+        colors = settings.CAPTCHA_QUANTIZE_COLORS
+        if colors and image.mode == 'RGB':
+            # 量化为调色板图像，PNG 体积明显减小；numpy 渲染器本身输出的就是调色板图像
+            image = image.quantize(colors, method=Image.Quantize.FASTOCTREE)
+        images = {}
+        for image_format in formats:
+            buffer = io.BytesIO()
+            options = self.png_options if image_format == 'png' else self.webp_options
+            image.save(buffer, format=IMAGE_FORMATS[image_format][0], **options)
+            images[image_format] = buffer.getvalue()
+        return code, images
 
-        return code, img_str
+    def generate_captcha(self):
+        """生成验证码图片，返回 (验证码, base64 字符串)"""
+        code, images = self.render()
+        return code, base64.b64encode(images['png']).decode()
 
     @staticmethod
     def verify_code(user_input, stored_code):
@@ -74,3 +111,276 @@ class CaptchaUtil:
         if not user_input or not stored_code:
             return False
         return user_input.upper() == stored_code.upper()
+
+
+# 各难度的扭曲参数：字符旋转角度（度）、错切、字符间距（像素，越小重叠越多）、
+# 整体正弦扭曲幅度（像素）、与文字同色的干扰曲线数量、椒盐噪点比例、背景斑驳噪声的幅度
+DIFFICULTY_LEVELS = {
+    'easy': {'rotation': 15, 'shear': 0.1, 'spacing': 26, 'warp': 1.5, 'curves': 1, 'speckle': 0.02, 'noise': 10},
+    'medium': {'rotation': 25, 'shear': 0.2, 'spacing': 24, 'warp': 2, 'curves': 2, 'speckle': 0.03, 'noise': 16},
+    'hard': {'rotation': 30, 'shear': 0.3, 'spacing': 22, 'warp': 3, 'curves': 3, 'speckle': 0.04, 'noise': 22},
+}
+
+GRADIENT_STEPS = 8
+BLOTCH_LEVELS = 4
+COVERAGE_LEVELS = 3
+TEXT_OFFSET = GRADIENT_STEPS * BLOTCH_LEVELS  # 调色板中文字颜色的起始位置
+SPECKLE_OFFSET = TEXT_OFFSET + GRADIENT_STEPS * COVERAGE_LEVELS
+PALETTE_STEPS = np.linspace(0, 1, GRADIENT_STEPS)[:, None]
+PALETTE_COVERAGE = (np.arange(1, COVERAGE_LEVELS + 1) / COVERAGE_LEVELS)[:, None]
+
+
+@lru_cache(maxsize=None)
+def glyph_masks(size, chars):
+    """
+    把字符集中的每个字符渲染为居中的 size x size 灰度蒙版（0~1），四周再留一像素的空白，
+    返回 {字符: 下标} 和 (字符数, size + 2, size + 2) 数组
+    """
+    font = load_font(size * 3 // 4)
+    masks = np.zeros((len(chars), size + 2, size + 2), dtype=np.float32)
+    for i, char in enumerate(chars):
+        glyph = Image.new('L', (size, size))
+        ImageDraw.Draw(glyph).text((size / 2, size / 2), char, font=font, fill=255, anchor='mm')
+        masks[i, 1:-1, 1:-1] = np.asarray(glyph, dtype=np.float32) / 255
+    return {char: i for i, char in enumerate(chars)}, masks
+
+
+class NumpyCaptchaRenderer(CaptchaUtil):
+    """
+    用 NumPy 在整张画布上批量完成字符变形、扭曲和加噪，没有逐点、逐线的 Python 循环：
+    每个字符随机旋转、错切和缩放后相互重叠，整体再做正弦扭曲，叠加与文字同色的干扰曲线、
+    斑驳的渐变背景和椒盐噪点，并直接输出调色板图像。难度由 CAPTCHA_DIFFICULTY 选择。
+    去掉了 0/O、1/I 这类扭曲后人也难以分辨的字符。
+    """
+    chars = ''.join(c for c in string.ascii_uppercase + string.digits if c not in '0O1I')
+    # 调色板图像用较低的压缩级别编码快一倍，体积只增加约 10%，仍小于 pillow 渲染器的输出
+    png_options = {'compress_level': 3}
+
+    def __init__(self, difficulty=None):
+        super().__init__()
+        difficulty = difficulty or settings.CAPTCHA_DIFFICULTY
+        try:
+            self.params = DIFFICULTY_LEVELS[difficulty]
+        except KeyError:
+            raise ValueError(f'未知的验证码难度: {difficulty}')
+        self.glyph_size = self.height
+        self.local = threading.local()
+        # 预先计算坐标网格，每次渲染只做数组运算
+        self.rows, self.cols = np.ogrid[0:self.height, 0:self.width]
+        # 字符窗口内相对中心的坐标
+        half = (self.glyph_size - 1) / 2
+        self.window_x = (np.arange(self.glyph_size, dtype=np.float32) - half)[None, :]
+        self.window_y = (np.arange(self.glyph_size, dtype=np.float32) - half)[:, None]
+        self.column_steps = (np.arange(self.width) * GRADIENT_STEPS // self.width).astype(np.uint8)[None, :]
+        self.row_steps = (np.arange(self.height) * GRADIENT_STEPS // self.height).astype(np.uint8)[:, None]
+        self.blotch_offsets = np.linspace(-self.params['noise'], self.params['noise'], BLOTCH_LEVELS)[:, None]
+
+    @property
+    def rng(self):
+        # 后台补充线程和请求线程可能同时渲染，Generator 不是线程安全的，每个线程各用一个
+        rng = getattr(self.local, 'rng', None)
+        if rng is None:
+            rng = self.local.rng = np.random.default_rng()
+        return rng
+
+    def text_mask(self, code):
+        """
+        文字蒙版：每个字符随机旋转、错切、缩放，按间距重叠排开，整体再做正弦扭曲（每行横向、每列纵向平移）。
+        所有字符所在窗口的画布坐标一次性经扭曲和逆变换映射回字符蒙版坐标（最近邻采样），再取最大值合成。
+        """
+        rng, params = self.rng, self.params
+        n, size, spacing, amplitude = len(code), self.glyph_size, params['spacing'], params['warp']
+        char_index, masks = glyph_masks(size, self.chars)
+
+        # 每个字符的随机量，范围 [-1, 1)：旋转、错切、缩放、横向和纵向抖动
+        jitter = rng.random((5, n, 1, 1), dtype=np.float32) * 2 - 1
+        angle = np.radians(params['rotation']) * jitter[0]
+        shear = params['shear'] * jitter[1]
+        scale = 1 + 0.15 * jitter[2]
+        # 每个字符窗口的左边界：按间距排开，整体在画布中随机左右偏移
+        left = rng.integers(0, max(self.width - spacing * (n - 1) - size, 0) + 1)
+        starts = (left + np.arange(n) * spacing + np.rint(2 * jitter[3].ravel()).astype(int)).clip(0, self.width)
+
+        # 正弦扭曲，dx 只与行有关，dy 只与列有关
+        phase_x, phase_y, period_x, period_y = rng.random(4, dtype=np.float32)
+        phase_x, phase_y = phase_x * 2 * math.pi, phase_y * 2 * math.pi
+        period_x = (1 + period_x) * self.height
+        period_y = (0.4 + 0.4 * period_y) * self.width
+        dx = amplitude * np.sin(2 * math.pi / period_x * self.window_y + phase_x)  # (size, 1)
+        columns = starts.astype(np.float32)[:, None, None] + self.window_x  # (n, 1, size)
+        dy = amplitude * np.sin(2 * math.pi / period_y * columns + phase_y)
+        # 扭曲后相对字符中心的坐标
+        x = self.window_x + dx  # (size, size)
+        y = self.window_y + dy - 2 * jitter[4]  # (n, size, size)
+
+        cos, sin = np.cos(angle) / scale, np.sin(angle) / scale
+        # 逆变换回字符蒙版坐标；蒙版四周有一像素空白，越界坐标截断到边缘后取到的都是 0
+        center = (size + 1) / 2 + 0.5  # 加 0.5 后截断即四舍五入
+        source_x = ((cos + shear * sin) * x + (sin - shear * cos) * y + center).clip(0, size + 1).astype(np.int32)
+        source_y = (cos * y - sin * x + center).clip(0, size + 1).astype(np.int32)
+        indexes = np.array([char_index[c] for c in code])[:, None, None]
+        glyphs = masks[indexes, source_y, source_x]  # (n, size, size)
+
+        mask = np.zeros((self.height, self.width + size), dtype=np.float32)
+        for start, glyph in zip(starts, glyphs):
+            region = mask[:, start:start + size]
+            np.maximum(region, glyph, out=region)
+        return mask[:, :self.width]
+
+    def curves(self):
+        """随机正弦曲线组成的干扰线蒙版，所有曲线一次算出"""
+        rng, n = self.rng, self.params['curves']
+        amplitude = rng.uniform(3, self.height / 3, (n, 1))
+        period = rng.uniform(self.width / 2, self.width * 1.5, (n, 1))
+        phase = rng.uniform(0, 2 * math.pi, (n, 1))
+        center = rng.uniform(self.height / 4, self.height * 3 / 4, (n, 1))
+        thickness = rng.uniform(0.6, 1.2, (n, 1, 1))
+        ys = amplitude * np.sin(2 * math.pi * self.cols[0] / period + phase) + center  # (n, width)
+        return (np.abs(self.rows - ys[:, None, :]) < thickness).any(axis=0)
+
+    def palette(self):
+        """
+        本次验证码的调色板：背景为 8 级横向渐变 x 4 级斑驳噪声，文字为 8 级纵向渐变 x 3 级覆盖度，
+        另加黑白两个噪点颜色，共 58 种颜色
+        """
+        rng, steps, coverage = self.rng, PALETTE_STEPS, PALETTE_COVERAGE
+        left, right = rng.uniform(190, 255, (2, 3))
+        background = left * (1 - steps) + right * steps  # (8, 3)
+        background = (background[:, None] + self.blotch_offsets).reshape(-1, 3)  # (32, 3)
+        top, bottom = rng.uniform(0, 120, (2, 3))
+        text = top * (1 - steps) + bottom * steps
+        text = (background.mean(axis=0) * (1 - coverage) + text[:, None] * coverage).reshape(-1, 3)  # (24, 3)
+        colors = np.concatenate([background, text, [[0, 0, 0], [255, 255, 255]]])
+        return colors.clip(0, 255).astype(np.uint8)
+
+    def draw(self, code):
+        """直接合成调色板索引图像，PNG 编码只需处理每像素一个字节，比 RGB 更快也更小"""
+        rng, params = self.rng, self.params
+        mask = self.text_mask(code)
+        np.maximum(mask, self.curves(), out=mask)
+
+        # 背景：横向渐变级别叠加 4x4 像素块的斑驳噪声
+        blotches = rng.integers(0, BLOTCH_LEVELS, (self.height // 4, self.width // 4), dtype=np.uint8)
+        index = self.column_steps * BLOTCH_LEVELS + blotches.repeat(4, axis=0).repeat(4, axis=1)
+        # 文字和干扰线：纵向渐变级别 x 覆盖度
+        coverage = np.rint(mask * COVERAGE_LEVELS).astype(np.uint8)
+        text = TEXT_OFFSET + self.row_steps * COVERAGE_LEVELS + coverage - 1
+        index = np.where(coverage > 0, text, index)
+        # 椒盐噪点：随机位置取黑色或白色
+        count = int(params['speckle'] * index.size)
+        index.flat[rng.integers(0, index.size, count)] = rng.integers(SPECKLE_OFFSET, SPECKLE_OFFSET + 2, count,
+                                                                      dtype=np.uint8)
+
+        image = Image.fromarray(index)
+        image.putpalette(self.palette().tobytes())
+        return image
+
+
+# CAPTCHA_RENDERER 可选的渲染器
+RENDERERS = {
+    'pillow': CaptchaUtil,
+    'numpy': NumpyCaptchaRenderer,
+}
+
+
+@lru_cache(maxsize=None)
+def get_renderer(name):
+    try:
+        return RENDERERS[name]()
+    except KeyError:
+        raise ValueError(f'未知的验证码渲染器: {name}')
+
+
+def render_captcha(_=None):
+    """
+    使用 CAPTCHA_RENDERER 生成一个验证码，编码为 PNG（JSON 响应中的 data URI）和 CAPTCHA_IMAGE_FORMATS 中的格式，
+    返回 (验证码, {格式: 图片字节})；参数仅为了能直接用于 executor.map
+    """
+    formats = tuple(dict.fromkeys(['png', *settings.CAPTCHA_IMAGE_FORMATS]))
+    return get_renderer(settings.CAPTCHA_RENDERER).render(formats)
+
+
+class CaptchaPool:
+    """
+    预渲染的验证码池：后台线程在剩余数量降到 refill_at 以下时补充到 size 个，
+    请求时只需取出一个。池为空（突发流量）时退回到同步渲染。
+    processes > 0 时后台线程把渲染交给多个进程，不与请求线程争用 GIL。
+    每个验证码在补充时就编码好了所有格式，请求中不再编码；每个验证码只会被取出一次。
+    """
+
+    def __init__(self, size, refill_at, processes=0):
+        self.size, self.refill_at, self.processes = size, refill_at, processes
+        self.items = deque()
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = os.getpid()
+        self.hits = self.misses = 0
+
+    def get(self):
+        """取出一个验证码，返回 (验证码, {格式: 图片字节})"""
+        self.ensure_started()
+        try:
+            item = self.items.popleft()
+            self.hits += 1
+        except IndexError:
+            item = None
+        if len(self.items) <= self.refill_at:
+            self.wakeup.set()
+        if item is None:
+            self.misses += 1
+            item = render_captcha()
+        return item
+
+    def ensure_started(self):
+        if self.pid == os.getpid() and self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                # fork 出的子进程（如 gunicorn --preload）不能继续使用父进程渲染好的验证码
+                self.items.clear()
+                self.pid = os.getpid()
+                self.thread = None
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='captcha-pool', daemon=True)
+                self.thread.start()
+
+    def fill(self, executor=None):
+        """补充到 size 个"""
+        while len(self.items) < self.size:
+            missing = self.size - len(self.items)
+            if executor is not None:
+                self.items.extend(executor.map(render_captcha, range(missing), chunksize=max(missing // 32, 1)))
+            else:
+                self.items.append(render_captcha())
+
+    def run(self):
+        executor = ProcessPoolExecutor(self.processes) if self.processes else None
+        while True:
+            self.wakeup.clear()
+            try:
+                self.fill(executor)
+            except Exception as e:
+                logger.error(f'预渲染验证码失败: {e}')
+            self.wakeup.wait()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_captcha_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = CaptchaPool(settings.CAPTCHA_POOL_SIZE, settings.CAPTCHA_POOL_REFILL_AT,
+                                    settings.CAPTCHA_POOL_PROCESSES)
+    return _pool
+
+
+def get_captcha():
+    """生成一个验证码，返回 (验证码, {格式: 图片字节})；CAPTCHA_POOL_SIZE 为 0 时不使用预渲染池"""
+    if not settings.CAPTCHA_POOL_SIZE:
+        return render_captcha()
+    return get_captcha_pool().get()
@@ -0,0 +1,60 @@
+import mimetypes
+import os
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+
+COPY_BUFFER_SIZE = 64 * 1024  # 从请求体读取时的缓冲区大小
+
+
+def get_partial_path(session):
+    """分片临时文件路径，放在 MEDIA_ROOT 下以便完成时直接移动到最终位置"""
+    upload_dir = getattr(settings, 'CHUNKED_UPLOAD_DIR', os.path.join(settings.MEDIA_ROOT, 'uploads', 'partial'))
+    os.makedirs(upload_dir, exist_ok=True)
+    return os.path.join(upload_dir, f'{session.id.hex}.part')
+
+
+def write_chunk(session, stream, offset, length):
+    """
+    将请求体按偏移量流式写入临时文件，返回写入后的偏移量。
+    连接中断时已写入的部分仍然有效，客户端可以从新的偏移量继续上传。
+    """
+    path = get_partial_path(session)
+    mode = 'r+b' if os.path.exists(path) else 'wb'
+    written = 0
+    try:
+        with open(path, mode) as f:
+            f.seek(offset)
+            f.truncate()  # 丢弃偏移量之后可能残留的半截数据
+            while written < length:
+                data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+                if not data:
+                    break
+                f.write(data)
+                written += len(data)
+    finally:
+        session.received_bytes = offset + written
+        session.save(update_fields=['received_bytes', 'updated_at'])
+    return session.received_bytes
+
+
+def discard_partial(session):
+    """删除会话的临时文件"""
+    path = get_partial_path(session)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class PartialUploadedFile(UploadedFile):
+    """
+    包装已接收完整的临时文件。提供 temporary_file_path()，
+    使 FileSystemStorage 保存时直接移动文件而不是再复制一遍。
+    """
+
+    def __init__(self, session):
+        path = get_partial_path(session)
+        content_type = mimetypes.guess_type(session.filename)[0] or 'application/octet-stream'
+        super().__init__(open(path, 'rb'), session.filename, content_type, os.path.getsize(path))
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
@@ -0,0 +1,101 @@
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from ..models import LibraryVersion
+from .share_cache import check_share_password, get_share_payload
+
+
+def get_library_version(user_id):
+    """
+    用户图库版本号（纳秒时间戳），图片上传、编辑、删除时更新。
+    版本号存放在数据库中，所有进程（web worker、run_image_worker 等）看到的都是同一个值。
+    还没有任何变更的用户版本号为 0。
+    """
+    version = LibraryVersion.objects.filter(user_id=user_id).values_list('version', flat=True).first()
+    return version or 0
+
+
+async def aget_library_version(user_id):
+    """get_library_version 的异步版本"""
+    version = await LibraryVersion.objects.filter(user_id=user_id).values_list('version', flat=True).afirst()
+    return version or 0
+
+
+def bump_library_version(user_id):
+    """
+    事务提交后更新版本号，避免其他请求在提交前读到新版本并缓存旧数据。
+    不在事务中调用时立即更新。
+    """
+    transaction.on_commit(lambda: _bump_library_version(user_id))
+
+
+def _bump_library_version(user_id):
+    # 取当前时间和旧版本号加 1 中较大的一个，时钟回拨或同一纳秒内多次更新时版本号仍然递增
+    updated = LibraryVersion.objects.filter(user_id=user_id).update(
+        version=Greatest(F('version') + 1, Value(time.time_ns())))
+    if not updated:
+        _, created = LibraryVersion.objects.get_or_create(user_id=user_id, defaults={'version': time.time_ns()})
+        if not created:  # 并发请求刚刚创建了这一行
+            _bump_library_version(user_id)
+
+
+def get_request_library_version(request):
+    """同一个请求中 ETag 和 Last-Modified 各需要一次版本号，只查询一次数据库"""
+    if not hasattr(request, '_library_version'):
+        request._library_version = get_library_version(request.user.id)
+    return request._library_version
+
+
+def version_to_datetime(version):
+    return datetime.fromtimestamp(version / 1e9, tz=dt_timezone.utc)
+
+
+def make_etag(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+# 以下函数用于 django.views.decorators.http.condition，request 为 DRF Request
+
+def library_etag(request, *args, **kwargs):
+    """图片列表和详情的 ETag：用户图库版本 + 完整请求路径（包含分页、过滤参数）"""
+    return make_etag(request.user.id, get_request_library_version(request), request.get_full_path())
+
+
+def library_last_modified(request, *args, **kwargs):
+    return version_to_datetime(get_request_library_version(request))
+
+
+def get_request_share_payload(request, share_code):
+    """同一个请求中 ETag、Last-Modified 和视图都需要分享内容，未启用分享缓存时也只查询一次数据库"""
+    payloads = request.__dict__.setdefault('_share_payloads', {})
+    if share_code not in payloads:
+        payloads[share_code] = get_share_payload(share_code)
+    return payloads[share_code]
+
+
+def get_valid_share_payload(request, share_code):
+    """只有分享链接有效、未过期且密码正确时才返回校验信息，否则交给视图返回错误"""
+    payload = get_request_share_payload(request, share_code)
+    if payload is None or timezone.now() > payload['expire_time']:
+        return None
+    if not check_share_password(payload, request.query_params.get('password', '')):
+        return None
+    return payload
+
+
+def share_etag(request, share_code):
+    payload = get_valid_share_payload(request, share_code)
+    if payload is None:
+        return None
+    return make_etag(share_code, payload['version'], request.get_full_path())
+
+
+def share_last_modified(request, share_code):
+    payload = get_valid_share_payload(request, share_code)
+    if payload is None:
+        return None
+    return version_to_datetime(payload['version'])
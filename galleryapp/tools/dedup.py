@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from ..models import Image, ImageBlob
+
+logger = logging.getLogger(__name__)
+
+
+def hash_file(upload):
+    """流式计算上传文件的 SHA-256，不会把整个文件读入内存"""
+    sha256 = hashlib.sha256()
+    upload.seek(0)
+    for chunk in upload.chunks():
+        sha256.update(chunk)
+    upload.seek(0)
+    return sha256.hexdigest()
+
+
+def acquire_blob(digest):
+    """相同内容的文件已存在时增加引用计数并返回其文件名，否则返回 None"""
+    blob = ImageBlob.objects.select_for_update().filter(sha256=digest).first()
+    if blob is None:
+        return None
+    ImageBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    return blob.file
+
+
+def register_blob(storage, name, digest, size):
+    """为刚写入的文件创建 ImageBlob，返回实际使用的文件名"""
+    try:
+        with transaction.atomic():
+            ImageBlob.objects.create(sha256=digest, file=name, size=size, ref_count=1)
+    except IntegrityError:
+        # 并发上传了相同内容，使用先写入的文件并删除自己写入的副本
+        storage.delete(name)
+        return acquire_blob(digest)
+    return name
+
+
+def store_image_file(upload):
+    """
+    按内容哈希保存上传文件，返回 (存储中的文件名, 哈希)。
+    相同内容已存在时只增加引用计数，不再重复写入文件。
+    需要在事务中调用，以便与 Image 的写入一起提交或回滚。
+    """
+    digest = hash_file(upload)
+    field = Image._meta.get_field('file')
+
+    name = acquire_blob(digest)
+    if name is not None:
+        return name, digest
+
+    # 以内容哈希命名，配合分片存储即为内容寻址：images/ab/cd/<sha256>.jpg
+    ext = os.path.splitext(upload.name)[1].lower()
+    name = field.storage.save(field.generate_filename(None, f'{digest}{ext}'), upload)
+    return register_blob(field.storage, name, digest, upload.size), digest
+
+
+def adopt_stored_file(name):
+    """
+    登记已经直传到存储中的文件，返回 (文件名, 哈希)，与 store_image_file 一样参与去重和引用计数。
+    相同内容已存在时改为引用已有文件，直传的对象在事务提交后删除。
+    """
+    storage = Image._meta.get_field('file').storage
+    with storage.open(name, 'rb') as f:
+        digest = hash_file(f)
+
+    existing = acquire_blob(digest)
+    if existing is not None:
+        transaction.on_commit(lambda: storage.delete(name))
+        return existing, digest
+    return register_blob(storage, name, digest, storage.size(name)), digest
+
+
+def delete_files(storage, names, workers=1):
+    """删除存储中的文件，workers > 1 时并发删除（对象存储每次删除都是一次网络请求）"""
+    def delete(name):
+        try:
+            storage.delete(name)
+        except OSError as e:
+            logger.error(f"删除文件失败: {name}, {e}")
+
+    if workers > 1 and len(names) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(delete, names))
+    else:
+        for name in names:
+            delete(name)
+
+
+def discard_unreferenced_files(names):
+    """事务回滚后调用：删除 store_image_file 写入但没有 ImageBlob 记录引用的文件"""
+    storage = Image._meta.get_field('file').storage
+    referenced = set(ImageBlob.objects.filter(file__in=names).values_list('file', flat=True))
+    delete_files(storage, [name for name in set(names) if name not in referenced])
+
+
+def release_image_files(images, workers=1):
+    """
+    释放被删除图片引用的文件。images 为包含 file、content_hash、thumbnail、preview 的字典列表。
+    去重文件在最后一个引用消失时才删除，文件删除在事务提交后执行。
+    """
+    storage = Image._meta.get_field('file').storage
+    to_delete = []
+    released = Counter()
+
+    for image in images:
+        if image.get('content_hash'):
+            released[image['content_hash']] += 1
+        elif image.get('file'):
+            to_delete.append(image['file'])  # 去重之前上传的文件只被一张图片引用
+        to_delete.extend(name for name in (image.get('thumbnail'), image.get('preview')) if name)
+
+    with transaction.atomic():
+        for blob in ImageBlob.objects.select_for_update().filter(sha256__in=released):
+            blob.ref_count = max(blob.ref_count - released[blob.sha256], 0)
+            if blob.ref_count == 0:
+                to_delete.append(blob.file)
+                blob.delete()
+            else:
+                blob.save(update_fields=['ref_count'])
+
+        transaction.on_commit(lambda: delete_files(storage, to_delete, workers))
+    return to_delete
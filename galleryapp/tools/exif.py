@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+import django
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image as PILImage, UnidentifiedImageError
+
+# 本模块不导入模型，backfill_image_metadata 的子进程（Windows 下为 spawn）可以直接导入
+
+METADATA_FIELDS = ['width', 'height', 'orientation', 'format', 'file_size', 'taken_at', 'camera_make',
+                   'camera_model']
+
+EXIF_IFD = 0x8769
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_ORIENTATION = 0x0112
+TAG_DATETIME = 0x0132
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_OFFSET_TIME_ORIGINAL = 0x9011
+
+CAMERA_FIELD_LENGTH = 64
+
+
+def clean_text(value):
+    if isinstance(value, bytes):
+        value = value.decode('latin-1')
+    return str(value).replace('\x00', '').strip()[:CAMERA_FIELD_LENGTH] if value else ''
+
+
+def parse_exif_datetime(value, offset=None):
+    """EXIF 时间格式为 'YYYY:MM:DD HH:MM:SS'，没有时区偏移（OffsetTimeOriginal）时按当前时区解释"""
+    try:
+        taken_at = datetime.strptime(clean_text(value)[:19], '%Y:%m:%d %H:%M:%S')
+    except ValueError:
+        return None
+    offset = clean_text(offset)
+    if len(offset) == 6 and offset[0] in '+-' and offset[3] == ':':
+        try:
+            delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[4:6]))
+        except ValueError:
+            delta = None
+        if delta is not None:
+            return taken_at.replace(tzinfo=dt_timezone(-delta if offset[0] == '-' else delta))
+    return timezone.make_aware(taken_at)
+
+
+def get_orientation(width, height):
+    if width == height:
+        return 'square'
+    return 'landscape' if width > height else 'portrait'
+
+
+def extract_metadata(fileobj):
+    """
+    读取尺寸、格式和 EXIF（拍摄时间、相机厂商和型号）。只解析文件头，不解码像素。
+    宽高为按 EXIF 方向旋转后的显示尺寸。
+    """
+    with PILImage.open(fileobj) as source:
+        width, height = source.size
+        image_format = source.format or ''
+        exif = source.getexif()
+    if exif.get(TAG_ORIENTATION) in (5, 6, 7, 8):  # 旋转 90/270 度
+        width, height = height, width
+    exif_ifd = exif.get_ifd(EXIF_IFD)
+    taken_at = exif_ifd.get(TAG_DATETIME_ORIGINAL) or exif.get(TAG_DATETIME)
+    return {
+        'width': width,
+        'height': height,
+        'orientation': get_orientation(width, height),
+        'format': image_format,
+        'taken_at': parse_exif_datetime(taken_at, exif_ifd.get(TAG_OFFSET_TIME_ORIGINAL)) if taken_at else None,
+        'camera_make': clean_text(exif.get(TAG_MAKE)),
+        'camera_model': clean_text(exif.get(TAG_MODEL)),
+    }
+
+
+def store_metadata(image):
+    """后台任务：提取并保存图片元数据"""
+    image.file.open('rb')
+    try:
+        metadata = extract_metadata(image.file)
+        metadata['file_size'] = image.file.size
+    finally:
+        image.file.close()
+    for field, value in metadata.items():
+        setattr(image, field, value)
+    image.save(update_fields=METADATA_FIELDS)
+    return image
+
+
+def init_worker():
+    # spawn 方式启动的子进程需要重新初始化 Django；fork 时重复调用无副作用
+    django.setup()
+
+
+def read_file_metadata(name):
+    """在子进程中读取一个存储文件的元数据，返回 (文件名, 元数据, 错误信息)"""
+    try:
+        with default_storage.open(name, 'rb') as f:
+            metadata = extract_metadata(f)
+        metadata['file_size'] = default_storage.size(name)
+        return name, metadata, None
+    except (OSError, UnidentifiedImageError, SyntaxError, ValueError) as e:
+        return name, None, str(e)
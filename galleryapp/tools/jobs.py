@@ -0,0 +1,116 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from ..models import Image, ImageJob
+from .renditions import generate_renditions
+from .phash import store_phash
+from .exif import store_metadata
+from .share_cache import invalidate_shares_for_images
+from .conditional import bump_library_version
+
+logger = logging.getLogger(__name__)
+
+# 任务类型 -> 处理函数，处理函数接收一个 Image 实例
+JOB_HANDLERS = {
+    'renditions': generate_renditions,
+    'phash': store_phash,
+    'metadata': store_metadata,
+}
+
+# 上传后默认执行的任务
+DEFAULT_IMAGE_JOBS = ['renditions', 'phash', 'metadata']
+
+MAX_ATTEMPTS = 3  # 最大尝试次数
+RETRY_DELAY_SECONDS = 30  # 首次重试延迟，之后按指数退避
+
+
+def enqueue_image_jobs(images, job_types=None):
+    """为一批图片创建后台任务，并将图片状态置为 pending"""
+    job_types = job_types or DEFAULT_IMAGE_JOBS
+    images = list(images)
+    if not images:
+        return []
+
+    jobs = ImageJob.objects.bulk_create([
+        ImageJob(image=image, job_type=job_type)
+        for image in images for job_type in job_types
+    ])
+    Image.objects.filter(id__in=[image.id for image in images]).update(status='pending')
+    for image in images:
+        image.status = 'pending'
+    for user_id in {image.uploaded_by_id for image in images}:
+        bump_library_version(user_id)
+
+    # 开发环境可以配置为同步执行，无需启动 worker
+    if getattr(settings, 'IMAGE_JOBS_EAGER', False):
+        for job in ImageJob.objects.filter(id__in=[job.id for job in jobs]).select_related('image'):
+            run_job(job)
+        for image in images:
+            image.refresh_from_db()
+    return jobs
+
+
+def claim_jobs(limit):
+    """领取一批待执行任务，多个 worker 并发时通过 SKIP LOCKED 避免重复领取"""
+    with transaction.atomic():
+        ids = list(
+            ImageJob.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', run_after__lte=timezone.now())
+            .order_by('id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        ImageJob.objects.filter(id__in=ids).update(status='running', updated_at=timezone.now())
+    return list(ImageJob.objects.filter(id__in=ids).select_related('image').order_by('id'))
+
+
+def run_job(job):
+    """执行单个任务，失败时按指数退避重试"""
+    handler = JOB_HANDLERS.get(job.job_type)
+    image = job.image
+    job.attempts += 1
+    if image.status != 'processing':
+        image.status = 'processing'
+        Image.objects.filter(id=image.id).update(status='processing')
+
+    try:
+        if handler is None:
+            raise ValueError(f"未知的任务类型: {job.job_type}")
+        handler(image)
+    except Exception as e:
+        logger.error(f"图片任务执行失败: {job}, {e}")
+        job.last_error = str(e)
+        if job.attempts < MAX_ATTEMPTS and handler is not None:
+            job.status = 'pending'
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_DELAY_SECONDS * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+        job.save(update_fields=['status', 'attempts', 'last_error', 'run_after', 'updated_at'])
+    else:
+        job.status = 'done'
+        job.save(update_fields=['status', 'attempts', 'updated_at'])
+
+    refresh_image_status(image)
+    return job
+
+
+def refresh_image_status(image):
+    """根据图片剩余任务更新图片处理状态"""
+    jobs = ImageJob.objects.filter(image_id=image.id)
+    if jobs.filter(status__in=['pending', 'running']).exists():
+        return image.status
+    image.status = 'failed' if jobs.filter(status='failed').exists() else 'ready'
+    Image.objects.filter(id=image.id).update(status=image.status)
+    # update() 不触发信号，手动清除分享缓存并更新图库版本
+    invalidate_shares_for_images([image.id])
+    bump_library_version(image.uploaded_by_id)
+    return image.status
+
+
+def requeue_stale_jobs(stale_after):
+    """将长时间处于 running 的任务（worker 异常退出）重新放回队列"""
+    deadline = timezone.now() - timedelta(seconds=stale_after)
+    return ImageJob.objects.filter(status='running', updated_at__lt=deadline).update(status='pending')
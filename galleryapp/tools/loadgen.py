@@ -0,0 +1,120 @@
+import asyncio
+import math
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, p):
+    """最近秩法百分位数，sorted_values 需已排序"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def to_ms(value):
+    return round(value * 1000, 2) if value is not None else None
+
+
+def summarize(latencies, errors, elapsed, statuses=None):
+    """汇总一组请求的延迟（秒），返回吞吐量和毫秒单位的延迟分位数"""
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed_seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'latency_ms': {
+            'mean': to_ms(sum(latencies) / len(latencies)) if latencies else None,
+            'p50': to_ms(percentile(latencies, 50)),
+            'p95': to_ms(percentile(latencies, 95)),
+            'p99': to_ms(percentile(latencies, 99)),
+            'max': to_ms(latencies[-1]) if latencies else None,
+        },
+        'status_codes': dict(sorted((statuses or {}).items())),
+    }
+
+
+class HTTPConnection:
+    """极简的 HTTP/1.1 keep-alive 客户端，只支持 GET，足够用于压测只读接口"""
+
+    def __init__(self, host, port, timeout):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.reader = self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port),
+                                                          self.timeout)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def get(self, path, headers):
+        if self.writer is None:
+            await self.connect()
+        lines = [f'GET {path} HTTP/1.1', f'Host: {self.host}:{self.port}', 'Connection: keep-alive']
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+        await self.writer.drain()
+        return await asyncio.wait_for(self.read_response(), self.timeout)
+
+    async def read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('连接已关闭')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        elif status not in (204, 304):
+            await self.reader.read()  # 没有长度信息，读到连接关闭
+            self.close()
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status
+
+
+async def run_load(url, concurrency=50, duration=10.0, headers=None, timeout=30.0):
+    """
+    以 concurrency 个并发连接在 duration 秒内持续请求 url，返回 summarize() 的结果。
+    每个连接复用 keep-alive，请求失败时重新建立连接。
+    """
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    headers = headers or {}
+    latencies, statuses, errors = [], {}, 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        connection = HTTPConnection(parts.hostname, parts.port or 80, timeout)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = await connection.get(path, headers)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError):
+                errors += 1
+                connection.close()
+                continue
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+        connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started, statuses)
@@ -0,0 +1,150 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from ..models import Image
+from .conditional import get_valid_share_payload
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """
+    解析单个 Range 头，返回 (start, end)，end 包含在内。
+    不带 Range、多段 Range 或格式错误时返回 None（返回完整文件），范围无法满足时返回 False。
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # bytes=-500 表示最后 500 字节
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def if_range_matches(request, etag, mtime):
+    """If-Range 与当前 ETag 或修改时间一致时才按 Range 返回部分内容"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and since >= int(mtime)
+
+
+def iter_range(f, length):
+    """读取文件中指定长度的内容"""
+    try:
+        while length > 0:
+            data = f.read(min(STREAM_BLOCK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def is_private_media(name):
+    """开启 MEDIA_REQUIRE_AUTH 时，图片及其缩略图、预览图需要鉴权，头像等其他文件公开"""
+    return getattr(settings, 'MEDIA_REQUIRE_AUTH', False) and name.startswith('images/')
+
+
+def can_access_media(request, name):
+    """
+    图片所有者可以访问；通过 ?share=分享码&password=密码 访问时，
+    分享链接必须有效且包含该文件（使用分享缓存校验，不查库）。
+    """
+    share_code = request.query_params.get('share')
+    if share_code:
+        payload = get_valid_share_payload(request, share_code)
+        if payload is None:
+            return False
+        url = default_storage.url(name)
+        return any(url in (image['file'], image['thumbnail'], image['preview']) for image in payload['images'])
+    if not request.user.is_authenticated:
+        return False
+    return Image.objects.filter(Q(file=name) | Q(thumbnail=name) | Q(preview=name),
+                                uploaded_by=request.user).exists()
+
+
+def set_cache_headers(response, etag, mtime, private):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    response['Accept-Ranges'] = 'bytes'
+    max_age = getattr(settings, 'MEDIA_CACHE_MAX_AGE', 30 * 24 * 3600)
+    if private:
+        patch_cache_control(response, private=True, max_age=max_age)
+    else:
+        patch_cache_control(response, public=True, max_age=max_age)
+    return response
+
+
+def serve_media_file(request, name, private=False):
+    """
+    返回 MEDIA_ROOT 下的文件 name（相对路径，调用方需确保路径安全）。
+    配置了 MEDIA_ACCEL_REDIRECT_PREFIX 或 MEDIA_SENDFILE_HEADER 时只返回响应头，由前端代理发送文件内容；
+    否则由 Python 发送，支持 Range、ETag 和 Last-Modified；完整文件和到结尾的 Range 通过
+    wsgi.file_wrapper 发送，gunicorn 等服务器会使用 os.sendfile 零拷贝。
+    """
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    stat = os.stat(path)
+    size, mtime = stat.st_size, stat.st_mtime
+    etag = f'"{size:x}-{stat.st_mtime_ns:x}"'
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(mtime))
+    if not_modified is not None:
+        return set_cache_headers(not_modified, etag, mtime, private)
+
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', None)
+    sendfile_header = getattr(settings, 'MEDIA_SENDFILE_HEADER', None)
+    if accel_prefix:
+        # nginx: internal location 指向 MEDIA_ROOT，Range 由 nginx 处理
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(name)
+        return set_cache_headers(response, etag, mtime, private)
+    if sendfile_header:
+        # Apache mod_xsendfile / lighttpd
+        response = HttpResponse(content_type=content_type)
+        response[sendfile_header] = path
+        return set_cache_headers(response, etag, mtime, private)
+
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), size) if if_range_matches(request, etag, mtime) else None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    f = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(f, content_type=content_type)
+    else:
+        start, end = byte_range
+        f.seek(start)
+        if end == size - 1:
+            # 到文件结尾的 Range 仍可以走 file_wrapper / sendfile
+            response = FileResponse(f, status=206, content_type=content_type)
+        else:
+            response = StreamingHttpResponse(iter_range(f, end - start + 1), status=206, content_type=content_type)
+            response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return set_cache_headers(response, etag, mtime, private)
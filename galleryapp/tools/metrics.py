@@ -0,0 +1,217 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# 当前请求的性能数据。contextvar 会随 sync_to_async / async_to_sync 传递，
+# 异步视图中在线程池执行的 ORM 查询同样记到发起请求的那个请求上
+_current_metrics = contextvars.ContextVar('request_metrics', default=None)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class RequestMetrics:
+    """单个请求的性能数据：总耗时、SQL 数量和耗时、缓存命中、序列化耗时、响应字节数"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total_time = None
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.serialize_time = 0.0
+        self.response_bytes = None
+
+    def finish(self, response):
+        self.total_time = time.perf_counter() - self.start
+        if not response.streaming:
+            self.response_bytes = len(response.content)
+        elif response.has_header('Content-Length'):
+            # FileResponse 等流式响应不读取内容，使用声明的长度
+            self.response_bytes = int(response['Content-Length'])
+
+    def server_timing(self):
+        """Server-Timing 响应头，浏览器开发者工具的 Timing 面板可直接查看"""
+        return ', '.join([
+            f'total;dur={self.total_time * 1000:.1f}',
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'serialize;dur={self.serialize_time * 1000:.1f}',
+        ])
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total_time * 1000, 2),
+            'db_queries': self.db_queries,
+            'db_ms': round(self.db_time * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'serialize_ms': round(self.serialize_time * 1000, 2),
+            'response_bytes': self.response_bytes,
+        }
+
+
+def start_request():
+    """开始记录一个请求，返回 (metrics, token)，结束时调用 end_request(token)"""
+    metrics = RequestMetrics()
+    return metrics, _current_metrics.set(metrics)
+
+
+def end_request(token):
+    _current_metrics.reset(token)
+
+
+def get_current_metrics():
+    """当前请求的 RequestMetrics，不在请求中（管理命令、后台任务）时为 None"""
+    return _current_metrics.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """数据库 execute_wrapper，统计当前请求的 SQL 数量和耗时"""
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created 信号处理函数：每个线程的数据库连接都挂上 record_query"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def record_cache_lookup(hits, misses):
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+@contextmanager
+def measure_serialization():
+    metrics = _current_metrics.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.serialize_time += time.perf_counter() - start
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """进程内计数器，按标签分组"""
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f'{self.name}{format_labels(self.labelnames, key)} {format_value(value)}'
+
+
+class Histogram:
+    """进程内直方图，按标签分组，桶的上界与 Prometheus 一致（value <= le）"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # 标签 -> [各桶计数（非累计）, 总和, 总数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0]
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = format_labels(self.labelnames, key, [('le', format_value(float(bound)))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            yield f'{self.name}_bucket{format_labels(self.labelnames, key, [("le", "+Inf")])} {count}'
+            yield f'{self.name}_sum{format_labels(self.labelnames, key)} {format_value(total)}'
+            yield f'{self.name}_count{format_labels(self.labelnames, key)} {count}'
+
+
+REQUEST_DURATION = Histogram('sugallery_request_duration_seconds', '请求总耗时（秒）', DURATION_BUCKETS,
+                             ('method', 'view', 'status'))
+DB_QUERIES = Histogram('sugallery_request_db_queries', '每个请求的 SQL 数量', QUERY_COUNT_BUCKETS, ('view',))
+DB_DURATION = Histogram('sugallery_request_db_seconds', '每个请求的 SQL 总耗时（秒）', DURATION_BUCKETS, ('view',))
+SERIALIZE_DURATION = Histogram('sugallery_request_serialize_seconds', '每个请求的序列化耗时（秒）',
+                               DURATION_BUCKETS, ('view',))
+RESPONSE_SIZE = Histogram('sugallery_response_bytes', '响应体字节数', SIZE_BUCKETS, ('view',))
+CACHE_LOOKUPS = Counter('sugallery_cache_lookups_total', '缓存读取次数，result 为 hit 或 miss', ('view', 'result'))
+
+REGISTRY = [REQUEST_DURATION, DB_QUERIES, DB_DURATION, SERIALIZE_DURATION, RESPONSE_SIZE, CACHE_LOOKUPS]
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def observe_request(metrics, method, view, status):
+    """把一个请求的数据汇总到进程内直方图"""
+    REQUEST_DURATION.observe(metrics.total_time, method=method, view=view, status=str(status))
+    DB_QUERIES.observe(metrics.db_queries, view=view)
+    DB_DURATION.observe(metrics.db_time, view=view)
+    SERIALIZE_DURATION.observe(metrics.serialize_time, view=view)
+    if metrics.response_bytes is not None:
+        RESPONSE_SIZE.observe(metrics.response_bytes, view=view)
+    if metrics.cache_hits:
+        CACHE_LOOKUPS.inc(metrics.cache_hits, view=view, result='hit')
+    if metrics.cache_misses:
+        CACHE_LOOKUPS.inc(metrics.cache_misses, view=view, result='miss')
+
+
+def render_metrics(registry=REGISTRY):
+    """Prometheus 文本格式。数据只在本进程内，多进程部署时每个 worker 分别抓取"""
+    lines = []
+    for metric in registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
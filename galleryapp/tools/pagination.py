@@ -1,5 +1,14 @@
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+import base64
+import hashlib
+import json
 
 
 class CustomPagination(PageNumberPagination):
@@ -15,11 +24,167 @@ class CustomPagination(PageNumberPagination):
             return 50
         return super().get_page_size(request)
 
-    def get_paginated_response(self, data):
-        return Response({
+    async def apaginate_queryset(self, queryset, request):
+        """异步视图使用：通过 acount() 和 async for 取当前页，request 为 DRF Request"""
+        self.request = request
+        page_size = self.get_page_size(request)
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        bottom = (number - 1) * page_size
+        results = [item async for item in queryset[bottom:bottom + page_size]]
+        self.page = paginator._get_page(results, number, paginator)
+        return results
+
+    def get_paginated_data(self, data):
+        return {
             'count': self.page.paginator.count,
             'total_pages': self.page.paginator.num_pages,
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'results': data
-        })
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+
+class KeysetPagination(CustomPagination):
+    """
+    游标（keyset）分页：按 (排序字段, id) 定位下一页，不使用 OFFSET，
+    翻到第 N 页与第一页的代价相同。默认不计算总数，传 with_count=1 时返回缓存的总数。
+    通过 ?pagination=cursor 或携带 cursor 参数启用。
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'with_count'
+    count_cache_timeout = 60  # 总数缓存时间（秒）
+    ordering = ('-created_at', '-id')  # 最后一个字段必须唯一，保证游标位置确定
+
+    def __init__(self, ordering=None):
+        if ordering:
+            self.ordering = ordering
+
+    @classmethod
+    def is_requested(cls, request):
+        return request.query_params.get('pagination') == 'cursor' or cls.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        return self.set_results(list(queryset[:self.page_size + 1]))
+
+    async def apaginate_queryset(self, queryset, request):
+        queryset = self.get_page_queryset(queryset, request)
+        return self.set_results([item async for item in queryset[:self.page_size + 1]])
+
+    def get_page_queryset(self, queryset, request):
+        """按游标构造当前页的查询，取数由同步或异步的 paginate_queryset 完成"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.fields = [(field.lstrip('-'), field.startswith('-')) for field in self.ordering]
+        self.model = queryset.model
+        self.base_queryset = queryset
+        self.count = None
+
+        values, reverse = self.decode_cursor(request)
+        ordering = self.ordering
+        if reverse:
+            # 向前翻页时反转排序，取完后再把结果倒回来
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.build_filter(values, reverse))
+        self.page_queryset = queryset
+        self.cursor_values, self.reverse = values, reverse
+        return queryset
+
+    def set_results(self, results):
+        values, reverse = self.cursor_values, self.reverse
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = values is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+
+        self.results = results
+        return results
+
+    def build_filter(self, values, reverse):
+        """构造 (f1, f2, ...) 按排序方向严格位于游标之后的条件，支持各字段排序方向不同"""
+        condition = Q()
+        for i, (name, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending != reverse else 'gt'
+            clause = Q(**{f'{name}__{lookup}': values[i]})
+            for j in range(i):
+                clause &= Q(**{self.fields[j][0]: values[j]})
+            condition |= clause
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            values = [self.model._meta.get_field(name).to_python(value)
+                      for (name, _), value in zip(self.fields, payload['v'], strict=True)]
+            return values, bool(payload.get('r'))
+        except (ValueError, TypeError, KeyError, DjangoValidationError, FieldDoesNotExist):
+            raise NotFound('无效的游标。')
+
+    def encode_cursor(self, instance, reverse=False):
+        values = []
+        for name, _ in self.fields:
+            value = getattr(instance, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        payload = json.dumps({'v': values, 'r': reverse}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def get_cursor_link(self, cursor):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if not self.has_next or not self.results:
+            return None
+        return self.get_cursor_link(self.encode_cursor(self.results[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.results:
+            return None
+        return self.get_cursor_link(self.encode_cursor(self.results[0], reverse=True))
+
+    def get_count(self):
+        """总数开销大，只在显式请求时计算，并按查询语句缓存"""
+        if self.request.query_params.get(self.count_query_param) not in ('1', 'true'):
+            return None
+        query_hash = hashlib.md5(str(self.base_queryset.query).encode()).hexdigest()
+        return cache.get_or_set(f'pagination_count:{query_hash}', self.base_queryset.count,
+                                timeout=self.count_cache_timeout)
+
+    async def aget_count(self):
+        if self.request.query_params.get(self.count_query_param) not in ('1', 'true'):
+            return None
+        key = f'pagination_count:{hashlib.md5(str(self.base_queryset.query).encode()).hexdigest()}'
+        count = await cache.aget(key)
+        if count is None:
+            count = await self.base_queryset.acount()
+            await cache.aset(key, count, timeout=self.count_cache_timeout)
+        return count
+
+    def get_paginated_data(self, data, count=None):
+        return {
+            'count': count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data, self.get_count()))
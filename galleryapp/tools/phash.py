@@ -0,0 +1,117 @@
+from functools import lru_cache
+from itertools import combinations
+import numpy as np
+from django.db.models import Q
+from PIL import Image as PILImage, ImageOps
+from ..models import Image
+
+HASH_SIZE = 8  # 取 DCT 左上角 8x8 低频系数，得到 64 位哈希
+SAMPLE_SIZE = 32  # 计算 DCT 前将图片缩放到 32x32 灰度图
+BAND_COUNT = 4  # 哈希按 16 位拆成 4 段，每段单独建索引（多索引哈希）
+BAND_BITS = 16
+MAX_BAND_RADIUS = 1  # 每段允许的最大汉明距离，决定了可保证召回的最大距离
+MAX_DISTANCE = BAND_COUNT * (MAX_BAND_RADIUS + 1) - 1  # 鸽巢原理：距离 <= 7 时至少有一段距离 <= 1
+
+BAND_FIELDS = [f'phash_band{i}' for i in range(BAND_COUNT)]
+
+
+@lru_cache(maxsize=None)
+def dct_matrix(n):
+    """DCT-II 变换矩阵，对图片做 M @ X @ M.T 即二维 DCT"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0, :] = np.sqrt(1.0 / n)
+    return matrix
+
+
+def compute_phash(fileobj):
+    """计算图片的 64 位感知哈希 (pHash)，返回无符号整数"""
+    with PILImage.open(fileobj) as source:
+        source.draft('L', (SAMPLE_SIZE * 4, SAMPLE_SIZE * 4))  # JPEG 解码时直接降采样，避免解码完整原图
+        gray = ImageOps.exif_transpose(source).convert('L').resize((SAMPLE_SIZE, SAMPLE_SIZE),
+                                                                  PILImage.Resampling.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.float64)
+    matrix = dct_matrix(SAMPLE_SIZE)
+    low = (matrix @ pixels @ matrix.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    # 与除直流分量外的中位数比较，得到 64 个比特
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def to_signed(value):
+    """无符号 64 位转为有符号，以便存入 BigIntegerField"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def split_bands(value):
+    """将 64 位哈希拆成 4 段 16 位整数"""
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (BAND_BITS * i)) & mask for i in range(BAND_COUNT)]
+
+
+def hamming_distance(a, b):
+    return bin(to_unsigned(a) ^ to_unsigned(b)).count('1')
+
+
+def band_neighbors(band, radius):
+    """与某一段汉明距离不超过 radius 的所有取值"""
+    values = [band]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(BAND_BITS), r):
+            flipped = band
+            for bit in bits:
+                flipped ^= 1 << bit
+            values.append(flipped)
+    return values
+
+
+def store_phash(image):
+    """计算并保存图片的感知哈希；相同内容的图片直接复用已算好的哈希"""
+    value = None
+    if image.content_hash:
+        value = (Image.objects.filter(content_hash=image.content_hash, phash__isnull=False)
+                 .values_list('phash', flat=True).first())
+    if value is None:
+        image.file.open('rb')
+        try:
+            value = to_signed(compute_phash(image.file))
+        finally:
+            image.file.close()
+
+    image.phash = value
+    for field, band in zip(BAND_FIELDS, split_bands(to_unsigned(value))):
+        setattr(image, field, band)
+    image.save(update_fields=['phash', *BAND_FIELDS])
+    return image
+
+
+def find_similar_images(image, max_distance, limit=20):
+    """
+    查找同一用户下与 image 视觉相似的图片，返回 [(Image, 距离)]，按距离升序。
+    先通过各段索引取候选（每段汉明距离 <= radius），再精确计算完整哈希的距离，
+    不需要扫描用户的全部图片。
+    """
+    if image.phash is None:
+        return []
+    max_distance = min(max_distance, MAX_DISTANCE)
+    radius = max_distance // BAND_COUNT
+
+    condition = Q()
+    for field, band in zip(BAND_FIELDS, split_bands(to_unsigned(image.phash))):
+        condition |= Q(**{f'{field}__in': band_neighbors(band, radius)})
+
+    candidates = (Image.objects.filter(condition, uploaded_by_id=image.uploaded_by_id)
+                  .exclude(id=image.id)
+                  .values_list('id', 'phash'))
+    matches = sorted(
+        (distance, pk) for pk, phash in candidates
+        if (distance := hamming_distance(image.phash, phash)) <= max_distance
+    )[:limit]
+
+    images = Image.objects.in_bulk([pk for _, pk in matches])
+    return [(images[pk], distance) for distance, pk in matches if pk in images]
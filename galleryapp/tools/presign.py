@@ -0,0 +1,137 @@
+import os
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlsplit
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.crypto import constant_time_compare, salted_hmac
+from PIL import Image as PILImage, UnidentifiedImageError
+from ..storage import S3Storage
+
+SIGNATURE_SALT = 'galleryapp.presigned_upload'
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def sign_upload(name, expires, max_size):
+    """用 SECRET_KEY 对 (文件名, 过期时间, 最大字节数) 做 HMAC-SHA256 签名"""
+    return salted_hmac(SIGNATURE_SALT, f'{name}\n{expires}\n{max_size}', algorithm='sha256').hexdigest()
+
+
+def verify_upload_signature(name, expires, max_size, signature):
+    try:
+        if int(expires) < time.time():
+            return False
+    except (TypeError, ValueError):
+        return False
+    return constant_time_compare(sign_upload(name, expires, max_size), signature or '')
+
+
+def verify_uploaded_image(storage, name):
+    """直传的文件没有经过 Django 校验，确认时用 Pillow 检查文件结构（verify() 不解码像素）"""
+    try:
+        with storage.open(name) as f, PILImage.open(f) as image:
+            image.verify()
+    except (OSError, UnidentifiedImageError, SyntaxError, ValueError, PILImage.DecompressionBombError):
+        return False
+    return True
+
+
+def build_upload_target(intent):
+    """
+    返回客户端上传所需的信息 {'method', 'url', 'fields'}。
+    S3 存储使用桶原生的预签名 POST（content-length-range 限制大小）；
+    本地存储使用 run_upload_receiver 服务，URL 中携带 HMAC 签名。
+    """
+    expires = int(intent.expires_at.timestamp())
+    if isinstance(default_storage, S3Storage):
+        post = default_storage.client.generate_presigned_post(
+            default_storage.bucket_name, intent.storage_name,
+            Conditions=[['content-length-range', 1, intent.max_size]],
+            ExpiresIn=max(expires - int(time.time()), 1),
+        )
+        return {'method': 'POST', 'url': post['url'], 'fields': post['fields']}
+
+    query = urlencode({'expires': expires, 'max_size': intent.max_size,
+                       'signature': sign_upload(intent.storage_name, expires, intent.max_size)})
+    url = settings.PRESIGNED_UPLOAD_URL.rstrip('/') + '/' + quote(intent.storage_name) + '?' + query
+    return {'method': 'PUT', 'url': url, 'fields': {}}
+
+
+class UploadReceiverHandler(BaseHTTPRequestHandler):
+    """
+    接收 PUT /upload/<存储文件名>?expires=&max_size=&signature= 的请求，校验签名后写入本地存储。
+    不经过 Django 的中间件和数据库，只负责流式落盘。
+    """
+    storage = None
+
+    def send_cors_headers(self):
+        # 只允许 CORS_ALLOWED_ORIGINS 中的前端跨域上传
+        origin = self.headers.get('Origin')
+        if origin and origin in getattr(settings, 'CORS_ALLOWED_ORIGINS', []):
+            self.send_header('Access-Control-Allow-Origin', origin)
+        self.send_header('Vary', 'Origin')
+        self.send_header('Access-Control-Allow-Methods', 'PUT, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Content-Length')
+
+    def reply(self, code, message=''):
+        body = message.encode()
+        self.send_response(code)
+        self.send_cors_headers()
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self.send_cors_headers()
+        self.end_headers()
+
+    def do_PUT(self):
+        url = urlsplit(self.path)
+        prefix = urlsplit(settings.PRESIGNED_UPLOAD_URL).path.rstrip('/') + '/'
+        if not url.path.startswith(prefix):
+            return self.reply(404, 'not found')
+        name = unquote(url.path[len(prefix):])
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if not verify_upload_signature(name, params.get('expires'), params.get('max_size'), params.get('signature')):
+            return self.reply(403, 'invalid or expired signature')
+
+        try:
+            length = int(self.headers['Content-Length'])
+        except (TypeError, ValueError):
+            return self.reply(411, 'Content-Length required')
+        if length <= 0 or length > int(params['max_size']):
+            return self.reply(413, 'file too large')
+
+        path = self.storage.path(name)
+        if os.path.exists(path):
+            return self.reply(409, 'already uploaded')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件，收完整后再原子地改名，确认接口不会看到半个文件
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                remaining = length
+                while remaining > 0:
+                    chunk = self.rfile.read(min(COPY_BUFFER_SIZE, remaining))
+                    if not chunk:
+                        raise ConnectionError('client disconnected')
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self.reply(201, 'created')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_upload_receiver(host, port, storage=None):
+    """创建上传接收服务；只支持提供 path() 的本地存储"""
+    handler = type('UploadReceiver', (UploadReceiverHandler,), {'storage': storage or default_storage})
+    return ThreadingHTTPServer((host, port), handler)
@@ -0,0 +1,142 @@
+import cProfile
+import marshal
+import os
+import sys
+import threading
+from collections import Counter
+from datetime import timedelta
+from urllib.parse import parse_qsl, urlencode
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from ..models import RequestProfile
+
+TOKEN_SALT = 'galleryapp.profiling'
+PROFILE_MODES = ('sample', 'cprofile')
+PROFILING_PARAMS = ('_profile', '_profile_mode')
+
+
+def make_profiling_token(user):
+    """为管理员签发剖析令牌，请求时放在 X-Profile-Token 头或 ?_profile= 参数中"""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user.pk))
+
+
+def read_profiling_token(token):
+    """校验令牌，返回签发者的用户ID；无效或过期时返回 None"""
+    try:
+        return int(signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def strip_profiling_params(query_string):
+    """剖析令牌相当于管理员凭证，保存请求的查询字符串前去掉剖析参数"""
+    params = parse_qsl(query_string, keep_blank_values=True)
+    return urlencode([(key, value) for key, value in params if key not in PROFILING_PARAMS])
+
+
+def profile_limit_reached(requested_by):
+    """每个管理员在一个令牌有效期内最多剖析 PROFILING_MAX_PROFILES 个请求，避免令牌泄露后被用来写满数据库"""
+    since = timezone.now() - timedelta(seconds=settings.PROFILING_TOKEN_MAX_AGE)
+    profiles = RequestProfile.objects.filter(requested_by_id=requested_by, created_at__gte=since)
+    return profiles.count() >= settings.PROFILING_MAX_PROFILES
+
+
+def short_filename(filename):
+    """项目内的文件使用相对路径，第三方库从 site-packages 之后开始，缩短火焰图中的帧名"""
+    base_dir = str(settings.BASE_DIR)
+    if filename.startswith(base_dir):
+        return os.path.relpath(filename, base_dir)
+    _, marker, rest = filename.rpartition('site-packages' + os.sep)
+    return rest if marker else filename
+
+
+def frame_label(filename, lineno, name):
+    # 折叠栈格式以 ; 分隔帧、以空格分隔计数，帧名中不能出现 ;
+    return f'{name} ({short_filename(filename)}:{lineno})'.replace(';', ':')
+
+
+class StackSampler(threading.Thread):
+    """
+    采样剖析：后台线程每隔 interval 秒读取目标线程的调用栈并计数。
+    只采集到 root_code（发起剖析的函数）为止，外层的服务器和中间件帧不计入。
+    """
+
+    def __init__(self, thread_id, root_code, interval):
+        super().__init__(name='request-profiler', daemon=True)
+        self.thread_id, self.root_code, self.interval = thread_id, root_code, interval
+        self.counts = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame.f_code is not self.root_code:
+                code = frame.f_code
+                stack.append(frame_label(code.co_filename, code.co_firstlineno,
+                                         getattr(code, 'co_qualname', code.co_name)))
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.counts.most_common())
+
+
+def pstats_to_collapsed(stats, max_depth=64):
+    """
+    把 cProfile 的统计（调用者 -> 被调用者的边）展开为折叠栈，数值为微秒。
+    pstats 不记录完整调用栈，函数被多处调用时按各调用边的耗时比例分摊，结果是近似的。
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            callees.setdefault(caller, []).append((func, cumulative))
+
+    lines = Counter()
+
+    def walk(func, stack, allotted):
+        _, _, total_time, cumulative, _ = stats[func]
+        ratio = allotted / cumulative if cumulative else 0
+        stack = stack + [frame_label(*func)]
+        own = round(total_time * ratio * 1_000_000)
+        if own > 0:
+            lines[';'.join(stack)] += own
+        if len(stack) >= max_depth:
+            return
+        for callee, edge_time in callees.get(func, ()):
+            # 跳过递归调用和不足 1 微秒的分支，避免调用图过大时组合爆炸
+            if callee in stats and edge_time * ratio >= 1e-6 and frame_label(*callee) not in stack:
+                walk(callee, stack, edge_time * ratio)
+
+    for func, (_, _, _, cumulative, callers) in stats.items():
+        if not callers:
+            walk(func, [], cumulative)
+    return ''.join(f'{stack} {value}\n' for stack, value in lines.most_common())
+
+
+def profile_call(func, mode):
+    """
+    在剖析器下执行 func()，返回 (结果, 折叠栈文本, pstats 数据或 None, 采样次数)。
+    采样模式开销小且不改变调用耗时的比例；cProfile 模式记录每次调用，结果精确但会放慢请求。
+    """
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            result = profiler.runcall(func)
+        finally:
+            profiler.create_stats()
+        return result, pstats_to_collapsed(profiler.stats), marshal.dumps(profiler.stats), 0
+
+    sampler = StackSampler(threading.get_ident(), profile_call.__code__, settings.PROFILING_SAMPLE_INTERVAL)
+    sampler.start()
+    try:
+        result = func()
+    finally:
+        sampler.stop()
+    return result, sampler.collapsed(), None, sum(sampler.counts.values())
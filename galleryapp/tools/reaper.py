@@ -0,0 +1,107 @@
+import heapq
+import posixpath
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Collate
+from django.utils import timezone
+from users.models import CustomUser
+from ..models import Image, ImageBlob, UploadIntent
+from .dedup import release_image_files
+
+
+def reap_batch(cutoff, batch_size, workers=1):
+    """
+    物理删除一批在 cutoff 之前标记删除的图片，返回删除的数量。
+    每批一个短事务，级联删除的标签、分享关联和任务记录也只涉及这一批；文件在提交后并发删除。
+    """
+    with transaction.atomic():
+        ids = list(Image.all_objects.select_for_update(skip_locked=True)
+                   .filter(deleted_at__lte=cutoff).order_by('deleted_at')
+                   .values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        images = Image.all_objects.filter(id__in=ids)
+        files = list(images.values('file', 'content_hash', 'thumbnail', 'preview'))
+        images.delete()
+        release_image_files(files, workers)
+    return len(ids)
+
+
+def reap_deleted_images(batch_size=500, grace_seconds=0, workers=8):
+    """清理所有到期的已删除图片，返回删除的总数"""
+    cutoff = timezone.now() - timedelta(seconds=grace_seconds)
+    total = 0
+    while True:
+        count = reap_batch(cutoff, batch_size, workers)
+        if not count:
+            return total
+        total += count
+
+
+# 引用了存储文件的字段，sweep_orphan_media 据此判断文件是否仍被使用
+REFERENCE_FIELDS = [
+    (Image, 'file'),
+    (Image, 'thumbnail'),
+    (Image, 'preview'),
+    (ImageBlob, 'file'),
+    (UploadIntent, 'storage_name'),  # 已上传但尚未确认的直传文件
+    (CustomUser, 'avatar'),
+]
+
+
+# 按二进制（码位）顺序排序所需的排序规则，与 Python 字符串比较一致；SQLite 默认即为 BINARY
+BINARY_COLLATIONS = {'mysql': 'utf8mb4_bin', 'postgresql': 'C'}
+
+
+def iter_field_names(model, field, chunk_size=2000):
+    """
+    按字符串顺序分页返回某个字段引用的文件名（去重）。
+    每页是一次独立的键集查询（name > 上一页最后一个），MySQL 的 iterator() 会把整个结果集读到客户端，分页则不会
+    """
+    collation = BINARY_COLLATIONS.get(connection.vendor)
+    queryset = (model._base_manager.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .annotate(sort_name=Collate(field, collation) if collation else F(field))
+                .order_by('sort_name').values_list('sort_name', flat=True).distinct())
+    last = None
+    while True:
+        page = queryset.filter(sort_name__gt=last) if last is not None else queryset
+        names = list(page[:chunk_size])
+        yield from names
+        if len(names) < chunk_size:
+            return
+        last = names[-1]
+
+
+def iter_referenced_names(chunk_size=2000):
+    """按字符串顺序流式返回数据库中引用的所有文件名（可能重复），每个字段分页读取，归并排序"""
+    return heapq.merge(*(iter_field_names(model, field, chunk_size) for model, field in REFERENCE_FIELDS))
+
+
+def iter_storage_names(storage, directory):
+    """
+    按字符串顺序逐个列出目录下的所有文件，内存中只保留当前目录的列表。
+    目录按 "名称/" 参与排序，保证 images/ab.jpg 排在 images/ab/... 之前，与完整路径的排序一致。
+    """
+    try:
+        dirs, files = storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    entries = sorted([(f'{name}/', True) for name in dirs] + [(name, False) for name in files])
+    for key, is_dir in entries:
+        path = posixpath.join(directory, key.rstrip('/'))
+        if is_dir:
+            yield from iter_storage_names(storage, path)
+        else:
+            yield path
+
+
+def find_orphans(storage_names, referenced_names):
+    """两个有序序列的差集（在存储中但没有被引用的文件），流式归并，不需要把任何一方读入内存"""
+    referenced = iter(referenced_names)
+    current = next(referenced, None)
+    for name in storage_names:
+        while current is not None and current < name:
+            current = next(referenced, None)
+        if current != name:
+            yield name
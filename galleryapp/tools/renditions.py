@@ -0,0 +1,71 @@
+import os
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image as PILImage, ImageOps
+
+# 衍生图规格：字段名 -> (尺寸, 是否裁剪为固定尺寸)
+RENDITION_SPECS = {
+    'thumbnail': ((200, 200), True),  # 网格缩略图，裁剪为固定尺寸
+    'preview': ((1024, 1024), False),  # 预览图，等比缩放到最长边 1024
+}
+
+# 输出格式对应的文件扩展名
+FORMAT_EXTENSIONS = {
+    'WEBP': 'webp',
+    'JPEG': 'jpg',
+}
+
+
+def get_rendition_format():
+    """获取衍生图输出格式，默认 WebP"""
+    fmt = getattr(settings, 'IMAGE_RENDITION_FORMAT', 'WEBP').upper()
+    if fmt not in FORMAT_EXTENSIONS:
+        fmt = 'JPEG'
+    return fmt
+
+
+def render_rendition(source, size, crop, fmt):
+    """根据规格生成单张衍生图，返回编码后的字节"""
+    if crop:
+        resized = ImageOps.fit(source, size, PILImage.Resampling.LANCZOS)
+    else:
+        resized = source.copy()
+        resized.thumbnail(size, PILImage.Resampling.LANCZOS)
+
+    # JPEG 不支持透明通道
+    if fmt == 'JPEG' and resized.mode != 'RGB':
+        resized = resized.convert('RGB')
+    elif resized.mode not in ('RGB', 'RGBA'):
+        resized = resized.convert('RGBA' if 'A' in resized.getbands() else 'RGB')
+
+    buffer = BytesIO()
+    quality = getattr(settings, 'IMAGE_RENDITION_QUALITY', 80)
+    resized.save(buffer, format=fmt, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def generate_renditions(image, save=True):
+    """为 Image 生成缩略图和预览图并写入对应字段"""
+    fmt = get_rendition_format()
+    ext = FORMAT_EXTENSIONS[fmt]
+    base_name = os.path.splitext(os.path.basename(image.file.name))[0]
+
+    image.file.open('rb')
+    try:
+        with PILImage.open(image.file) as source:
+            # 按 EXIF 方向旋正，并只解码一次原图
+            source = ImageOps.exif_transpose(source)
+            source.load()
+            for field_name, (size, crop) in RENDITION_SPECS.items():
+                content = render_rendition(source, size, crop, fmt)
+                field_file = getattr(image, field_name)
+                if field_file:
+                    field_file.delete(save=False)  # 清理旧的衍生图
+                field_file.save(f'{base_name}_{field_name}.{ext}', ContentFile(content), save=False)
+    finally:
+        image.file.close()
+
+    if save:
+        image.save(update_fields=list(RENDITION_SPECS))
+    return image
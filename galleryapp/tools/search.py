@@ -0,0 +1,104 @@
+import re
+import unicodedata
+from collections import Counter
+from django.db.models import Count, OuterRef, Subquery, Sum
+from ..models import Image, ImageSearchToken
+
+# CJK 文字（中日韩）按字切分，其余按连续的字母串、数字串切分（photo2024 -> photo、2024）
+CJK_RANGES = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af'
+TOKEN_RE = re.compile(rf'[{CJK_RANGES}]+|[a-z]+|[0-9]+')
+CJK_RE = re.compile(rf'[{CJK_RANGES}]')
+# 字母、数字串索引所有前缀（edge n-gram），查询词截断到同样长度，更长的前缀只会增加索引行数
+MAX_PREFIX_LENGTH = 20
+
+# 各字段命中时的权重
+FIELD_WEIGHTS = {
+    'title': 3,
+    'tags': 2,
+    'description': 1,
+}
+
+
+def normalize(text):
+    """全角转半角并转小写"""
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def tokenize(text, for_query=False):
+    """
+    切分文本。中文没有空格分词，索引时同时生成单字和相邻二元组（bigram），
+    查询时两个字及以上只使用二元组，单字查询使用单字，以保证短词和长词都能命中。
+    字母、数字串索引时生成所有前缀，查询 sun 能找到 sunset，img 能找到 IMG_1234。
+    """
+    tokens = []
+    for run in TOKEN_RE.findall(normalize(text)):
+        if not CJK_RE.match(run):
+            run = run[:MAX_PREFIX_LENGTH]
+            if for_query:
+                tokens.append(run)
+            else:
+                tokens.extend(run[:i] for i in range(1, len(run) + 1))
+            continue
+        bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+        if for_query:
+            tokens.extend(bigrams or [run])
+        else:
+            tokens.extend(run)
+            tokens.extend(bigrams)
+    return tokens
+
+
+def build_tokens(image, tag_names):
+    """计算一张图片的 {词元: 权重}"""
+    weights = Counter()
+    fields = {
+        'title': [image.title],
+        'description': [image.description],
+        'tags': tag_names,
+    }
+    for field, texts in fields.items():
+        for text in texts:
+            for token in set(tokenize(text)):
+                weights[token] += FIELD_WEIGHTS[field]
+    return weights
+
+
+def index_images(images):
+    """重建一批图片的倒排索引"""
+    images = list(images)
+    if not images:
+        return
+    ids = [image.id for image in images]
+    tag_names = {}
+    for image_id, name in Image.tags.through.objects.filter(image_id__in=ids).values_list('image_id', 'tag__name'):
+        tag_names.setdefault(image_id, []).append(name)
+
+    ImageSearchToken.objects.filter(image_id__in=ids).delete()
+    ImageSearchToken.objects.bulk_create([
+        ImageSearchToken(image_id=image.id, uploaded_by_id=image.uploaded_by_id, token=token, weight=min(weight, 32767))
+        for image in images
+        for token, weight in build_tokens(image, tag_names.get(image.id, [])).items()
+    ], batch_size=1000)
+
+
+def index_image(image):
+    index_images([image])
+
+
+def search_images(queryset, user, keyword):
+    """
+    在 queryset 中按关键词检索，返回按相关度排序的 queryset。
+    所有查询词元都必须命中；关键词切不出词元时返回 None，由调用方回退到普通过滤。
+    """
+    tokens = set(tokenize(keyword, for_query=True))
+    if not tokens:
+        return None
+
+    matches = (ImageSearchToken.objects.filter(uploaded_by=user, token__in=tokens)
+               .values('image')
+               .annotate(matched=Count('token'), score=Sum('weight'))
+               .filter(matched=len(tokens)))
+    score = matches.filter(image=OuterRef('pk')).values('score')[:1]
+    return (queryset.filter(id__in=matches.values('image'))
+            .annotate(search_score=Subquery(score))
+            .order_by('-search_score', '-created_at'))
@@ -0,0 +1,127 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Max, Prefetch
+from django.utils.crypto import constant_time_compare, salted_hmac
+from ..models import Image, LibraryVersion, ShareLink
+from ..serializers import ImageSerializer
+
+CACHE_KEY_PREFIX = 'share_payload:'
+MISSING = {'missing': True}  # 不存在的分享码也缓存，避免无效请求反复查库
+PASSWORD_SALT = 'galleryapp.share_password'
+
+
+def get_cache_key(share_code):
+    return f'{CACHE_KEY_PREFIX}{share_code}'
+
+
+def get_share_cache():
+    """
+    分享缓存必须是所有进程共享的缓存（如 Redis）：作废、删除分享链接时只能清除共享缓存，
+    进程内缓存（LocMem）中的旧数据会在其他 worker 中继续有效，因此默认不缓存，直接查库。
+    """
+    share_cache = caches[settings.SHARE_CACHE_ALIAS]
+    if isinstance(share_cache, LocMemCache) and not settings.SHARE_CACHE_ALLOW_LOCAL:
+        return None
+    return share_cache
+
+
+def hash_share_password(password):
+    """缓存中只保存密码的 HMAC，不保存明文"""
+    return salted_hmac(PASSWORD_SALT, password, algorithm='sha256').hexdigest()
+
+
+def check_share_password(payload, password):
+    if not payload['is_protected']:
+        return True
+    return constant_time_compare(payload['password_hash'], hash_share_password(password or ''))
+
+
+def load_share_link(share_code):
+    return ShareLink.objects.prefetch_related(
+        Prefetch('images', queryset=Image.objects.prefetch_related('tags'))
+    ).filter(share_code=share_code)
+
+
+def share_version_queryset(share_link):
+    # 分享内容随图片变化，图片所有者的图库版本号即可作为分享内容的版本，不缓存时 ETag 也保持稳定
+    owners = {image.uploaded_by_id for image in share_link.images.all()}
+    return LibraryVersion.objects.filter(user_id__in=owners)
+
+
+def build_share_payload(share_link, version):
+    """序列化分享链接及其图片；标签名称总是内嵌，是否返回由视图决定"""
+    serializer = ImageSerializer(share_link.images.all(), many=True, context={'embed_tags': True})
+    return {
+        'share_code': share_link.share_code,
+        'images': serializer.data,
+        'expire_time': share_link.expire_time,
+        'is_protected': share_link.is_protected,
+        'password_hash': hash_share_password(share_link.password or '') if share_link.is_protected else '',
+        'version': version or 0,  # 用作 ETag / Last-Modified
+    }
+
+
+def get_share_payload(share_code):
+    """
+    获取分享链接的缓存数据，缓存未命中时查库并写入缓存。
+    分享码不存在时返回 None。
+    """
+    share_cache = get_share_cache()
+    key = get_cache_key(share_code)
+    payload = share_cache.get(key) if share_cache is not None else None
+    if payload is None:
+        share_link = load_share_link(share_code).first()
+        if share_link is None:
+            if share_cache is not None:
+                share_cache.set(key, MISSING, timeout=settings.SHARE_CACHE_MISSING_TIMEOUT)
+            return None
+        version = share_version_queryset(share_link).aggregate(version=Max('version'))['version']
+        payload = build_share_payload(share_link, version)
+        if share_cache is not None:
+            share_cache.set(key, payload, timeout=settings.SHARE_CACHE_TIMEOUT)
+    elif payload.get('missing'):
+        return None
+    return payload
+
+
+async def aget_share_payload(share_code):
+    """get_share_payload 的异步版本，使用异步缓存接口和异步 ORM"""
+    share_cache = get_share_cache()
+    key = get_cache_key(share_code)
+    payload = await share_cache.aget(key) if share_cache is not None else None
+    if payload is None:
+        share_link = await load_share_link(share_code).afirst()
+        if share_link is None:
+            if share_cache is not None:
+                await share_cache.aset(key, MISSING, timeout=settings.SHARE_CACHE_MISSING_TIMEOUT)
+            return None
+        version = (await share_version_queryset(share_link).aaggregate(version=Max('version')))['version']
+        payload = build_share_payload(share_link, version)  # 图片和标签已预取，序列化不再查库
+        if share_cache is not None:
+            await share_cache.aset(key, payload, timeout=settings.SHARE_CACHE_TIMEOUT)
+    elif payload.get('missing'):
+        return None
+    return payload
+
+
+def invalidate_share_codes(share_codes):
+    """
+    事务提交后删除指定分享码的缓存。
+    在提交前删除的话，其他请求可能在提交前重新查库，把旧数据再次写入缓存。
+    """
+    share_cache = get_share_cache()
+    keys = [get_cache_key(code) for code in share_codes]
+    if keys and share_cache is not None:
+        transaction.on_commit(lambda: share_cache.delete_many(keys))
+
+
+def invalidate_shares_for_images(image_ids):
+    """图片被编辑或删除时，清除包含这些图片的分享链接缓存"""
+    image_ids = list(image_ids)
+    if not image_ids or get_share_cache() is None:
+        return
+    share_codes = (ShareLink.objects.filter(images__id__in=image_ids)
+                   .values_list('share_code', flat=True).distinct())
+    invalidate_share_codes(list(share_codes))
@@ -1,7 +1,9 @@
 import random
 import string
-from django.core.mail import send_mail
-from django.conf import settings
+from users.outbox import enqueue_email
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def generate_verification_code():
@@ -9,8 +11,8 @@ def generate_verification_code():
     return ''.join(random.choices(string.digits, k=6))
 
 
-def send_verification_email(email, code):
-    """发送验证码邮件"""
+def queue_verification_email(email, code):
+    """把验证码邮件写入发件箱，由 run_email_worker 发送"""
     subject = '邮箱验证码 - SuGallery'
     message = f'''
     您好！
@@ -23,15 +25,4 @@ def send_verification_email(email, code):
     此致
     SuGallery 团队
     '''
-    try:
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[email],
-            fail_silently=False,
-        )
-        return True
-    except Exception as e:
-        print(f"Send email error: {e}")
-        return False
+    return enqueue_email(subject, message, [email])
@@ -1,17 +1,41 @@
 from django.urls import path
-from .views import UserTagListView, BulkDeleteImagesView, ImageUploadView, UserImageListView, ImageDetailView, \
-    ImageEditView, CreateShareLinkView, AccessShareLinkView, ManageShareLinksView
+from .views import UserTagListView, BulkDeleteImagesView, ImageUploadView, BulkImageUploadView, UserImageListView, \
+    ImageDetailView, ImageEditView, CreateShareLinkView, AccessShareLinkView, ManageShareLinksView, \
+    ChunkedUploadSessionView, ChunkedUploadDetailView, ChunkedUploadCompleteView, ImageSimilarView, \
+    UploadIntentView, UploadIntentConfirmView, ProfilingTokenView, RequestProfileListView, RequestProfileDownloadView
+from .async_views import AsyncUserImageListView, AsyncImageDetailView, AsyncAccessShareLinkView
 
 urlpatterns = [
     path('images/', UserImageListView.as_view(), name='user-images'),
     path('images/upload/', ImageUploadView.as_view(), name='image-upload'),
+    path('images/upload/bulk/', BulkImageUploadView.as_view(), name='image-bulk-upload'),
+    # 分片断点续传
+    path('images/upload/sessions/', ChunkedUploadSessionView.as_view(), name='chunked-upload-session'),
+    path('images/upload/sessions/<uuid:upload_id>/', ChunkedUploadDetailView.as_view(),
+         name='chunked-upload-detail'),
+    path('images/upload/sessions/<uuid:upload_id>/complete/', ChunkedUploadCompleteView.as_view(),
+         name='chunked-upload-complete'),
+    # 直传上传：文件直接上传到存储，不经过 Django
+    path('images/upload/intents/', UploadIntentView.as_view(), name='upload-intent'),
+    path('images/upload/intents/<uuid:intent_id>/confirm/', UploadIntentConfirmView.as_view(),
+         name='upload-intent-confirm'),
     path('images/bulk_delete/', BulkDeleteImagesView.as_view(), name='bulk_delete_images'),
     path('images/<int:image_id>/', ImageDetailView.as_view(), name='image-detail'),
+    path('images/<int:image_id>/similar/', ImageSimilarView.as_view(), name='image-similar'),
     path('images/<int:image_id>/edit/', ImageEditView.as_view(), name='image-edit'),
     path('images/share/', CreateShareLinkView.as_view(), name='create-share-link'),
     path('share/<str:share_code>/', AccessShareLinkView.as_view(), name='access-share-link'),
     path('images/share/manage/', ManageShareLinksView.as_view(), name='manage-share-links'),
     path('images/share/manage/delete/', ManageShareLinksView.as_view(), name='delete-multiple-share-links'),  # 批量删除分享链接
+    # 只读接口的异步版本，需部署在 ASGI 服务器下
+    path('async/images/', AsyncUserImageListView.as_view(), name='async-user-images'),
+    path('async/images/<int:image_id>/', AsyncImageDetailView.as_view(), name='async-image-detail'),
+    path('async/share/<str:share_code>/', AsyncAccessShareLinkView.as_view(), name='async-access-share-link'),
     # 标签管理
     path('tags/', UserTagListView.as_view(), name='user-tag-list'),
+    # 按需剖析（仅管理员）
+    path('profiling/token/', ProfilingTokenView.as_view(), name='profiling-token'),
+    path('profiling/', RequestProfileListView.as_view(), name='request-profiles'),
+    path('profiling/<int:profile_id>/<str:kind>/', RequestProfileDownloadView.as_view(),
+         name='request-profile-download'),
 ]
@@ -1,18 +1,47 @@
 # Create your views here.
 from django.utils import timezone
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from datetime import timedelta
 from datetime import datetime
 from django.utils.timezone import now
 from django.utils.timezone import make_aware
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.exceptions import NotFound, PermissionDenied
-from .models import Image, ShareLink, Tag
+from rest_framework.settings import api_settings
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
+from rest_framework.exceptions import AuthenticationFailed, NotFound, PermissionDenied, ValidationError
+from .models import Image, ShareLink, Tag, UploadSession, UploadIntent, RequestProfile
 from .serializers import ImageSerializer, ImageDetailSerializer, ShareLinkSerializer, TagSerializer
-from .tools.pagination import CustomPagination
+from .tools.pagination import CustomPagination, KeysetPagination
+from .tools.jobs import enqueue_image_jobs
+from .tools.chunked_upload import write_chunk, discard_partial, PartialUploadedFile
+from .tools.dedup import store_image_file, adopt_stored_file, release_image_files, discard_unreferenced_files
+from .tools.phash import find_similar_images, MAX_DISTANCE
+from .tools.search import search_images, index_images
+from .tools.share_cache import check_share_password, invalidate_share_codes, invalidate_shares_for_images
+from .tools.presign import build_upload_target, verify_uploaded_image
+from .tools.media import serve_media_file, is_private_media, can_access_media
+from .tools.metrics import render_metrics, PROMETHEUS_CONTENT_TYPE
+from .tools.profiling import make_profiling_token
+from .tools.conditional import library_etag, library_last_modified, share_etag, share_last_modified, \
+    bump_library_version, get_request_share_payload
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.validators import get_available_image_extensions
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils._os import safe_join
+from django.utils.crypto import constant_time_compare
 import json
+import os
+import posixpath
+import uuid
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,9 +51,12 @@ logger = logging.getLogger(__name__)
 class UserTagListView(APIView):
     permission_classes = [IsAuthenticated]
 
-    def get(self, request):
+    def get_queryset(self, request):
         # 只返回当前用户创建的标签
-        tags = Tag.objects.filter(uploaded_by=request.user)
+        return Tag.objects.filter(uploaded_by=request.user)
+
+    def get(self, request):
+        tags = self.get_queryset(request)
         serializer = TagSerializer(tags, many=True)
         return Response(serializer.data)
 
@@ -37,107 +69,473 @@ class UserTagListView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def get_serializer_context(request):
+    """图片序列化上下文：?embed=tags 时在结果中内嵌标签名称（不传入 request，文件地址保持相对路径）"""
+    return {'embed_tags': 'tags' in request.query_params.getlist('embed')}
+
+
+def get_upload_tags(request):
+    """
+    解析上传请求中的 tags 字段，返回 (当前用户的有效标签列表, 错误响应)
+    """
+    # 获取标签ID列表，如果未提供则默认为空
+    tags = request.data.get('tags', [])
+    # 确保 tags 是一个列表，即使前端传递多个值
+    if isinstance(tags, str):  # 如果是字符串（JSON字符串）
+        try:
+            tags = json.loads(tags)
+        except json.JSONDecodeError:
+            return None, Response({'detail': '标签格式无效。'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if isinstance(tags, list):  # 如果是列表
+        try:
+            tags = [int(tag) for tag in tags]  # 确保列表里的标签是整数类型
+        except ValueError:
+            return None, Response({'detail': '标签列表中的值必须为整数。'}, status=status.HTTP_400_BAD_REQUEST)
+    elif isinstance(tags, int):  # 如果是单个整数
+        tags = [tags]  # 转换为列表
+    else:
+        return None, Response({'detail': '标签格式无效，应为整数或整数列表。'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # 如果提供了 tags，验证是否是有效的标签ID
+    if tags:
+        user_tags = Tag.objects.filter(uploaded_by=request.user)  # 获取当前用户的标签
+        return list(user_tags.filter(id__in=tags)), None  # 确保标签是用户创建的
+    return [], None  # 如果未提供 tags，则设置为空列表
+
+
 # 图片上传
 class ImageUploadView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         # 仅接受 title 和 file、tags 字段上传
-        # 获取标签ID列表，如果未提供则默认为空
-        tags = request.data.get('tags', [])
-        # 确保 tags 是一个列表，即使前端传递多个值
-        if isinstance(tags, str):  # 如果是字符串（JSON字符串）
-            try:
-                tags = json.loads(tags)
-            except json.JSONDecodeError:
-                return Response({'detail': '标签格式无效。'}, status=status.HTTP_400_BAD_REQUEST)
-
-        if isinstance(tags, list):  # 如果是列表
-            try:
-                tags = [int(tag) for tag in tags]  # 确保列表里的标签是整数类型
-            except ValueError:
-                return Response({'detail': '标签列表中的值必须为整数。'}, status=status.HTTP_400_BAD_REQUEST)
-        elif isinstance(tags, int):  # 如果是单个整数
-            tags = [tags]  # 转换为列表
-        else:
-            return Response({'detail': '标签格式无效，应为整数或整数列表。'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # 如果提供了 tags，验证是否是有效的标签ID
-        if tags:
-            user_tags = Tag.objects.filter(uploaded_by=request.user)  # 获取当前用户的标签
-            valid_tags = user_tags.filter(id__in=tags)  # 确保标签是用户创建的
-        else:
-            valid_tags = []  # 如果未提供 tags，则设置为空列表
+        valid_tags, error_response = get_upload_tags(request)
+        if error_response:
+            return error_response
 
         # 批量上传 批量处理文件
         files = request.FILES.getlist('file')  # 获取上传的文件列表
         if not files:
             return Response({'detail': '未上传任何文件。'}, status=status.HTTP_400_BAD_REQUEST)
 
-        uploaded_images = []
+        images = []
         for file in files:
             serializer = ImageSerializer(
                 data={'file': file, 'title': request.data.get('title')})
             if serializer.is_valid():
-                image = serializer.save(uploaded_by=request.user)
-                image.tags.set(valid_tags)
-                uploaded_images.append(serializer.data)
+                with transaction.atomic():
+                    # 相同内容的文件只存一份
+                    name, digest = store_image_file(file)
+                    image = serializer.save(uploaded_by=request.user, file=name, content_hash=digest)
+                    image.tags.set(valid_tags)
+                images.append(image)
             else:
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+        # 缩略图等耗时处理交给后台 worker，上传请求立即返回
+        enqueue_image_jobs(images)
+        uploaded_images = ImageSerializer(images, many=True).data
+
         return Response({'uploaded_images': uploaded_images}, status=status.HTTP_201_CREATED)
 
 
+# 批量上传：先校验全部文件，再在同一事务内批量写入图片和标签关系
+class BulkImageUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        valid_tags, error_response = get_upload_tags(request)
+        if error_response:
+            return error_response
+
+        files = request.FILES.getlist('file')
+        if not files:
+            return Response({'detail': '未上传任何文件。'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 第一步：逐个校验，任何一个文件无效则整批不写入
+        images = []
+        results = []
+        for index, file in enumerate(files):
+            serializer = ImageSerializer(data={'file': file, 'title': request.data.get('title', '')})
+            if serializer.is_valid():
+                images.append(Image(uploaded_by=request.user, **serializer.validated_data))
+                results.append({'index': index, 'name': file.name, 'status': 'valid'})
+            else:
+                results.append({'index': index, 'name': file.name, 'status': 'invalid',
+                                'errors': serializer.errors})
+
+        if len(images) != len(files):
+            return Response({'detail': '部分文件校验失败，未上传任何图片。', 'results': results},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # 第二步：单个事务内批量插入图片、标签关系和后台任务
+        stored = []
+        try:
+            with transaction.atomic():
+                for image in images:
+                    name, digest = store_image_file(image.file)  # 相同内容的文件只存一份
+                    image.file = name
+                    image.content_hash = digest
+                    stored.append(name)
+
+                if connection.features.can_return_rows_from_bulk_insert:
+                    images = Image.objects.bulk_create(images, batch_size=100)
+                else:
+                    # MySQL 的 bulk_create 不回填自增主键，逐行插入才能可靠地取得主键
+                    for image in images:
+                        image.save(force_insert=True)
+
+                if valid_tags:
+                    ImageTag = Image.tags.through
+                    ImageTag.objects.bulk_create([
+                        ImageTag(image_id=image.pk, tag_id=tag.pk) for image in images for tag in valid_tags
+                    ], batch_size=500)
+
+                enqueue_image_jobs(images)
+                index_images(images)  # bulk_create 不触发信号，手动建立搜索索引
+                bump_library_version(request.user.id)
+        except Exception:
+            # 回滚后本次新写入的文件没有 ImageBlob 记录，删除以免留下孤儿文件
+            discard_unreferenced_files(stored)
+            raise
+
+        uploaded = Image.objects.filter(id__in=[image.pk for image in images]).prefetch_related('tags')
+        uploaded_data = {item['id']: item for item in ImageSerializer(uploaded, many=True).data}
+        for result, image in zip(results, images):
+            result['status'] = 'created'
+            result['image'] = uploaded_data[image.pk]
+
+        return Response({'uploaded_images': [result['image'] for result in results], 'results': results},
+                        status=status.HTTP_201_CREATED)
+
+
+# 分片上传：初始化会话
+class ChunkedUploadSessionView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        filename = request.data.get('filename')
+        try:
+            total_size = int(request.data.get('total_size'))
+        except (TypeError, ValueError):
+            return Response({'detail': '必须提供有效的文件大小。'}, status=status.HTTP_400_BAD_REQUEST)
+        if not filename:
+            return Response({'detail': '必须提供文件名。'}, status=status.HTTP_400_BAD_REQUEST)
+        if total_size <= 0 or total_size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+            return Response({'detail': '文件大小超出允许范围。'}, status=status.HTTP_400_BAD_REQUEST)
+
+        valid_tags, error_response = get_upload_tags(request)
+        if error_response:
+            return error_response
+
+        session = UploadSession.objects.create(
+            uploaded_by=request.user,
+            filename=os.path.basename(filename),
+            title=request.data.get('title') or '',
+            tag_ids=[tag.id for tag in valid_tags],
+            total_size=total_size,
+        )
+        return Response({
+            'upload_id': session.id,
+            'offset': 0,
+            'total_size': session.total_size,
+            'chunk_size': settings.CHUNKED_UPLOAD_CHUNK_SIZE,
+            'expires_at': session.expires_at,
+        }, status=status.HTTP_201_CREATED)
+
+
+# 分片上传：查询进度、按偏移量写入分片、取消上传
+class ChunkedUploadDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get_session(self, upload_id):
+        session = UploadSession.objects.filter(id=upload_id, uploaded_by=self.request.user).first()
+        if session is None:
+            raise NotFound("上传会话不存在。")
+        return session
+
+    def get(self, request, upload_id):
+        # 断线后客户端先查询当前偏移量，再从该位置继续上传
+        session = self.get_session(upload_id)
+        return Response({
+            'upload_id': session.id,
+            'offset': session.received_bytes,
+            'total_size': session.total_size,
+            'status': session.status,
+            'expires_at': session.expires_at,
+        })
+
+    def put(self, request, upload_id):
+        with transaction.atomic():
+            # 锁定会话，避免同一会话的分片并发写入
+            session = UploadSession.objects.select_for_update().filter(
+                id=upload_id, uploaded_by=request.user).first()
+            if session is None:
+                raise NotFound("上传会话不存在。")
+            if session.status != 'uploading' or session.is_expired():
+                return Response({'detail': '上传会话已结束或已过期。'}, status=status.HTTP_410_GONE)
+
+            try:
+                offset = int(request.query_params.get('offset', session.received_bytes))
+                length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                return Response({'detail': '无效的偏移量。'}, status=status.HTTP_400_BAD_REQUEST)
+
+            # 偏移量必须与服务端已接收的字节数一致，否则返回当前偏移量让客户端重新对齐
+            if offset != session.received_bytes:
+                return Response({'detail': '偏移量不匹配。', 'offset': session.received_bytes},
+                                status=status.HTTP_409_CONFLICT)
+            if length <= 0 or length > settings.CHUNKED_UPLOAD_CHUNK_SIZE:
+                return Response({'detail': '分片大小无效。'}, status=status.HTTP_400_BAD_REQUEST)
+            if offset + length > session.total_size:
+                return Response({'detail': '分片超出文件大小。'}, status=status.HTTP_400_BAD_REQUEST)
+
+            # 直接从请求流中读取并写入磁盘，不经过 request.data 解析
+            new_offset = write_chunk(session, request.stream, offset, length)
+
+        return Response({'upload_id': session.id, 'offset': new_offset, 'total_size': session.total_size})
+
+    def delete(self, request, upload_id):
+        session = self.get_session(upload_id)
+        discard_partial(session)
+        session.status = 'aborted'
+        session.save(update_fields=['status', 'updated_at'])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+# 分片上传：完成上传并生成图片
+class ChunkedUploadCompleteView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, upload_id):
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().filter(
+                id=upload_id, uploaded_by=request.user).first()
+            if session is None:
+                raise NotFound("上传会话不存在。")
+            if session.status == 'completed' and session.image_id:
+                # 完成请求重试时直接返回已生成的图片
+                return Response(ImageSerializer(session.image).data, status=status.HTTP_200_OK)
+            if session.status != 'uploading':
+                return Response({'detail': '上传会话已结束。'}, status=status.HTTP_410_GONE)
+            if session.received_bytes != session.total_size:
+                return Response({'detail': '文件尚未上传完成。', 'offset': session.received_bytes},
+                                status=status.HTTP_409_CONFLICT)
+
+            upload_file = PartialUploadedFile(session)
+            try:
+                serializer = ImageSerializer(data={'file': upload_file, 'title': session.title})
+                if not serializer.is_valid():
+                    discard_partial(session)
+                    session.status = 'aborted'
+                    session.save(update_fields=['status', 'updated_at'])
+                    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+                name, digest = store_image_file(upload_file)
+                image = serializer.save(uploaded_by=request.user, file=name, content_hash=digest)
+            finally:
+                upload_file.close()
+
+            image.tags.set(Tag.objects.filter(uploaded_by=request.user, id__in=session.tag_ids))
+            enqueue_image_jobs([image])
+
+            discard_partial(session)  # 存储后端若未移动临时文件，在此清理
+            session.status = 'completed'
+            session.image = image
+            session.save(update_fields=['status', 'image', 'updated_at'])
+
+        return Response(ImageSerializer(image).data, status=status.HTTP_201_CREATED)
+
+
+# 直传上传：创建上传意图，返回签名的上传地址
+class UploadIntentView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        filename = os.path.basename(request.data.get('filename') or '')
+        ext = os.path.splitext(filename)[1].lower().lstrip('.')
+        if ext not in get_available_image_extensions():
+            return Response({'detail': '必须提供有效的图片文件名。'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({'detail': '必须提供有效的文件大小。'}, status=status.HTTP_400_BAD_REQUEST)
+        if size <= 0 or size > settings.PRESIGNED_UPLOAD_MAX_SIZE:
+            return Response({'detail': '文件大小超出允许范围。'}, status=status.HTTP_400_BAD_REQUEST)
+
+        valid_tags, error_response = get_upload_tags(request)
+        if error_response:
+            return error_response
+
+        intent_id = uuid.uuid4()
+        field = Image._meta.get_field('file')
+        intent = UploadIntent.objects.create(
+            id=intent_id,
+            uploaded_by=request.user,
+            filename=filename,
+            title=request.data.get('title') or '',
+            tag_ids=[tag.id for tag in valid_tags],
+            storage_name=field.generate_filename(None, f'{intent_id.hex}.{ext}'),
+            max_size=size,
+        )
+        return Response({
+            'intent_id': intent.id,
+            'upload': build_upload_target(intent),
+            'expires_at': intent.expires_at,
+        }, status=status.HTTP_201_CREATED)
+
+
+# 直传上传：文件上传到存储后确认，生成图片
+class UploadIntentConfirmView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, intent_id):
+        storage = Image._meta.get_field('file').storage
+        with transaction.atomic():
+            intent = UploadIntent.objects.select_for_update().filter(id=intent_id, uploaded_by=request.user).first()
+            if intent is None:
+                raise NotFound("上传意图不存在。")
+            if intent.status == 'confirmed' and intent.image_id:
+                # 确认请求重试时直接返回已生成的图片
+                return Response(ImageSerializer(intent.image).data, status=status.HTTP_200_OK)
+            if intent.status != 'pending' or intent.is_expired():
+                return Response({'detail': '上传地址已过期。'}, status=status.HTTP_410_GONE)
+            if not storage.exists(intent.storage_name):
+                return Response({'detail': '文件尚未上传。'}, status=status.HTTP_409_CONFLICT)
+            if storage.size(intent.storage_name) > intent.max_size:
+                storage.delete(intent.storage_name)
+                return Response({'detail': '文件大小超出允许范围。'}, status=status.HTTP_400_BAD_REQUEST)
+            # 不是有效图片时删除文件，客户端可以用同一个上传地址重新上传
+            if not verify_uploaded_image(storage, intent.storage_name):
+                storage.delete(intent.storage_name)
+                return Response({'detail': '上传的文件不是有效的图片。'}, status=status.HTTP_400_BAD_REQUEST)
+
+            # 与其他上传方式一样按内容哈希去重
+            name, digest = adopt_stored_file(intent.storage_name)
+            image = Image.objects.create(title=intent.title, file=name, content_hash=digest, uploaded_by=request.user)
+            image.tags.set(Tag.objects.filter(uploaded_by=request.user, id__in=intent.tag_ids))
+            enqueue_image_jobs([image])
+
+            intent.status = 'confirmed'
+            intent.image = image
+            intent.save(update_fields=['status', 'image'])
+        return Response(ImageSerializer(image).data, status=status.HTTP_201_CREATED)
+
+
 class BulkDeleteImagesView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         # 获取图片ID列表
         image_ids = request.data.get('image_ids', [])
-        print(request.data)
         if not image_ids:
             return Response({"detail": "未找到图片。"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 获取当前用户的图片，确保这些图片是当前用户上传的
-        images = Image.objects.filter(id__in=image_ids, uploaded_by=request.user)
-
-        if images.count() != len(image_ids):
-            return Response({"detail": "这些图像不属于您或无效。"},
-                            status=status.HTTP_400_BAD_REQUEST)
-
-        # 批量删除图片
-        images.delete()
+        # 只标记删除时间并立即返回，数据库记录、关联关系和文件由 reap_deleted_images 分批清理
+        with transaction.atomic():
+            # 只更新当前用户的图片，更新条数不一致说明有图片不属于当前用户或不存在
+            deleted = Image.objects.filter(id__in=image_ids, uploaded_by=request.user).update(deleted_at=now())
+            if deleted != len(set(image_ids)):
+                transaction.set_rollback(True)
+                return Response({"detail": "这些图像不属于您或无效。"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            # 事务提交后再清除分享缓存，否则其他请求可能在提交前把未删除的图片重新写入缓存
+            transaction.on_commit(lambda: invalidate_shares_for_images(image_ids))
+        # update() 不触发信号，手动更新图库版本
+        bump_library_version(request.user.id)
 
-        return Response({"detail": "选定的图像已成功删除。"},
-                        status=status.HTTP_204_NO_CONTENT)
+        return Response({"detail": "选定的图像已删除。", "deleted": deleted},
+                        status=status.HTTP_202_ACCEPTED)
 
 
 # 获取图片列表、支持标签过滤
 class UserImageListView(APIView):
     permission_classes = [IsAuthenticated]
 
-    def get(self, request):
+    # 元数据过滤参数 -> 查询条件，每个条件都有以 uploaded_by 开头的索引
+    RANGE_FILTERS = {
+        'min_width': 'width__gte',
+        'max_width': 'width__lte',
+        'min_height': 'height__gte',
+        'max_height': 'height__lte',
+    }
+    EXACT_FILTERS = {
+        'camera_make': 'camera_make',
+        'camera_model': 'camera_model',
+        'orientation': 'orientation',
+    }
+
+    def parse_taken_time(self, value, name):
+        # 支持日期（2024-03-01）或 ISO 时间，日期按当前时区的 0 点
+        # 格式正确但日期不存在（2024-13-01、2024-02-30T00:00）时 parse_* 抛出 ValueError
+        try:
+            parsed = parse_datetime(value)
+            date = parse_date(value) if parsed is None else None
+        except ValueError:
+            raise ValidationError({name: '无效的日期或时间。'})
+        if parsed is None:
+            if date is None:
+                raise ValidationError({name: '无效的时间格式，应为 ISO 日期或时间。'})
+            parsed = datetime.combine(date, datetime.min.time())
+        return make_aware(parsed) if parsed.tzinfo is None else parsed
+
+    def filter_metadata(self, images, params):
+        """按拍摄时间、尺寸、方向和相机过滤；taken_before 不包含，便于按月查询"""
+        if params.get('taken_after'):
+            images = images.filter(taken_at__gte=self.parse_taken_time(params['taken_after'], 'taken_after'))
+        if params.get('taken_before'):
+            images = images.filter(taken_at__lt=self.parse_taken_time(params['taken_before'], 'taken_before'))
+        for name, lookup in self.RANGE_FILTERS.items():
+            if params.get(name):
+                try:
+                    value = int(params[name])
+                except ValueError:
+                    raise ValidationError({name: '必须为整数。'})
+                images = images.filter(**{lookup: value})
+        for name, lookup in self.EXACT_FILTERS.items():
+            if params.get(name):
+                images = images.filter(**{lookup: params[name]})
+        return images
+
+    def get_queryset(self, request):
         # 获取标签过滤参数
         tag_ids = request.query_params.getlist('tags', [])
 
         keyword = request.query_params.get('keyword', '')  # 获取搜索关键字
 
+        # 排序与 image_user_created_idx 索引一致，避免 filesort
+        images = Image.objects.filter(uploaded_by=request.user).order_by('-created_at', '-id')
+
+        # 通过倒排索引检索标题、描述和标签名，按相关度排序
+        if keyword:
+            logger.info(f"搜索关键词: {keyword}")
+            ranked = search_images(images, request.user, keyword)
+            # 关键词切不出词元（例如只有标点）时回退到标题模糊匹配
+            images = ranked if ranked is not None else images.filter(title__icontains=keyword)
+
+        if tag_ids:
+            # 用子查询代替 JOIN + DISTINCT，分页 COUNT 不必对整个连接结果去重
+            tagged = Image.tags.through.objects.filter(tag_id__in=tag_ids).values('image_id')
+            images = images.filter(id__in=tagged)
+        images = self.filter_metadata(images, request.query_params)
+        # 一次查询取回当前页所有图片的标签
+        return images.prefetch_related('tags')
+
+    # 图库未变化时直接返回 304，不执行查询和序列化
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(condition(etag_func=library_etag, last_modified_func=library_last_modified))
+    def get(self, request):
         try:
-            images = Image.objects.filter(uploaded_by=request.user).order_by('-created_at')
-
-            # 模糊搜索标题
-            if keyword:
-                logger.info(f"搜索关键词: {keyword}")
-                images = images.filter(title__icontains=keyword)
-
-            if tag_ids:
-                images = images.filter(tags__id__in=tag_ids).distinct()
+            images = self.get_queryset(request)
 
-            paginator = CustomPagination()
+            # 游标分页按 (created_at, id) 排序，关键词检索时不再按相关度排序
+            paginator = KeysetPagination() if KeysetPagination.is_requested(request) else CustomPagination()
             paginated_images = paginator.paginate_queryset(images, request)
-            serializer = ImageSerializer(paginated_images, many=True)
+            serializer = ImageSerializer(paginated_images, many=True, context=get_serializer_context(request))
             return paginator.get_paginated_response(serializer.data)
 
+        except (NotFound, ValidationError):
+            raise  # 无效的页码、游标或过滤参数，交给 DRF 返回 404 / 400
         except Exception as e:
             logger.error(f"图片查询失败: {e}")
             return Response({'error': '系统错误，请稍后重试'}, status=500)
@@ -148,6 +546,8 @@ class UserImageListView(APIView):
 class ImageDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(condition(etag_func=library_etag, last_modified_func=library_last_modified))
     def get(self, request, image_id):
         image = Image.objects.filter(id=image_id, uploaded_by=request.user).first()  # 确保图片属于当前用户
         if image:
@@ -156,6 +556,32 @@ class ImageDetailView(APIView):
         return Response({"detail": "图片未找到或者您没有权限"}, status=status.HTTP_404_NOT_FOUND)
 
 
+# 相似图片检索
+class ImageSimilarView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, image_id):
+        image = Image.objects.filter(id=image_id, uploaded_by=request.user).first()
+        if image is None:
+            return Response({"detail": "图片未找到或者您没有权限"}, status=status.HTTP_404_NOT_FOUND)
+        if image.phash is None:
+            return Response({"detail": "图片仍在处理中，请稍后重试"}, status=status.HTTP_409_CONFLICT)
+
+        try:
+            distance = int(request.query_params.get('distance', 6))
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+        except ValueError:
+            return Response({"detail": "无效的查询参数"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= distance <= MAX_DISTANCE:
+            return Response({"detail": f"distance 取值范围为 0-{MAX_DISTANCE}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        matches = find_similar_images(image, distance, limit)
+        results = ImageSerializer([match for match, _ in matches], many=True).data
+        for item, (_, match_distance) in zip(results, matches):
+            item['distance'] = match_distance
+        return Response({'image_id': image.id, 'results': results})
+
+
 # 图片信息编辑
 
 class ImageEditView(APIView):
@@ -168,6 +594,21 @@ class ImageEditView(APIView):
         except Image.DoesNotExist:
             return None
 
+    def save_image(self, serializer, image):
+        """保存编辑结果；替换了图片文件时按内容去重，并释放旧文件的引用"""
+        upload = serializer.validated_data.get('file')
+        if upload is None:
+            return serializer.save()
+
+        old_files = [{'file': image.file.name, 'content_hash': image.content_hash,
+                      'thumbnail': image.thumbnail.name, 'preview': image.preview.name}]
+        with transaction.atomic():
+            name, digest = store_image_file(upload)
+            image = serializer.save(file=name, content_hash=digest, thumbnail=None, preview=None)
+            release_image_files(old_files)
+            enqueue_image_jobs([image])  # 重新生成衍生图
+        return image
+
     def put(self, request, image_id):
         # 用 PUT 方法更新图片信息
         image = self.get_object(image_id)
@@ -177,7 +618,7 @@ class ImageEditView(APIView):
         # 序列化并更新数据
         serializer = ImageSerializer(image, data=request.data, partial=False)
         if serializer.is_valid():
-            serializer.save()
+            self.save_image(serializer, image)
             # 更新标签
             tags = request.data.get('tags', [])
             if tags:
@@ -197,7 +638,7 @@ class ImageEditView(APIView):
             # 序列化并更新数据
         serializer = ImageSerializer(image, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            self.save_image(serializer, image)
             # 更新标签
             tags = request.data.get('tags', [])
             if tags:
@@ -215,8 +656,6 @@ class CreateShareLinkView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        print("Received data:", request.data)  # 打印前端发送的数据
-
         # 确保请求中有图片ID列表
         image_ids = request.data.get('images', [])
         if not image_ids:
@@ -260,10 +699,11 @@ class CreateShareLinkView(APIView):
         # 序列化并保存
         serializer = ShareLinkSerializer(data=data)
         if not serializer.is_valid():
-            print("Serializer Errors:", serializer.errors)  # 打印序列化错误
+            logger.info(f"分享链接参数错误: {serializer.errors}")
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer.save()  # 保存并创建 ShareLink
+        share_link = serializer.save()  # 保存并创建 ShareLink
+        invalidate_share_codes([share_link.share_code])  # 清除可能存在的“分享码不存在”缓存
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
@@ -271,39 +711,37 @@ class CreateShareLinkView(APIView):
 class AccessShareLinkView(APIView):
     permission_classes = []
 
+    @method_decorator(cache_control(no_cache=True))
+    @method_decorator(condition(etag_func=share_etag, last_modified_func=share_last_modified))
     def get(self, request, share_code):
-        # 查找分享链接
-        try:
-            share_link = ShareLink.objects.prefetch_related('images').get(share_code=share_code)
-        except ShareLink.DoesNotExist:
+        # 优先从缓存读取分享内容，热门分享链接命中缓存时不访问数据库
+        share_link = get_request_share_payload(request, share_code)
+        if share_link is None:
             raise NotFound("Invalid share code.")
 
         # 检查是否过期
-        if share_link.is_expired():
+        if timezone.now() > share_link['expire_time']:
             raise PermissionDenied("This share link has expired.")
 
-            # 打印请求中的密码
-        print("Received password:", request.query_params.get('password'))
-
         # 如果分享链接有密码保护
-        if share_link.is_protected:
+        if share_link['is_protected']:
             # 获取请求中的密码参数
             password = request.query_params.get('password', '')
             # 校验密码
-            if share_link.password != password:
-                print(f"Password mismatch: expected {share_link.password}, got {password}")
+            if not check_share_password(share_link, password):
                 raise PermissionDenied("Incorrect password.")
 
-        # 获取关联图片并序列化返回
-        images = share_link.images.all()
-        serializer = ImageSerializer(images, many=True)
+        # 缓存中总是内嵌标签名称，未请求 ?embed=tags 时去掉
+        images = share_link['images']
+        if not get_serializer_context(request)['embed_tags']:
+            images = [{key: value for key, value in image.items() if key != 'tag_details'} for image in images]
 
         # 添加密码保护字段
         return Response({
             "share_code": share_code,
-            "images": serializer.data,
-            "expire_time": share_link.expire_time,
-            "is_protected": share_link.is_protected,  # 返回是否受保护字段
+            "images": images,
+            "expire_time": share_link['expire_time'],
+            "is_protected": share_link['is_protected'],  # 返回是否受保护字段
 
         })
 
@@ -313,12 +751,20 @@ class AccessShareLinkView(APIView):
 class ManageShareLinksView(APIView):
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self, request):
+        # 获取当前用户的所有分享链接；用子查询代替 JOIN + DISTINCT 保证分享链接不重复
+        linked = ShareLink.images.through.objects.filter(image__uploaded_by=request.user).values('sharelink_id')
+        return (ShareLink.objects.filter(id__in=linked)
+                .order_by('-expire_time', 'created_time')
+                .prefetch_related(Prefetch('images', queryset=Image.objects.only('id'))))
+
     def get(self, request):
-        # 获取当前用户的所有分享链接，确保分享链接不重复
-        share_links = ShareLink.objects.filter(images__uploaded_by=request.user).order_by(
-            '-expire_time', 'created_time').distinct()
-        # 分页处理
-        paginator = CustomPagination()
+        share_links = self.get_queryset(request)
+        # 分页处理，支持 ?pagination=cursor 游标分页
+        if KeysetPagination.is_requested(request):
+            paginator = KeysetPagination(ordering=('-created_time', '-id'))
+        else:
+            paginator = CustomPagination()
         paginated_share_links = paginator.paginate_queryset(share_links, request)
 
         # 序列化分页后的分享链接数据
@@ -343,6 +789,7 @@ class ManageShareLinksView(APIView):
 
         # 批量删除
         share_links.delete()
+        invalidate_share_codes(share_codes)
         return Response({"detail": "分享链接已删除"}, status=status.HTTP_204_NO_CONTENT)
 
     def post(self, request):
@@ -360,5 +807,113 @@ class ManageShareLinksView(APIView):
 
         # 将过期时间设置为当前时间以作废链接
         share_links.update(expire_time=timezone.now())
+        invalidate_share_codes(share_codes)
 
         return Response({"detail": "分享链接已作废"}, status=status.HTTP_200_OK)
+
+
+# 媒体文件访问
+class MediaFileView(APIView):
+    """
+    代替 django.conf.urls.static：先做权限校验，再由 nginx（X-Accel-Redirect）或
+    Apache（X-Sendfile）发送文件；未配置代理时由 Python 发送，支持 Range 和缓存头。
+    """
+    # 公开文件不做认证，带着过期或无效 Authorization 头的请求也能拿到文件，而不是 401
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, path):
+        name = posixpath.normpath(path).lstrip('/')
+        private = is_private_media(name)
+        if private:
+            self.authenticate_owner(request)
+        if not isinstance(default_storage, FileSystemStorage):
+            # 对象存储：校验权限后跳转到存储的 URL（私有桶为带签名的临时 URL）
+            if private and not can_access_media(request, name):
+                return Response({"detail": "您没有权限访问该文件"}, status=status.HTTP_403_FORBIDDEN)
+            return HttpResponseRedirect(default_storage.url(name))
+
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, name)
+        except SuspiciousFileOperation:
+            raise NotFound("文件不存在")
+        if not os.path.isfile(full_path):
+            raise NotFound("文件不存在")
+        if private and not can_access_media(request, name):
+            return Response({"detail": "您没有权限访问该文件"}, status=status.HTTP_403_FORBIDDEN)
+        return serve_media_file(request, name, private=private)
+
+    def authenticate_owner(self, request):
+        """私有文件需要识别图片所有者；令牌无效时按匿名用户处理，由 can_access_media 返回 403"""
+        if request.user.is_authenticated:
+            return
+        for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+            try:
+                result = authenticator().authenticate(request)
+            except AuthenticationFailed:
+                return
+            if result is not None:
+                request.user, request.auth = result
+                return
+
+
+# Prometheus 指标
+class MetricsView(APIView):
+    """输出本进程内汇总的请求指标（Prometheus 文本格式），需要携带 Authorization: Bearer <METRICS_TOKEN>"""
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        token = settings.METRICS_TOKEN
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        if not token or not constant_time_compare(authorization, f'Bearer {token}'):
+            return Response({"detail": "您没有权限访问该接口"}, status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+# 按需剖析：签发令牌
+class ProfilingTokenView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        return Response({
+            "token": make_profiling_token(request.user),
+            "expires_in": settings.PROFILING_TOKEN_MAX_AGE,
+            "header": "X-Profile-Token",
+        }, status=status.HTTP_201_CREATED)
+
+
+# 按需剖析：剖析记录列表
+class RequestProfileListView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        profiles = RequestProfile.objects.values(
+            'id', 'mode', 'method', 'path', 'query_string', 'view', 'status_code', 'duration_ms', 'db_queries',
+            'samples', 'user_id', 'requested_by_id', 'created_at')
+        user_id = request.query_params.get('user_id')
+        if user_id:
+            profiles = profiles.filter(user_id=user_id)
+        paginator = CustomPagination()
+        page = paginator.paginate_queryset(profiles, request)
+        return paginator.get_paginated_response(page)
+
+
+# 按需剖析：下载剖析结果
+class RequestProfileDownloadView(APIView):
+    """collapsed 下载折叠栈（flamegraph.pl、speedscope 可直接打开），pstats 下载 cProfile 数据"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id, kind):
+        profile = RequestProfile.objects.filter(id=profile_id).first()
+        if profile is None or kind not in ('collapsed', 'pstats'):
+            raise NotFound("剖析记录不存在")
+        if kind == 'pstats':
+            if profile.pstats is None:
+                raise NotFound("采样模式的剖析记录没有 pstats 数据")
+            response = HttpResponse(bytes(profile.pstats), content_type='application/octet-stream')
+            response['Content-Disposition'] = f'attachment; filename="profile-{profile.id}.prof"'
+            return response
+        response = HttpResponse(profile.collapsed_stacks, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="profile-{profile.id}.folded"'
+        return response
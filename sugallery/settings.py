@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'galleryapp.middleware.PerformanceMiddleware',  # 放在最前面，计入其他中间件的耗时
+    'galleryapp.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -161,6 +163,29 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'  # 用于访问媒体文件的 URL 路径
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # 静态文件存储的根目录
 
+# 文件存储：默认按哈希子目录存放在 MEDIA_ROOT 下，已有文件可用 migrate_media_storage 命令迁移
+STORAGES = {
+    'default': {
+        'BACKEND': 'galleryapp.storage.ShardedFileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+# 使用 S3 兼容对象存储（需要 pip install boto3）：
+# STORAGES['default'] = {
+#     'BACKEND': 'galleryapp.storage.S3Storage',
+#     'OPTIONS': {
+#         'bucket_name': 'sugallery',
+#         'endpoint_url': 'http://127.0.0.1:9000',  # MinIO 等自建服务，AWS S3 不需要
+#         'access_key': '...',
+#         'secret_key': '...',
+#         'base_url': None,  # CDN 或公开读的桶地址；为空时生成带签名的临时 URL
+#         'max_pool_connections': 50,
+#         'multipart_threshold': 8 * 1024 * 1024,
+#     },
+# }
+
 DEFAULT_AVATAR_URL = '/media/default/avatar.png'
 
 # Default primary key field type
@@ -170,9 +195,116 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # 自定义的用户模型
 AUTH_USER_MODEL = 'users.CustomUser'
 
+# 图形验证码配置
+CAPTCHA_RENDERER = 'pillow'  # pillow 或 numpy（更难识别，速度不低于 pillow）
+CAPTCHA_DIFFICULTY = 'medium'  # numpy 渲染器的难度: easy、medium、hard
+CAPTCHA_FONTS = ['arial.ttf', 'DejaVuSans-Bold.ttf']  # 按顺序尝试，都不可用时使用 Pillow 内置字体
+CAPTCHA_TIMEOUT = 300  # 验证码有效期（秒）
+CAPTCHA_POOL_SIZE = 200  # 每个进程预渲染的验证码数量，为 0 时每次请求现场渲染
+CAPTCHA_POOL_REFILL_AT = 100  # 剩余数量降到该值时后台补充
+CAPTCHA_POOL_PROCESSES = 0  # 大于 0 时使用多个进程渲染，否则在后台线程中渲染
+CAPTCHA_IMAGE_FORMATS = ['png']  # CaptchaView 可直接返回的图片格式（?format=png），预渲染时每种格式都会编码，需要时再加 'webp'
+CAPTCHA_QUANTIZE_COLORS = 0  # 大于 0 时把 RGB 验证码量化为该数量颜色的调色板图像，减小体积
+CAPTCHA_COOKIE_NAME = 'captcha_key'  # 图片响应同时把验证码 key 写入该 Cookie，供 <img> 直接引用的页面登录时使用
+# 该 Cookie 默认 SameSite=Lax，跨域的登录 POST 不会携带；前端跨域且 CORS_ALLOW_CREDENTIALS = True 时
+# 改为 SameSite=None; Secure（需要 HTTPS），否则跨域前端应从 X-Captcha-Key 读取 key 并随登录请求提交
+CORS_EXPOSE_HEADERS = ['X-Captcha-Key']  # 跨域的前端需要读取图片响应中的验证码 key
+
 # 验证码相关配置
 VERIFICATION_CODE_EXPIRE_MINUTES = 10
 VERIFICATION_CODE_RESEND_INTERVAL = 60  # 秒
+EMAIL_OUTBOX_EAGER = False  # 为 True 时在请求的事务提交后同步发送邮件，无需启动 run_email_worker
+
+# 图片处理相关配置
+IMAGE_RENDITION_FORMAT = 'WEBP'  # 缩略图/预览图格式：WEBP 或 JPEG
+IMAGE_RENDITION_QUALITY = 80
+IMAGE_JOBS_EAGER = False  # 为 True 时在上传请求内同步执行后台任务，无需启动 run_image_worker
+
+# 批量删除的图片标记删除后保留的秒数，之后由 reap_deleted_images 清理记录和文件
+DELETED_IMAGE_GRACE_SECONDS = 0
+# sweep_orphan_media 只清理修改时间早于该秒数的孤立文件，避免误删正在上传或尚未提交的文件
+ORPHAN_MEDIA_GRACE_SECONDS = 24 * 3600
+
+# 分享链接缓存配置
+SHARE_CACHE_TIMEOUT = 300  # 分享内容缓存时间（秒），编辑或删除时会主动清除
+SHARE_CACHE_MISSING_TIMEOUT = 30  # 不存在的分享码的缓存时间（秒）
+# 分享缓存必须是所有进程共享的缓存（如 Redis），否则作废、删除的分享链接在其他 worker 中仍然有效。
+# 默认的 CACHES 是进程内缓存（LocMem），此时分享内容不缓存、每次查库；需要缓存时在 local_settings.py 中
+# 配置共享的缓存并把 SHARE_CACHE_ALIAS 指向它（见 local_settings.py.example），
+# 或者在单进程部署（如 runserver）中设置 SHARE_CACHE_ALLOW_LOCAL = True
+SHARE_CACHE_ALIAS = 'default'
+SHARE_CACHE_ALLOW_LOCAL = False
+
+# 分片断点续传配置
+CHUNKED_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 单个分片最大 8MB
+CHUNKED_UPLOAD_MAX_SIZE = 200 * 1024 * 1024  # 单个文件最大 200MB
+
+# 直传上传配置：本地存储时客户端把文件 PUT 到 run_upload_receiver 服务，S3 存储时直接上传到桶
+PRESIGNED_UPLOAD_URL = 'http://127.0.0.1:8001/upload/'  # run_upload_receiver 对外的地址
+PRESIGNED_UPLOAD_EXPIRE_SECONDS = 15 * 60  # 签名 URL 有效期
+PRESIGNED_UPLOAD_MAX_SIZE = 200 * 1024 * 1024
+
+# 媒体文件访问配置
+MEDIA_REQUIRE_AUTH = False  # 为 True 时图片文件只允许所有者或携带有效分享码（?share=）访问
+MEDIA_CACHE_MAX_AGE = 30 * 24 * 3600  # 媒体文件的 Cache-Control max-age（秒）
+# 由前端代理发送文件，二选一：
+# nginx: location /protected-media/ { internal; alias /path/to/media/; }，再设置为 '/protected-media/'
+MEDIA_ACCEL_REDIRECT_PREFIX = None
+# Apache mod_xsendfile: 'X-Sendfile'；lighttpd: 'X-LIGHTTPD-send-file'
+MEDIA_SENDFILE_HEADER = None
+
+# 缓存：Instrumented* 后端会统计每个请求的缓存命中/未命中，
+# 使用 Redis 时改为 'galleryapp.cache.InstrumentedRedisCache' 并设置 LOCATION
+CACHES = {
+    'default': {
+        'BACKEND': 'galleryapp.cache.InstrumentedLocMemCache',
+    },
+}
+
+# 性能指标配置
+METRICS_SERVER_TIMING = True  # 在响应中添加 Server-Timing 头（耗时、SQL 数量、缓存命中）
+METRICS_SLOW_REQUEST_MS = 500  # 超过该耗时的请求日志级别为 WARNING，其他请求为 DEBUG
+# 抓取 /metrics 需要携带 Authorization: Bearer <METRICS_TOKEN>；未设置时接口不可用。
+# 应用通常在反向代理之后，REMOTE_ADDR 总是代理地址，不能按来源地址限制访问
+METRICS_TOKEN = None
+
+# 按需剖析配置：管理员通过 /api/profiling/token/ 获取令牌，请求带上 X-Profile-Token 头即被剖析
+PROFILING_ENABLED = True
+PROFILING_TOKEN_MAX_AGE = 3600  # 令牌有效期（秒）
+PROFILING_DEFAULT_MODE = 'sample'  # sample（采样，开销小）或 cprofile（确定性，可下载 pstats）
+PROFILING_SAMPLE_INTERVAL = 0.005  # 采样间隔（秒）
+PROFILING_MAX_PROFILES = 100  # 每个管理员在一个令牌有效期内最多剖析的请求数
+PROFILING_RETENTION_DAYS = 7  # purge_request_profiles 删除早于该天数的剖析记录
+# ?_profile= 参数会出现在反向代理的访问日志中，尽量使用 X-Profile-Token 头
+
+# 日志：galleryapp.requests 每个请求输出一行 JSON（DEBUG 级别，慢请求为 WARNING），
+# 需要完整的请求日志时为 'galleryapp.requests' 单独配置 DEBUG 级别
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '{asctime} {levelname} {name} {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'galleryapp': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'users': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
 
 # 导入本地设置
 try:
@@ -15,12 +15,15 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from galleryapp.views import MediaFileView, MetricsView
 
 urlpatterns = [
-                  path('admin/', admin.site.urls),
-                  path('api/', include('galleryapp.urls')),
-                  path('api/users/', include('users.urls')),
-              ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('admin/', admin.site.urls),
+    path('api/', include('galleryapp.urls')),
+    path('api/users/', include('users.urls')),
+    path('metrics', MetricsView.as_view(), name='metrics'),  # Prometheus 抓取地址
+    # 媒体文件经过权限校验后由代理或 Python 发送，生产环境同样可用
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), MediaFileView.as_view(), name='media-file'),
+]
@@ -0,0 +1,42 @@
+import time
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from users.outbox import claim_emails, requeue_stale_emails, send_emails
+
+
+class Command(BaseCommand):
+    help = '运行邮件发送 worker，从发件箱领取邮件，通过一个持久的 SMTP 连接批量发送，失败时按指数退避重试'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='每次领取的邮件数量')
+        parser.add_argument('--sleep', type=float, default=1.0, help='发件箱为空时的轮询间隔（秒）')
+        parser.add_argument('--stale-after', type=int, default=300,
+                            help='sending 状态超过该秒数的邮件视为 worker 异常退出，重新入队')
+        parser.add_argument('--once', action='store_true', help='发送完当前待发送的邮件后退出')
+
+    def handle(self, *args, **options):
+        self.stdout.write('邮件 worker 已启动')
+        connection = get_connection(fail_silently=False)
+        sent = failed = 0
+        try:
+            while True:
+                close_old_connections()  # 长时间运行时避免使用已断开的数据库连接
+                requeue_stale_emails(options['stale_after'])
+                emails = claim_emails(options['batch_size'])
+                if emails:
+                    batch_sent, batch_failed = send_emails(emails, connection)
+                    sent, failed = sent + batch_sent, failed + batch_failed
+                    self.stdout.write(f'已发送 {sent} 封，失败 {failed} 次')
+                    continue
+
+                # 空闲时关闭 SMTP 连接，避免被服务器超时断开，有新邮件时再连接
+                connection.close()
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+        self.stdout.write('邮件 worker 已停止')
@@ -36,3 +36,28 @@ class EmailVerification(models.Model):
     @property
     def is_expired(self):
         return timezone.now() > self.expires_at
+
+
+class OutboundEmail(models.Model):
+    """待发送的邮件（发件箱），请求中只写入数据库，由 run_email_worker 通过一个 SMTP 连接批量发送"""
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True, default='')  # 为空时使用 DEFAULT_FROM_EMAIL
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=16, choices=[('pending', 'Pending'), ('sending', 'Sending'),
+                                                      ('sent', 'Sent'), ('failed', 'Failed')],
+                              default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)  # 已尝试次数
+    last_error = models.TextField(blank=True, default='')
+    run_after = models.DateTimeField(default=timezone.now)  # 重试时延后发送
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='outboundemail_status_run_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
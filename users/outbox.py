@@ -0,0 +1,96 @@
+import logging
+import smtplib
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5  # 最大尝试次数
+RETRY_DELAY_SECONDS = 10  # 首次重试延迟，之后按指数退避（10、20、40、80 秒，在验证码有效期内）
+
+# 收件人被拒绝之类的永久错误，重试也不会成功
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)
+
+
+def enqueue_email(subject, body, recipients, from_email=''):
+    """写入发件箱，由 run_email_worker 发送。在事务中调用时随事务一起提交"""
+    email = OutboundEmail.objects.create(subject=subject, body=body, recipients=list(recipients),
+                                         from_email=from_email)
+    # 开发环境可以配置为在事务提交后同步发送，无需启动 worker
+    if getattr(settings, 'EMAIL_OUTBOX_EAGER', False):
+        transaction.on_commit(lambda: send_emails(claim_emails(ids=[email.id])))
+    return email
+
+
+def claim_emails(limit=None, ids=None):
+    """领取一批待发送的邮件，多个 worker 并发时通过 SKIP LOCKED 避免重复发送"""
+    with transaction.atomic():
+        emails = OutboundEmail.objects.select_for_update(skip_locked=True).filter(status='pending')
+        if ids is not None:
+            emails = emails.filter(id__in=ids)
+        else:
+            emails = emails.filter(run_after__lte=timezone.now())
+        claimed = list(emails.order_by('id').values_list('id', flat=True)[:limit])
+        if not claimed:
+            return []
+        OutboundEmail.objects.filter(id__in=claimed).update(status='sending', updated_at=timezone.now())
+    return list(OutboundEmail.objects.filter(id__in=claimed).order_by('id'))
+
+
+def send_emails(emails, connection=None):
+    """
+    通过同一个连接逐封发送，返回 (成功数, 失败数)。
+    每封邮件单独记录结果：失败的按指数退避重试，连接断开时下一封邮件会重新建立连接。
+    传入 connection 时发送后保持连接供下一批使用，否则发送完这一批后关闭。
+    """
+    own_connection = connection is None
+    if own_connection:
+        connection = get_connection(fail_silently=False)
+    sent_ids, failed = [], 0
+    try:
+        for email in emails:
+            message = EmailMessage(email.subject, email.body, email.from_email or settings.DEFAULT_FROM_EMAIL,
+                                   email.recipients, connection=connection)
+            try:
+                # 连接已打开时 open() 什么也不做；由这里打开的连接 send() 不会在发送后关闭
+                connection.open()
+                message.send()
+            except Exception as e:
+                failed += 1
+                record_failure(email, e)
+                # 连接可能已不可用，关闭后下一封邮件重新连接
+                connection.close()
+            else:
+                sent_ids.append(email.id)
+    finally:
+        if own_connection:
+            connection.close()
+
+    if sent_ids:
+        now = timezone.now()
+        OutboundEmail.objects.filter(id__in=sent_ids).update(status='sent', attempts=F('attempts') + 1,
+                                                             last_error='', sent_at=now, updated_at=now)
+    return len(sent_ids), failed
+
+
+def record_failure(email, error):
+    email.attempts += 1
+    email.last_error = str(error)
+    logger.error(f"邮件发送失败: {email}, {error}")
+    if email.attempts < MAX_ATTEMPTS and not isinstance(error, PERMANENT_ERRORS):
+        email.status = 'pending'
+        email.run_after = timezone.now() + timedelta(seconds=RETRY_DELAY_SECONDS * 2 ** (email.attempts - 1))
+    else:
+        email.status = 'failed'
+    email.save(update_fields=['status', 'attempts', 'last_error', 'run_after', 'updated_at'])
+
+
+def requeue_stale_emails(stale_after):
+    """将长时间处于 sending 的邮件（worker 异常退出）重新放回队列，可能导致极少数邮件重复发送"""
+    deadline = timezone.now() - timedelta(seconds=stale_after)
+    return OutboundEmail.objects.filter(status='sending', updated_at__lt=deadline).update(status='pending')
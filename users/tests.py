@@ -1,3 +1,113 @@
-from django.test import TestCase
+import io
+import smtplib
+from datetime import timedelta
+from unittest import mock
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .models import EmailVerification, OutboundEmail
+from .outbox import enqueue_email
 
-# Create your tests here.
+
+class FlakyEmailBackend(LocmemEmailBackend):
+    """测试用邮件后端：记录创建的连接数，按收件人模拟发送失败"""
+    connections = 0
+    failures = {}  # 收件人 -> 依次抛出的异常
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        FlakyEmailBackend.connections += 1
+
+    def send_messages(self, messages):
+        for message in messages:
+            errors = self.failures.get(message.to[0])
+            if errors:
+                raise errors.pop(0)
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='users.tests.FlakyEmailBackend')
+class EmailOutboxTests(TestCase):
+    """验证码邮件写入发件箱，由 run_email_worker 通过一个连接发送并重试"""
+
+    def setUp(self):
+        FlakyEmailBackend.connections = 0
+        FlakyEmailBackend.failures = {}
+
+    def run_worker(self):
+        call_command('run_email_worker', once=True, stdout=io.StringIO())
+
+    def test_send_code_only_enqueues(self):
+        client = APIClient()
+        response = client.post('/api/users/send-verification-code/', {'email': 'new@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        verification = EmailVerification.objects.get(email='new@example.com')
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.recipients), ('pending', ['new@example.com']))
+        self.assertIn(verification.code, email.body)
+
+        # 发送频率限制，过了间隔后可以重新发送新的验证码
+        response = client.post('/api/users/send-verification-code/', {'email': 'new@example.com'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        EmailVerification.objects.update(created_at=timezone.now() - timedelta(minutes=2))
+        response = client.post('/api/users/send-verification-code/', {'email': 'new@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        verification.refresh_from_db()
+        self.assertIn(verification.code, OutboundEmail.objects.latest('id').body)
+
+        self.run_worker()
+        self.assertEqual([message.to for message in mail.outbox], [['new@example.com']] * 2)
+        self.assertEqual(OutboundEmail.objects.filter(status='sent').count(), 2)
+
+    def test_worker_retries_with_backoff_over_one_connection(self):
+        FlakyEmailBackend.failures = {
+            'b@example.com': [smtplib.SMTPServerDisconnected('连接断开')],
+            'c@example.com': [smtplib.SMTPRecipientsRefused({'c@example.com': (550, b'no such user')})],
+        }
+        emails = [enqueue_email('主题', '正文', [f'{name}@example.com']) for name in 'abcd']
+        with self.assertLogs('users.outbox', 'ERROR'):
+            self.run_worker()
+        self.assertEqual(FlakyEmailBackend.connections, 1)
+        self.assertEqual([message.to[0] for message in mail.outbox], ['a@example.com', 'd@example.com'])
+        statuses = {email.recipients[0]: email for email in OutboundEmail.objects.all()}
+        self.assertEqual(statuses['a@example.com'].status, 'sent')
+        self.assertEqual(statuses['c@example.com'].status, 'failed')  # 永久错误不重试
+        retry = statuses['b@example.com']
+        self.assertEqual((retry.status, retry.attempts), ('pending', 1))
+        self.assertGreater(retry.run_after, timezone.now())
+
+        # 退避时间未到不会发送
+        self.run_worker()
+        self.assertEqual(len(mail.outbox), 2)
+        OutboundEmail.objects.filter(id=emails[1].id).update(run_after=timezone.now())
+        self.run_worker()
+        retry.refresh_from_db()
+        self.assertEqual((retry.status, retry.attempts), ('sent', 2))
+        self.assertEqual(mail.outbox[-1].to, ['b@example.com'])
+
+    @override_settings(EMAIL_OUTBOX_EAGER=True)
+    def test_eager_outbox(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post('/api/users/send-verification-code/', {'email': 'eager@example.com'},
+                                        format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox[0].to, ['eager@example.com'])
+        self.assertEqual(OutboundEmail.objects.get().status, 'sent')
+
+    def test_concurrent_first_request_is_rate_limited(self):
+        # 记录不存在时无法加锁，并发的第一次请求由唯一约束挡住，只发送一封邮件
+        original_create = EmailVerification.objects.create
+
+        def create_after_other_request(**kwargs):
+            original_create(**{**kwargs, 'code': '000000'})
+            return original_create(**kwargs)
+
+        with mock.patch.object(EmailVerification.objects, 'create', side_effect=create_after_other_request):
+            response = APIClient().post('/api/users/send-verification-code/', {'email': 'race@example.com'},
+                                        format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(OutboundEmail.objects.exists())
@@ -7,20 +7,22 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from django.conf import settings
 from django.core.cache import cache  # 导入 cache
 from django.core.mail import send_mail
 from django.core.exceptions import ImproperlyConfigured
 from django.contrib.auth import get_user_model
 from rest_framework.exceptions import ValidationError
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from datetime import timedelta
 from django.utils import timezone
-from galleryapp.tools.captcha import CaptchaUtil
-from galleryapp.tools.utils import generate_verification_code, send_verification_email
+from galleryapp.tools.captcha import IMAGE_FORMATS, CaptchaUtil, get_captcha
+from galleryapp.tools.utils import generate_verification_code, queue_verification_email
 from .serializers import RegisterSerializer, EmailVerificationSerializer, VerifyEmailSerializer
 from .models import EmailVerification
 import uuid
+import base64
 import logging
 import random
 
@@ -28,7 +30,7 @@ logger = logging.getLogger(__name__)
 
 
 class SendVerificationCodeView(APIView):
-    """发送邮箱验证码"""
+    """发送邮箱验证码：验证码和待发送邮件在同一个事务中保存，由 run_email_worker 异步发送"""
 
     permission_classes = [AllowAny]
 
@@ -46,88 +48,50 @@ class SendVerificationCodeView(APIView):
                 )
 
             try:
-                # 先检查是否存在验证码记录
-                try:
-
-                    verification = EmailVerification.objects.get(email=email)
-
-                    # 检查发送频率
-
-                    time_diff = timezone.now() - verification.created_at
-
-                    if time_diff.seconds < settings.VERIFICATION_CODE_RESEND_INTERVAL:
-                        return Response(
-
-                            {
-                                "error": f"请等待 {settings.VERIFICATION_CODE_RESEND_INTERVAL - time_diff.seconds} 秒后再试"},
-
-                            status=status.HTTP_400_BAD_REQUEST
-
-                        )
-
-                except EmailVerification.DoesNotExist:
-
-                    verification = None
+                # 生成新验证码
+                code = generate_verification_code()
+                logger.info(f"Generated verification code for {email}")
+                expires_at = timezone.now() + timedelta(minutes=settings.VERIFICATION_CODE_EXPIRE_MINUTES)
 
-                    # 生成新验证码
-
-                    code = generate_verification_code()
-                    logger.info(f"Generated verification code for {email}")
-
-                    # 发送邮件
-
-                    if not send_verification_email(email, code):
-                        logger.error(f"Failed to send verification email to {email}")
-                        return Response(
-
-                            {"error": "发送验证码失败，请稍后重试"},
-
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-
-                        )
-
-                    logger.info(f"Successfully sent verification email to {email}")
-                    # 邮件发送成功后再保存验证码
+                # 保存验证码并写入发件箱，不在请求中等待 SMTP
+                with transaction.atomic():
+                    # 锁定验证码记录，并发请求依次检查发送频率，不会同时通过检查各发一封邮件
+                    verification = EmailVerification.objects.select_for_update().filter(email=email).first()
 
                     if verification:
+                        # 检查发送频率
+                        time_diff = int((timezone.now() - verification.created_at).total_seconds())
 
-                        verification.code = code
+                        if time_diff < settings.VERIFICATION_CODE_RESEND_INTERVAL:
+                            return self.too_frequent(settings.VERIFICATION_CODE_RESEND_INTERVAL - time_diff)
 
+                        verification.code = code
                         verification.is_verified = False
-
-                        verification.expires_at = timezone.now() + timedelta(
-
-                            minutes=settings.VERIFICATION_CODE_EXPIRE_MINUTES
-
-                        )
-
+                        verification.created_at = timezone.now()  # 重新计算发送频率
+                        verification.expires_at = expires_at
                         verification.save()
-
                     else:
-
-                        EmailVerification.objects.create(
-
-                            email=email,
-
-                            code=code,
-
-                            is_verified=False,
-
-                            expires_at=timezone.now() + timedelta(
-
-                                minutes=settings.VERIFICATION_CODE_EXPIRE_MINUTES
-
-                            )
-
-                        )
-
+                        try:
+                            with transaction.atomic():
+                                EmailVerification.objects.create(
+                                    email=email,
+                                    code=code,
+                                    is_verified=False,
+                                    expires_at=expires_at
+                                )
+                        except IntegrityError:
+                            # 记录不存在时没有行可以锁定，并发请求刚刚创建了记录
+                            return self.too_frequent(settings.VERIFICATION_CODE_RESEND_INTERVAL)
+                    queue_verification_email(email, code)
+
+                logger.info(f"Queued verification email to {email}")
                 return Response(
                     {"message": "验证码已发送到您的邮箱"},
                     status=status.HTTP_200_OK
                 )
 
             except Exception as e:
-                print(f"Error sending verification code: {str(e)}")
+                logger.exception(f"Error sending verification code: {str(e)}")
                 return Response(
                     {"error": "发送验证码失败，请稍后重试"},
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -135,6 +99,12 @@ class SendVerificationCodeView(APIView):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def too_frequent(self, seconds):
+        return Response(
+            {"error": f"请等待 {seconds} 秒后再试"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
 
 class RegisterView(APIView):
     """用户注册"""
@@ -183,7 +153,7 @@ class RegisterView(APIView):
 
         except Exception as e:
 
-            print(f"Registration error: {str(e)}")
+            logger.exception(f"Registration error: {str(e)}")
 
             return Response(
                 {"error": "注册失败，请稍后重试"},
@@ -203,7 +173,8 @@ class CustomTokenObtainPairView(TokenObtainPairView):
         #     # 跳过验证码验证
         #     return super().post(request, *args, **kwargs)
 
-        captcha_key = request.data.get('captcha_key')
+        # 图片形式的验证码没有在 JSON 中返回 key 时，从 Cookie 中读取
+        captcha_key = request.data.get('captcha_key') or request.COOKIES.get(settings.CAPTCHA_COOKIE_NAME)
         captcha_value = request.data.get('captcha')
 
         if not captcha_key or not captcha_value:
@@ -223,6 +194,8 @@ class CustomTokenObtainPairView(TokenObtainPairView):
 
         # 调用父类的方法执行登录逻辑
         response = super().post(request, *args, **kwargs)
+        if settings.CAPTCHA_COOKIE_NAME in request.COOKIES:
+            response.delete_cookie(settings.CAPTCHA_COOKIE_NAME, samesite=captcha_cookie_samesite())
 
         # 可选择在这里进一步处理返回的 JWT token 信息
         return response
@@ -251,24 +224,58 @@ class LogoutView(APIView):
             return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class CaptchaImageRenderer(BaseRenderer):
+    """直接输出验证码图片字节；错误响应没有图片，输出空内容"""
+    charset = None
+    render_style = 'binary'
+
+    def __init__(self, image_format):
+        self.format = image_format
+        self.media_type = IMAGE_FORMATS[image_format][1]
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data if isinstance(data, bytes) else b''
+
+
+def captcha_cookie_samesite():
+    """跨域携带凭据时 Lax 的 Cookie 不会随登录 POST 发送，只能用 SameSite=None（浏览器要求同时设置 Secure）"""
+    return 'None' if getattr(settings, 'CORS_ALLOW_CREDENTIALS', False) else 'Lax'
+
+
 class CaptchaView(APIView):
+    """
+    默认返回 JSON（验证码 key 和 base64 data URI）。
+    ?format=png / ?format=webp 或 Accept: image/png、image/webp 时直接返回图片，
+    验证码 key 放在 X-Captcha-Key 响应头和 Cookie 中，省去 base64 的体积和两端的编解码。
+    """
     permission_classes = [AllowAny]  # 允许匿名用户访问
 
+    def get_renderers(self):
+        return [JSONRenderer()] + [CaptchaImageRenderer(image_format)
+                                   for image_format in settings.CAPTCHA_IMAGE_FORMATS]
+
     def get(self, request, *args, **kwargs):
-        captcha_util = CaptchaUtil()
-        code, img_str = captcha_util.generate_captcha()
+        # 从预渲染池中取出（图片已编码好），请求内只做缓存写入
+        code, images = get_captcha()
         captcha_key = str(uuid.uuid4())
 
-        # 日志记录生成的验证码
-        logger.debug(f"Generated captcha: {code}")
+        cache.set(captcha_key, code, timeout=settings.CAPTCHA_TIMEOUT)
+        logger.debug(f"Captcha stored in cache: {captcha_key}")
 
-        cache.set(captcha_key, code, timeout=300)
-        logger.debug(f"Captcha stored in cache: {captcha_key} -> {code}")
+        image_format = request.accepted_renderer.format
+        if image_format in IMAGE_FORMATS:
+            response = Response(images[image_format], status=status.HTTP_200_OK,
+                                headers={'X-Captcha-Key': captcha_key, 'Cache-Control': 'no-store'})
+            # 用 <img src> 直接引用时前端读不到响应头，登录时从 Cookie 取 key
+            samesite = captcha_cookie_samesite()
+            response.set_cookie(settings.CAPTCHA_COOKIE_NAME, captcha_key, max_age=settings.CAPTCHA_TIMEOUT,
+                                httponly=True, samesite=samesite, secure=samesite == 'None')
+            return response
 
         return Response({
             'captcha_key': captcha_key,
-            'captcha_image': f'data:image/png;base64,{img_str}'
-        }, status=status.HTTP_200_OK)
+            'captcha_image': f'data:image/png;base64,{base64.b64encode(images["png"]).decode()}'
+        }, status=status.HTTP_200_OK, headers={'Cache-Control': 'no-store'})
 
 
 class UserProfileView(APIView):